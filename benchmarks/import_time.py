@@ -0,0 +1,45 @@
+####
+# Copyright 2023 burrizza
+######
+"""
+Measure the cold import time of the package and of the single APIs, every run uses a fresh interpreter.
+Usage: python benchmarks/import_time.py [repetitions]
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATEMENTS = [
+    'import catalogary',
+    'from catalogary import NinaAPI',
+    'from catalogary import UmweltbundesamtAPI',
+    "from catalogary import NinaAPI; NinaAPI('https://nina.api.proxy.bund.dev/')",
+]
+PROBE = """
+import sys, time
+modules = len(sys.modules)
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start, len(sys.modules) - modules, 'requests' in sys.modules)
+"""
+
+
+def import_time(statement):
+    """
+    Returns: Tuple with the seconds needed by the statement, the number of newly imported modules and whether
+    requests got imported.
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.run([sys.executable, '-c', PROBE.format(statement=statement)], env=env, capture_output=True,
+                          text=True, check=True)
+    seconds, modules, requests = proc.stdout.split()
+    return float(seconds), int(modules), requests == 'True'
+
+
+if __name__ == '__main__':
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for statement in STATEMENTS:
+        runs = sorted(import_time(statement) for _ in range(repetitions))
+        seconds, modules, requests = runs[len(runs) // 2]
+        print(f'{seconds * 1000:8.1f} ms {modules:5d} modules  requests={requests!s:5}  {statement}')
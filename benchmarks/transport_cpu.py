@@ -0,0 +1,63 @@
+####
+# Copyright 2023 burrizza
+######
+"""
+Measure the client side CPU cost per request of every transport of FedRepRestAPI against a local HTTP/1.1 server
+(running in a separate process) with a small warning detail sized JSON payload.
+Usage: python benchmarks/transport_cpu.py [requests]
+"""
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from catalogary.api import NinaAPI  # noqa: E402
+
+SERVER = """
+import json, sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+BODY = json.dumps({'identifier': 'dwd.1', 'sender': 'DWD', 'status': 'Actual', 'msgType': 'Alert',
+                   'info': [{'headline': 'x' * 512, 'area': [{'geocode': [{'value': '091620000000'}]}]}]}).encode()
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1  # one write per response instead of separate packets for headers and body
+    def log_message(self, *args):
+        pass
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+        self.wfile.flush()
+server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+print(server.server_address[1], flush=True)
+server.serve_forever()
+"""
+
+
+def bench(url, transport, count):
+    nina = NinaAPI(url, transport=transport)
+    for _ in range(20):
+        nina.warning_detail(key='dwd.1')
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(count):
+        nina.warning_detail(key='dwd.1')
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    nina.close()
+    return cpu / count, wall / count
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    server = subprocess.Popen([sys.executable, '-c', SERVER], stdout=subprocess.PIPE, text=True)
+    try:
+        url = f'http://127.0.0.1:{server.stdout.readline().strip()}/'
+        for transport in ('requests', 'urllib3'):
+            cpu, wall = bench(url, transport, count)
+            print(f'{transport:10s} {cpu * 1e6:8.1f} us CPU/request {wall * 1e6:8.1f} us wall/request')
+    finally:
+        server.terminate()
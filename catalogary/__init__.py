@@ -1,2 +1,16 @@
-from .api import NinaAPI
-from .api import UmweltbundesamtAPI
+import importlib
+
+# the APIs are imported lazily on first access (PEP 562) to keep the start of short-lived scripts fast
+__all__ = ['NinaAPI', 'UmweltbundesamtAPI']
+
+
+def __getattr__(name):
+    if name == 'api':
+        return importlib.import_module('.api', __name__)
+    if name in __all__:
+        return getattr(importlib.import_module('.api', __name__), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | {'api'})
@@ -1,2 +1,64 @@
-from .fedrep_nina import NinaAPI
-from .fedrep_umweltbundesamt import UmweltbundesamtAPI
+import importlib
+
+# public name -> submodule, the submodules (and their dependencies) are imported lazily on first access (PEP 562)
+_LAZY = {
+    'NinaAPI': 'fedrep_nina',
+    'UmweltbundesamtAPI': 'fedrep_umweltbundesamt',
+    'SnapshotRefresher': 'refresher',
+    'NinaRefresher': 'refresher',
+    'NinaWarning': 'records',
+    'WarningArea': 'records',
+    'WarningDetail': 'records',
+    'WarningInfo': 'records',
+    'StationMeasurement': 'records',
+    'ArsIndex': 'ars_index',
+    'ARS_LEVELS': 'ars_index',
+    'normalize_ars': 'ars_index',
+    'RecordSink': 'sinks',
+    'NdjsonSink': 'sinks',
+    'CsvSink': 'sinks',
+    'UmweltbundesamtBackfill': 'backfill',
+    'BackfillTask': 'backfill',
+    'plan_tasks': 'backfill',
+    'MeasuresFrame': 'uba_frame',
+    'TimestampParser': 'uba_frame',
+    'normalize_measures': 'uba_frame',
+    'derive_scopes': 'uba_scopes',
+    'MeasuresCube': 'uba_cube',
+    'LatestValueIndex': 'uba_latest',
+    'LatestValue': 'uba_latest',
+    'SharedMeasures': 'uba_shared',
+    'Transport': 'transport',
+    'RequestsTransport': 'transport',
+    'Urllib3Transport': 'transport',
+    'PriorityScheduler': 'scheduler',
+    'PRIORITIES': 'scheduler',
+    'SharedCache': 'shared_cache',
+    'AdaptiveLimiter': 'limiter',
+    'HedgePolicy': 'hedging',
+    'WarningArchive': 'archive',
+    'LazyWarning': 'lazy_warnings',
+    'LazyWarnings': 'lazy_warnings',
+    'Deadline': 'deadline',
+    'DeadlineExceeded': 'deadline',
+    'PartialList': 'deadline',
+    'PartialDict': 'deadline',
+    'PartialCount': 'deadline',
+    'FanoutGateway': 'gateway',
+    'Pipeline': 'pipeline',
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,398 @@
+####
+# Copyright 2023 burrizza
+######
+import hashlib
+import json
+import logging
+import lzma
+import math
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from difflib import SequenceMatcher
+
+from .ars_index import ARS_LEVELS, ArsIndex, normalize_ars
+from .records import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# open end of a validity interval (the interval index stores 32 bit integers)
+_OPEN_END = 2 ** 31 - 1
+_LENGTHS = tuple(sorted(ARS_LEVELS.values()))
+_PARTS = ('warning', 'warning_detail', 'warning_geo')
+
+
+def _timestamp(value):
+    """Unix timestamp of a float, datetime or timestamp string."""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return parse_timestamp(value)
+    return value
+
+
+def _canonical(value):
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def _diff(old, new):
+    """
+    Returns: JSON patch turning old into new, None if they are equal. A patch replaces a value ({'v': new}), edits
+    the keys of an object ({'d': {key: patch}, 'r': [removed keys]}), the items of an array of the same length
+    ({'l': {index: patch}}) or replaces slices of an array of another length ({'x': [[start, stop, items], ...]}).
+    """
+    if type(old) is type(new) and old == new:
+        return None
+    if isinstance(old, dict) and isinstance(new, dict):
+        changed = dict()
+        for key, value in new.items():
+            if key not in old:
+                changed[key] = {'v': value}
+            else:
+                patch = _diff(old[key], value)
+                if patch is not None:
+                    changed[key] = patch
+        return {'d': changed, 'r': [key for key in old if key not in new]}
+    if isinstance(old, list) and isinstance(new, list):
+        if len(old) == len(new):
+            return {'l': {str(index): patch for index, patch in
+                          ((index, _diff(item, new[index])) for index, item in enumerate(old)) if patch is not None}}
+        start = 0
+        while start < min(len(old), len(new)) and old[start] == new[start]:
+            start += 1
+        end = 0
+        while end < min(len(old), len(new)) - start and old[-1 - end] == new[-1 - end]:
+            end += 1
+        # match the items between the common start and end (e.g. an inserted and a changed coordinate)
+        matcher = SequenceMatcher(None, [_canonical(item) for item in old[start:len(old) - end]],
+                                  [_canonical(item) for item in new[start:len(new) - end]], autojunk=False)
+        return {'x': [[start + i1, start + i2, new[start + j1:start + j2]]
+                      for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']}
+    return {'v': new}
+
+
+def _patch(old, patch):
+    """
+    Returns: The value of the patch (see _diff) applied to old.
+    """
+    if patch is None:
+        return old
+    if 'v' in patch:
+        return patch['v']
+    if 'd' in patch:
+        new = {key: value for key, value in old.items() if key not in patch['r']}
+        for key, value_patch in patch['d'].items():
+            new[key] = _patch(old.get(key), value_patch)
+        return new
+    if 'l' in patch:
+        new = list(old)
+        for index, item_patch in patch['l'].items():
+            new[int(index)] = _patch(new[int(index)], item_patch)
+        return new
+    new = list(old)
+    # from the end, so the positions of the remaining slices stay valid
+    for start, stop, items in reversed(patch['x']):
+        new[start:stop] = items
+    return new
+
+
+class WarningArchive(object):
+    """
+    Historical archive of NINA warnings stored in a local SQLite database.
+    Only new versions of a warning are stored. The warning, its detail and its geojson are stored as separate
+    content addressed blobs, so unchanged parts are shared between versions and changed ones are stored as a JSON
+    patch against the same part of the previous version (only the changed values, zlib compressed), with a full
+    keyframe every keyframe_interval versions. The validity intervals (startDate until expiresDate, a newer
+    version or the disappearance from the feed) are kept in an R-tree and the regions in an index of the regional
+    keys (ARS), so point in time and interval queries only decode the matching versions.
+    """
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, base TEXT, depth INTEGER, codec TEXT, data BLOB)',
+        'CREATE TABLE IF NOT EXISTS versions (rowid INTEGER PRIMARY KEY, id TEXT, version INTEGER, source TEXT, '
+        'seen REAL, start REAL, expires REAL, until REAL, warning TEXT, warning_detail TEXT, warning_geo TEXT, '
+        'UNIQUE (id, version))',
+        'CREATE INDEX IF NOT EXISTS versions_open ON versions (source, until)',
+        'CREATE TABLE IF NOT EXISTS geocodes (ref INTEGER, ars TEXT, PRIMARY KEY (ref, ars)) WITHOUT ROWID',
+    )
+
+    def __init__(self, path, codec='zlib', keyframe_interval=16, level=9, cache_bytes=16 * 1024 * 1024):
+        """
+        Args:
+            path: Path of the SQLite database file (created if missing).
+            codec: Compression of the keyframes, 'zlib' or 'lzma' (smaller but slower). Deltas always use zlib.
+            keyframe_interval: Maximum length of a delta chain.
+            level: The compression level.
+            cache_bytes: Maximum size of the recently decoded parts kept as bases of the next deltas.
+        """
+        if codec not in ('zlib', 'lzma'):
+            raise ValueError(f'Unknown codec: {codec}')
+        self.path = path
+        self.codec = codec
+        self.keyframe_interval = keyframe_interval
+        self.level = level
+        self.cache_bytes = cache_bytes
+        self._local = threading.local()
+        # hash -> raw content, least recently used first
+        self._decoded = OrderedDict()
+        self._decoded_bytes = 0
+        self._decoded_lock = threading.Lock()
+        connection = self._connection()
+        for statement in self.SCHEMA:
+            connection.execute(statement)
+        try:
+            connection.execute('CREATE VIRTUAL TABLE IF NOT EXISTS intervals USING rtree_i32(rowid, start, until)')
+        except sqlite3.OperationalError:
+            # SQLite without the R-tree module
+            logger.warning('SQLite R-tree module not available, using a plain interval index')
+            connection.execute('CREATE TABLE IF NOT EXISTS intervals (rowid INTEGER PRIMARY KEY, start INTEGER, '
+                               'until INTEGER)')
+            connection.execute('CREATE INDEX IF NOT EXISTS intervals_start ON intervals (start, until)')
+
+    def _connection(self):
+        # one connection per thread and process, connections must not be used after a fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def close(self):
+        """Close the connection of the current thread."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def record(self, entries, source=None, seen=None):
+        """
+        Store the new versions of the given warnings.
+        Args:
+            entries: The completed warnings, e.g. the result of NinaAPI.generic_complete (dicts with the keys
+                'warning', 'warning_detail' and 'warning_geo').
+            source: OPTIONAL: The name of the feed (e.g. 'dwd') the entries are the complete current state of.
+                The warnings of this feed missing in the entries are closed at the time seen.
+            seen: OPTIONAL: Unix timestamp of the observation, now if None.
+
+        Returns: The number of new versions.
+        """
+        seen = time.time() if seen is None else _timestamp(seen)
+        connection = self._connection()
+        added = 0
+        present = set()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            for entry in entries:
+                warning = entry['warning']
+                key = warning['id']
+                version = warning.get('version')
+                present.add(key)
+                if connection.execute('SELECT 1 FROM versions WHERE id = ? AND version = ?',
+                                      (key, version)).fetchone() is not None:
+                    continue
+                self._add_version(connection, entry, key, version, source, seen)
+                added += 1
+            if source is not None:
+                current = connection.execute('SELECT rowid, id FROM versions WHERE source = ? AND until IS NULL',
+                                             (source,)).fetchall()
+                for rowid, key in current:
+                    if key not in present:
+                        self._close(connection, rowid, seen)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return added
+
+    def _add_version(self, connection, entry, key, version, source, seen):
+        warning = entry['warning']
+        previous = connection.execute('SELECT rowid, warning, warning_detail, warning_geo FROM versions WHERE id = ? '
+                                      'ORDER BY version DESC LIMIT 1', (key,)).fetchone()
+        hashes = list()
+        for i, part in enumerate(_PARTS):
+            hashes.append(self._put_blob(connection, entry.get(part), None if previous is None else previous[i + 1]))
+        if previous is not None:
+            # the previous version is superseded
+            self._close(connection, previous[0], seen)
+        start = _timestamp(warning.get('startDate')) or seen
+        if previous is not None:
+            # an update is valid from its publication, the previous version until then
+            start = max(start, seen)
+        expires = _timestamp(warning.get('expiresDate'))
+        cursor = connection.execute(
+            'INSERT INTO versions (id, version, source, seen, start, expires, until, warning, warning_detail, '
+            'warning_geo) VALUES (?, ?, ?, ?, ?, ?, NULL, ?, ?, ?)',
+            (key, version, source, seen, start, expires, *hashes))
+        rowid = cursor.lastrowid
+        connection.execute('INSERT INTO intervals (rowid, start, until) VALUES (?, ?, ?)',
+                           (rowid, math.floor(start), _OPEN_END if expires is None else math.ceil(expires)))
+        detail = entry.get('warning_detail')
+        if detail:
+            connection.executemany('INSERT INTO geocodes (ref, ars) VALUES (?, ?)',
+                                   [(rowid, code) for code in ArsIndex.geocodes(detail)])
+
+    def _close(self, connection, rowid, when):
+        """End the validity of a version at the given time (if it did not expire before)."""
+        row = connection.execute('SELECT start, expires FROM versions WHERE rowid = ?', (rowid,)).fetchone()
+        until = max(row[0], when if row[1] is None else min(row[1], when))
+        connection.execute('UPDATE versions SET until = ? WHERE rowid = ?', (until, rowid))
+        connection.execute('UPDATE intervals SET until = ? WHERE rowid = ?', (math.ceil(until), rowid))
+
+    def _put_blob(self, connection, value, base_hash):
+        """
+        Store a part of a warning and return its hash (None for missing parts).
+        """
+        if value is None:
+            return None
+        raw = _canonical(value)
+        digest = hashlib.sha1(raw).hexdigest()
+        if connection.execute('SELECT 1 FROM blobs WHERE hash = ?', (digest,)).fetchone() is not None:
+            return digest
+        base = None
+        if base_hash is not None:
+            base = connection.execute('SELECT depth FROM blobs WHERE hash = ?', (base_hash,)).fetchone()
+        row = None
+        if base is not None and base[0] + 1 < self.keyframe_interval:
+            base_value = json.loads(self._get_raw(connection, base_hash))
+            patch = _diff(base_value, value)
+            # parts which do not survive the JSON round trip unchanged are stored as keyframe
+            if _canonical(_patch(base_value, patch)) == raw:
+                row = (digest, base_hash, base[0] + 1, 'patch', zlib.compress(_canonical(patch), self.level))
+        if row is None and self.codec == 'lzma':
+            row = (digest, None, 0, 'lzma', lzma.compress(raw, preset=self.level))
+        elif row is None:
+            row = (digest, None, 0, 'zlib', zlib.compress(raw, self.level))
+        connection.execute('INSERT INTO blobs (hash, base, depth, codec, data) VALUES (?, ?, ?, ?, ?)', row)
+        return digest
+
+    def _get_raw(self, connection, digest):
+        with self._decoded_lock:
+            raw = self._decoded.get(digest)
+            if raw is not None:
+                self._decoded.move_to_end(digest)
+                return raw
+        base, codec, data = connection.execute('SELECT base, codec, data FROM blobs WHERE hash = ?',
+                                               (digest,)).fetchone()
+        if codec == 'patch':
+            raw = _canonical(_patch(json.loads(self._get_raw(connection, base)), json.loads(zlib.decompress(data))))
+        elif codec == 'lzma':
+            raw = lzma.decompress(data)
+        else:
+            raw = zlib.decompress(data)
+        self._remember(digest, raw)
+        return raw
+
+    def _remember(self, digest, raw):
+        """Keep a decoded blob, the recently decoded ones are the bases of the next deltas."""
+        if len(raw) > self.cache_bytes:
+            return
+        with self._decoded_lock:
+            if digest in self._decoded:
+                return
+            self._decoded[digest] = raw
+            self._decoded_bytes += len(raw)
+            while self._decoded_bytes > self.cache_bytes:
+                _, evicted = self._decoded.popitem(last=False)
+                self._decoded_bytes -= len(evicted)
+
+    def _entry(self, connection, hashes):
+        return {part: None if digest is None else json.loads(self._get_raw(connection, digest))
+                for part, digest in zip(_PARTS, hashes)}
+
+    def get(self, key, version=None):
+        """
+        Returns: The archived entry (dict with warning, warning_detail and warning_geo) of the given version of a
+        warning, the latest one if version is None, or None if it is unknown.
+        """
+        connection = self._connection()
+        if version is None:
+            row = connection.execute('SELECT warning, warning_detail, warning_geo FROM versions WHERE id = ? '
+                                     'ORDER BY version DESC LIMIT 1', (key,)).fetchone()
+        else:
+            row = connection.execute('SELECT warning, warning_detail, warning_geo FROM versions WHERE id = ? '
+                                     'AND version = ?', (key, version)).fetchone()
+        return None if row is None else self._entry(connection, row)
+
+    def versions(self, key):
+        """
+        Returns: List with a dict per archived version of a warning ('version', 'seen', 'start', 'expires' and
+        'until', which is None while the version is current).
+        """
+        rows = self._connection().execute('SELECT version, seen, start, expires, until FROM versions WHERE id = ? '
+                                          'ORDER BY version', (key,)).fetchall()
+        return [dict(zip(('version', 'seen', 'start', 'expires', 'until'), row)) for row in rows]
+
+    def _query(self, begin, end, ars, level, covering):
+        """Rows of the versions valid at some time in [begin, end] (and the region)."""
+        sql = ('SELECT v.id, v.version, v.start, v.expires, v.until, v.warning, v.warning_detail, v.warning_geo '
+               'FROM intervals i JOIN versions v ON v.rowid = i.rowid WHERE i.start <= ? AND i.until >= ?')
+        params = [math.ceil(end), math.floor(begin)]
+        if ars is not None:
+            code = normalize_ars(ars, level=level)
+            if code is None:
+                raise ValueError(f'Invalid regional key (ARS): {ars}')
+            conditions = ['(ars >= ? AND ars < ?)']
+            params += [code, code + ':']
+            if covering:
+                prefixes = [code[:length] for length in _LENGTHS if length < len(code)]
+                if prefixes:
+                    conditions.append(f"ars IN ({', '.join('?' * len(prefixes))})")
+                    params += prefixes
+            # checked per version valid in the interval, which are far fewer than the versions of a region
+            sql += f" AND EXISTS (SELECT 1 FROM geocodes WHERE ref = v.rowid AND ({' OR '.join(conditions)}))"
+        connection = self._connection()
+        rows = list()
+        for row in connection.execute(sql, params).fetchall():
+            # the interval index is rounded to seconds, the exact bounds are checked here
+            stop = row[4] if row[4] is not None else row[3]
+            if row[2] <= end and (stop is None or stop > begin):
+                rows.append(row)
+        return connection, rows
+
+    def active_at(self, when, ars=None, level=None, covering=True):
+        """
+        Get the warnings active at a point in time.
+        Args:
+            when: The point in time (unix timestamp, datetime or timestamp string).
+            ars: OPTIONAL: Only warnings for this region (regional key or prefix, see ArsIndex.query).
+            level: OPTIONAL: Truncate the regional key to the given level (see ARS_LEVELS).
+            covering: Also return the warnings issued for a superordinate region.
+
+        Returns: List with the archived entry of every active warning (the latest version active at that time).
+        """
+        when = _timestamp(when)
+        connection, rows = self._query(when, when, ars, level, covering)
+        latest = dict()
+        for row in rows:
+            if row[0] not in latest or row[1] > latest[row[0]][1]:
+                latest[row[0]] = row
+        return [self._entry(connection, row[5:]) for row in sorted(latest.values(), key=lambda row: row[2])]
+
+    def active_between(self, begin, end, ars=None, level=None, covering=True):
+        """
+        Get all versions of the warnings active at some time of an interval.
+        Args:
+            begin: Start of the interval (unix timestamp, datetime or timestamp string).
+            end: End of the interval.
+            ars: OPTIONAL: Only warnings for this region (regional key or prefix, see ArsIndex.query).
+            level: OPTIONAL: Truncate the regional key to the given level (see ARS_LEVELS).
+            covering: Also return the warnings issued for a superordinate region.
+
+        Returns: List with the archived entries of all matching versions ordered by their start.
+        """
+        connection, rows = self._query(_timestamp(begin), _timestamp(end), ars, level, covering)
+        return [self._entry(connection, row[5:]) for row in sorted(rows, key=lambda row: (row[2], row[0], row[1]))]
+
+    def stats(self):
+        """
+        Returns: Dict with the number of 'warnings', 'versions' and 'blobs' and the compressed 'bytes' of the blobs.
+        """
+        connection = self._connection()
+        warnings, versions = connection.execute('SELECT COUNT(DISTINCT id), COUNT(*) FROM versions').fetchone()
+        blobs, size = connection.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM blobs').fetchone()
+        return {'warnings': warnings, 'versions': versions, 'blobs': blobs, 'bytes': size}
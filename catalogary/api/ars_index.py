@@ -0,0 +1,169 @@
+####
+# Copyright 2023 burrizza
+######
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# length of the significant part of the regional key (Amtlicher Regionalschluessel - ARS) on each level
+ARS_LEVELS = {
+    'bund': 0,
+    'land': 2,
+    'regierungsbezirk': 3,
+    'kreis': 5,
+    'gemeindeverband': 9,
+    'gemeinde': 12,
+}
+_LENGTHS = tuple(sorted(ARS_LEVELS.values()))
+
+
+def normalize_ars(ars, level=None):
+    """
+    Reduce a regional key (ARS) to its significant prefix, e.g. '091620000000' (Kreis Muenchen) -> '09162'.
+    Shorter keys are treated as prefixes ('09' -> Bayern), '00' or '000000000000' stands for the whole country ('').
+    Args:
+        ars: The regional key as string or int.
+        level: OPTIONAL: Truncate the key to the given level (see ARS_LEVELS).
+
+    Returns: The significant prefix or None if the key is no valid ARS.
+    """
+    ars = str(ars).strip()
+    if not ars.isdigit() or len(ars) > 12:
+        return None
+    ars = ars.ljust(12, '0')
+    if level is not None:
+        ars = ars[:ARS_LEVELS[level]].ljust(12, '0')
+    if ars[:2] == '00':
+        return ''
+    for length in _LENGTHS:
+        if length and not ars[length:].strip('0'):
+            return ars[:length]
+    return ars
+
+
+class ArsIndex(object):
+    """
+    Locally maintained index regional key (ARS) -> warning ids built from the geocodes of the warning details.
+    Lookups for a region are dict accesses instead of a complete national enrichment.
+    """
+
+    def __init__(self):
+        self._by_prefix = dict()
+        self._by_code = dict()
+        self._codes = dict()
+        self._versions = dict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._codes)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._codes
+
+    @staticmethod
+    def geocodes(detail):
+        """
+        Returns: Set with the normalized regional keys of all areas of the given detail (dict or WarningDetail).
+        """
+        if isinstance(detail, dict):
+            values = {geocode.get('value') for info in detail.get('info', ()) for area in info.get('area', ())
+                      for geocode in area.get('geocode', ())}
+        else:
+            values = detail.geocodes
+        return {code for code in (normalize_ars(value) for value in values if value) if code is not None}
+
+    def update(self, key, detail, version=None):
+        """
+        Add or replace the regions of a warning.
+        Args:
+            key: The Id of the warning.
+            detail: The warning detail (dict or WarningDetail).
+            version: OPTIONAL: The version of the warning, used by NinaAPI.update_ars_index to skip unchanged ones.
+        """
+        codes = self.geocodes(detail)
+        with self._lock:
+            self._remove(key)
+            self._codes[key] = codes
+            self._versions[key] = version
+            for code in codes:
+                self._by_code.setdefault(code, set()).add(key)
+                for length in _LENGTHS:
+                    if length > len(code):
+                        break
+                    self._by_prefix.setdefault(code[:length], set()).add(key)
+
+    def remove(self, key):
+        """Remove a warning from the index."""
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        codes = self._codes.pop(key, ())
+        self._versions.pop(key, None)
+        for code in codes:
+            self._discard(self._by_code, code, key)
+            for length in _LENGTHS:
+                if length > len(code):
+                    break
+                self._discard(self._by_prefix, code[:length], key)
+
+    @staticmethod
+    def _discard(index, code, key):
+        keys = index.get(code)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[code]
+
+    def version(self, key):
+        """
+        Returns: The version stored with the warning or None.
+        """
+        with self._lock:
+            return self._versions.get(key)
+
+    def keys(self):
+        """
+        Returns: Set with the Ids of all indexed warnings.
+        """
+        with self._lock:
+            return set(self._codes)
+
+    def query(self, ars, level=None, covering=True):
+        """
+        Get the warnings of a region.
+        Args:
+            ars: The regional key (ARS) or a prefix of it, e.g. '09' (Land), '09162' (Kreis) or '091620000000'.
+            level: OPTIONAL: Truncate the key to the given level (see ARS_LEVELS).
+            covering: Also return the warnings issued for a superordinate region, e.g. a warning for the whole Land
+                when asking for a Kreis.
+
+        Returns: Set with the Ids of the warnings.
+        """
+        code = normalize_ars(ars, level=level)
+        if code is None:
+            raise ValueError(f'Invalid regional key (ARS): {ars}')
+        with self._lock:
+            keys = set(self._by_prefix.get(code, ()))
+            if covering:
+                for length in _LENGTHS:
+                    if length >= len(code):
+                        break
+                    keys.update(self._by_code.get(code[:length], ()))
+        return keys
+
+    @classmethod
+    def from_details(cls, details):
+        """
+        Args:
+            details: Dict warning Id -> warning detail, e.g. the first result of NinaAPI.warning_details.
+
+        Returns: New ArsIndex including the given details.
+        """
+        index = cls()
+        for key, detail in details.items():
+            index.update(key, detail)
+        return index
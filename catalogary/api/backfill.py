@@ -0,0 +1,178 @@
+####
+# Copyright 2023 burrizza
+######
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class BackfillTask(namedtuple('BackfillTask', ['component', 'scope', 'date_from', 'date_to'])):
+    """
+    One unit of work of a backfill -> the measurements of one component and scope in one time window.
+    """
+    __slots__ = ()
+
+    @property
+    def id(self):
+        return f'{self.component}_{self.scope}_{self.date_from}_{self.date_to}'
+
+
+def plan_tasks(components, scopes, date_from, date_to, window_days=7):
+    """
+    Partition a backfill into (component, scope, time window) tasks.
+    Args:
+        components: A list with component ids or the response of UmweltbundesamtAPI.components.
+        scopes: A list with scope ids.
+        date_from: First day as date or 'YYYY-MM-DD'.
+        date_to: Last day (included) as date or 'YYYY-MM-DD'.
+        window_days: Number of days per task.
+
+    Returns: List with the BackfillTasks.
+    """
+    if isinstance(components, dict):
+        components = [components.get(str(i))[0] for i in range(1, components.get('count') + 1)]
+    if isinstance(date_from, str):
+        date_from = date.fromisoformat(date_from)
+    if isinstance(date_to, str):
+        date_to = date.fromisoformat(date_to)
+    windows = list()
+    window_from = date_from
+    while window_from <= date_to:
+        window_to = min(window_from + timedelta(days=window_days - 1), date_to)
+        windows.append((window_from.isoformat(), window_to.isoformat()))
+        window_from = window_to + timedelta(days=1)
+    return [BackfillTask(str(component), str(scope), window_from, window_to)
+            for component in components for scope in scopes for (window_from, window_to) in windows]
+
+
+class RateBudget(object):
+    """
+    Request rate budget shared by all processes of a backfill (requests per second over all workers).
+    """
+
+    def __init__(self, rate, lock=None, next_slot=None):
+        self.rate = rate
+        self._lock = lock if lock is not None else multiprocessing.Lock()
+        self._next_slot = next_slot if next_slot is not None else multiprocessing.Value('d', 0.0, lock=False)
+
+    def acquire(self):
+        """Block until the next request slot of the budget is reached."""
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot.value)
+            self._next_slot.value = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_worker = dict()
+
+
+def _init_worker(url, client_kwargs, rate, lock, next_slot):
+    from .fedrep_umweltbundesamt import UmweltbundesamtAPI
+    _worker['client'] = UmweltbundesamtAPI(url, **client_kwargs)
+    _worker['budget'] = RateBudget(rate, lock=lock, next_slot=next_slot)
+
+
+def _run_task(task, out_dir):
+    _worker['budget'].acquire()
+    resp = _worker['client'].measures(date_from=task.date_from, time_from='1', date_to=task.date_to, time_to='24',
+                                      scope=task.scope, component=task.component)
+    path = os.path.join(out_dir, f'{task.id}.json.gz')
+    with gzip.open(f'{path}.tmp', 'wt', encoding='utf-8') as f_out:
+        json.dump(resp, f_out, ensure_ascii=False)
+    os.replace(f'{path}.tmp', path)
+    return task.id
+
+
+class UmweltbundesamtBackfill(object):
+    """
+    Resumable historical backfill of the Umweltbundesamt measurements.
+    The work is partitioned into (component, scope, time window) tasks which run on a process pool under a global
+    request rate budget. Every task writes '<out_dir>/<task id>.json.gz' (the raw measures response) and is recorded
+    in the manifest when done, so a rerun skips the completed tasks.
+    """
+
+    def __init__(self, url, out_dir, manifest=None, processes=4, rate=1.0, window_days=7, client_kwargs=None):
+        """
+        Args:
+            url: The url of the Umweltbundesamt API.
+            out_dir: Directory for the task results.
+            manifest: OPTIONAL: Path of the manifest file, '<out_dir>/manifest.jsonl' by default.
+            processes: Number of worker processes.
+            rate: Maximum number of requests per second of all workers together (None for no limit).
+            window_days: Number of days per task.
+            client_kwargs: OPTIONAL: Keyword arguments for the UmweltbundesamtAPI of every worker.
+        """
+        self.url = url
+        self.out_dir = out_dir
+        self.manifest = manifest or os.path.join(out_dir, 'manifest.jsonl')
+        self.processes = processes
+        self.rate = rate
+        self.window_days = window_days
+        self.client_kwargs = client_kwargs or dict()
+
+    def completed(self):
+        """
+        Returns: Set with the ids of the tasks recorded in the manifest.
+        """
+        if not os.path.exists(self.manifest):
+            return set()
+        done = set()
+        with open(self.manifest, encoding='utf-8') as f_manifest:
+            for line in f_manifest:
+                try:
+                    done.add(json.loads(line)['id'])
+                except (ValueError, KeyError):
+                    # a line cut off by a crash, the task is simply repeated
+                    logger.warning(f'Ignoring broken manifest line: {line!r}')
+        return done
+
+    def run(self, components, date_from, date_to, scopes=('2',)):
+        """
+        Run (or resume) the backfill.
+        Args:
+            components: A list with component ids or the response of UmweltbundesamtAPI.components.
+            date_from: First day as date or 'YYYY-MM-DD'.
+            date_to: Last day (included) as date or 'YYYY-MM-DD'.
+            scopes: A list with scope ids.
+
+        Returns: Dict with the lists of the 'done', 'skipped' and 'failed' task ids.
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        tasks = plan_tasks(components, scopes, date_from, date_to, window_days=self.window_days)
+        completed = self.completed()
+        summary = {'done': list(), 'skipped': [task.id for task in tasks if task.id in completed], 'failed': list()}
+        tasks = [task for task in tasks if task.id not in completed]
+        logger.info(f'Backfill: {len(tasks)} tasks to run, {len(summary["skipped"])} already completed')
+        if not tasks:
+            return summary
+
+        initargs = (self.url, self.client_kwargs, self.rate, multiprocessing.Lock(),
+                    multiprocessing.Value('d', 0.0, lock=False))
+        with ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker, initargs=initargs) as executor, \
+                open(self.manifest, 'a', encoding='utf-8') as f_manifest:
+            futures = {executor.submit(_run_task, task, self.out_dir): task for task in tasks}
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f'Backfill task {task.id} failed: {e}')
+                    summary['failed'].append(task.id)
+                    continue
+                f_manifest.write(json.dumps({'id': task.id, 'finished': time.time()}) + '\n')
+                f_manifest.flush()
+                os.fsync(f_manifest.fileno())
+                summary['done'].append(task.id)
+        return summary
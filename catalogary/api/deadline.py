@@ -0,0 +1,152 @@
+####
+# Copyright 2023 burrizza
+######
+import contextvars
+import functools
+import inspect
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# deadline of the requests of the current thread / task, see Deadline.applied
+current_deadline = contextvars.ContextVar('catalogary_deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The time budget of an operation ran out before a request could be sent."""
+
+
+class Deadline(object):
+    """
+    End-to-end time budget of an operation consisting of many requests. While it is applied, the connect and read
+    timeouts of every request are cut to the remaining time and no request is sent once it expired. The waits of a
+    request before it is sent (for a slot of the scheduler or the limiter, for an identical coalesced request or for
+    the refresh of the shared cache by another process) end with the deadline as well, and no hedge is sent which
+    could not answer in time.
+    """
+
+    def __init__(self, seconds):
+        """
+        Args:
+            seconds: The time budget in seconds from now.
+        """
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    @classmethod
+    def of(cls, value):
+        """
+        Returns: The given Deadline, a new one for a number of seconds or None for None.
+        """
+        if value is None or isinstance(value, Deadline):
+            return value
+        return cls(value)
+
+    def remaining(self):
+        """
+        Returns: Seconds left (0 if expired).
+        """
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self):
+        return time.monotonic() >= self.expires
+
+    def timeout(self, connect, read):
+        """
+        Returns: Tuple with the connect and the read timeout cut to the remaining time.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f'Deadline of {self.seconds}s exceeded')
+        return min(connect, remaining), min(read, remaining)
+
+    def sleep(self, seconds):
+        """Sleep the given seconds, but not beyond the deadline."""
+        time.sleep(min(seconds, self.remaining()))
+
+    def exceeded(self, waiting_for):
+        """
+        Returns: The DeadlineExceeded to raise if the deadline expired while waiting for the given resource.
+        """
+        return DeadlineExceeded(f'Deadline of {self.seconds}s exceeded waiting for {waiting_for}')
+
+    @contextmanager
+    def applied(self):
+        """
+        Apply the deadline to all requests of the current thread (or asyncio task) inside the block. An outer deadline
+        expiring earlier stays in force.
+        """
+        outer = current_deadline.get()
+        token = current_deadline.set(self if outer is None or self.expires <= outer.expires else outer)
+        try:
+            yield self
+        finally:
+            current_deadline.reset(token)
+
+
+def with_deadline(func):
+    """
+    Decorator for client methods with a 'deadline' parameter (seconds or Deadline): the method receives a Deadline
+    (or None) and all of its requests run under it.
+    """
+    position = list(inspect.signature(func).parameters).index('deadline')
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        args = list(args)
+        if len(args) > position:
+            deadline = args[position] = Deadline.of(args[position])
+        else:
+            deadline = kwargs['deadline'] = Deadline.of(kwargs.get('deadline'))
+        if deadline is None:
+            return func(*args, **kwargs)
+        with deadline.applied():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class PartialList(list):
+    """
+    List result of an operation with a deadline, 'missing' names the parts which could not be fetched in time.
+    """
+
+    def __init__(self, iterable=(), missing=()):
+        super(PartialList, self).__init__(iterable)
+        self.missing = list(missing)
+
+    @property
+    def complete(self):
+        return not self.missing
+
+
+class PartialDict(dict):
+    """
+    Dict result of an operation with a deadline, 'missing' names the parts which could not be fetched in time.
+    """
+
+    def __init__(self, mapping=(), missing=()):
+        super(PartialDict, self).__init__(mapping)
+        self.missing = list(missing)
+
+    @property
+    def complete(self):
+        return not self.missing
+
+
+class PartialCount(int):
+    """
+    Number of records written to a sink by an operation with a deadline, 'missing' names the parts which could not
+    be fetched in time.
+    """
+
+    def __new__(cls, value=0, missing=()):
+        count = super(PartialCount, cls).__new__(cls, value)
+        count.missing = list(missing)
+        return count
+
+    @property
+    def complete(self):
+        return not self.missing
@@ -2,9 +2,15 @@
 # Modifications copyright 2023 burrizza
 # Copyright 2014 Mateusz Harasymczuk, Gonchik Tsymzhitov (atlassian-api)
 ######
+import contextvars
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
-from .rest_client import FedRepRestAPI
+from .ars_index import ArsIndex, normalize_ars
+from .deadline import PartialCount, PartialList, with_deadline
+from .pipeline import Pipeline
+from .records import NinaWarning, WarningDetail
+from .rest_client import FedRepRestAPI, default_priority
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +28,7 @@ class NinaAPI(FedRepRestAPI):
             kwargs['api_root'] = None
         super(NinaAPI, self).__init__(url, *args, **kwargs)
 
+    @default_priority('critical')
     def mowas_warnings(self, expand=None):
         """
         Retrieve MOdular WArn System (for the citizens of Germany) warnings using the NINA interface.
@@ -37,6 +44,7 @@ class NinaAPI(FedRepRestAPI):
             params['expand'] = expand
         return self.get(url, params=params)
 
+    @default_priority('critical')
     def katwarn_warnings(self, expand=None):
         """
         Retrieve KAT_wARN (Katastrophenschutz - civil protection warn system Germany) warnings using the NINA interface.
@@ -52,6 +60,7 @@ class NinaAPI(FedRepRestAPI):
             params['expand'] = expand
         return self.get(url, params=params)
 
+    @default_priority('critical')
     def dwd_warnings(self, expand=None):
         """
         Retrieve D_wD (german weather service) warnings using the NINA interface.
@@ -67,6 +76,7 @@ class NinaAPI(FedRepRestAPI):
             params['expand'] = expand  # TODO: expand is jira specific, eg "&expand=None"
         return self.get(url, params=params)
 
+    @default_priority('critical')
     def biwapp_warnings(self, expand=None):
         """
         Retrieve BIWapp (Buerger Info und Warnapp - german citizen warn application) warnings using the NINA interface.
@@ -82,6 +92,7 @@ class NinaAPI(FedRepRestAPI):
             params['expand'] = expand  # TODO: expand is jira specific, eg "&expand=None"
         return self.get(url, params=params)
 
+    @default_priority('critical')
     def police_warnings(self, expand=None):
         """
         Retrieve police warnings using the NINA interface.
@@ -97,6 +108,7 @@ class NinaAPI(FedRepRestAPI):
             params['expand'] = expand  # TODO: expand is jira specific, eg "&expand=None"
         return self.get(url, params=params)
 
+    @default_priority('critical')
     def lhp_warnings(self, expand=None):
         """
         Retrieve lhp (Hochwasser Portal - german flood warning system) warnings using the NINA interface.
@@ -144,32 +156,262 @@ class NinaAPI(FedRepRestAPI):
             params['expand'] = expand
         return self.get(url, params=params)
 
-    def generic_complete(self, resp_warnings, selection=None, expand=None):
+    @default_priority('critical')
+    def dashboard(self, ars, expand=None):
         """
-        Get a List including all information to given warnings.
+        Retrieve the warnings of a region using its regional key (Amtlicher Regionalschluessel - ARS).
+        The API works on district (Kreis) level so the key is truncated to its first 5 digits and padded with zeros.
+        Args:
+            ars: The regional key (ARS) of the region of interest (at least down to the Kreis).
+            expand: Out of Order (TODO)
+
+        Returns: List with dictionaries including the response.
+        """
+        ars = str(ars).strip()
+        if normalize_ars(ars) is None or len(ars) < 5:
+            raise ValueError(f'Invalid regional key (ARS) for the dashboard: {ars}')
+        base_url = self.resource_url(resource='dashboard')
+        url = f'{base_url}/{ars[:5]}0000000.json'
+        params = {}
+        if expand:
+            params['expand'] = expand
+        return self.get(url, params=params)
+
+    def update_ars_index(self, resp_warnings, index=None, max_workers=None):
+        """
+        Maintain a local index regional key (ARS) -> warning ids. Only the details of new or changed warnings are
+        requested and warnings missing in the given responses are removed from the index.
+        Args:
+            resp_warnings: A list with the response of the warnings which should be indexed (e.g. of all feeds).
+            index: OPTIONAL: The ArsIndex to update, a new one is created if None.
+            max_workers: OPTIONAL: Maximum number of concurrent detail requests (see warning_details).
+
+        Returns: Tuple with the ArsIndex and a dict with the exceptions of the failed detail requests.
+        """
+        if index is None:
+            index = ArsIndex()
+        versions = {resp.get('id'): resp.get('version') for resp in resp_warnings}
+        for key in index.keys() - set(versions):
+            index.remove(key)
+        keys = [key for key, version in versions.items() if key not in index or index.version(key) != version]
+        resp_details, errors = self.warning_details(keys, max_workers=max_workers)
+        for key, resp_detail in resp_details.items():
+            index.update(key, resp_detail, version=versions[key])
+        return index, errors
+
+    def warning_details(self, keys, max_workers=None, expand=None):
+        """
+        Delivers additional information about many warnings at once.
+        Duplicated keys are requested only once and the requests run with a bounded number of threads.
+        Args:
+            keys: An iterable with the Ids corresponding to the warnings of interest.
+            max_workers: OPTIONAL: Maximum number of concurrent requests (by default 8, with an AdaptiveLimiter its
+                maximum limit, the limiter then gates the running requests).
+            expand: Out of Order (TODO)
+
+        Returns: Tuple of two dicts keyed by Id -> the details and the exceptions of the failed requests.
+        """
+        return self._bulk_get(self.warning_detail, keys, max_workers=self._bulk_workers(max_workers, 8),
+                              expand=expand)
+
+    def warning_geos(self, keys, max_workers=None, expand=None):
+        """
+        Retrieve geographical information about many warnings at once.
+        Duplicated keys are requested only once and the requests run with a bounded number of threads.
+        Args:
+            keys: An iterable with the Ids corresponding to the warnings of interest.
+            max_workers: OPTIONAL: Maximum number of concurrent requests (by default 8, with an AdaptiveLimiter its
+                maximum limit, the limiter then gates the running requests).
+            expand: Out of Order (TODO)
+
+        Returns: Tuple of two dicts keyed by Id -> the geographical informations and the exceptions of the failed
+        requests.
+        """
+        return self._bulk_get(self.warning_geo, keys, max_workers=self._bulk_workers(max_workers, 8), expand=expand)
+
+    @staticmethod
+    def _bulk_get(getter, keys, max_workers=8, **kwargs):
+        """
+        Call the getter for every unique key using a thread pool. Errors are collected per key instead of
+        aborting the whole batch.
+        """
+        results = dict()
+        errors = dict()
+        unique_keys = list(dict.fromkeys(keys))
+        if not unique_keys:
+            return results, errors
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique_keys)))) as executor:
+            # the workers inherit the context (e.g. the priority class) of the caller
+            futures = {key: executor.submit(contextvars.copy_context().run, getter, key=key, **kwargs)
+                       for key in unique_keys}
+            for key, future in futures.items():
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    logger.warning(f'Bulk request for {key} failed: {e}')
+                    errors[key] = e
+        return results, errors
+
+    @with_deadline
+    def generic_complete(self, resp_warnings, selection=None, records=False, sink=None, deadline=None,
+                         fetch_workers=None, expand=None):
+        """
+        Get a List including all information to given warnings (see lazy_complete to request the details and
+        geojsons on access only).
         Args:
             resp_warnings: A list with the response of the warnings which should be completed.
-            selection: A list with a selection of the toplevel fields of interest.
+            selection: A list with a selection of the toplevel fields of interest. Details or geojsons without any
+                selected field are not requested at all and only the selected fields are kept.
+            records: OPTIONAL: Return compact NinaWarning records (including WarningDetail and geojson) instead of
+                dicts, the selection is not applied to records.
+            sink: OPTIONAL: A RecordSink (e.g. NdjsonSink, CsvSink) every completed warning is streamed into instead
+                of building the list.
+            deadline: OPTIONAL: Time budget in seconds (or a Deadline) for all requests. The warnings which could not
+                be completed in time or failed are skipped and the result (PartialList or PartialCount) names them
+                in 'missing' instead of raising.
+            fetch_workers: OPTIONAL: Complete the warnings in a Pipeline: this many threads request the details and
+                geojsons while another one assembles them and the calling thread collects them (or writes them to the
+                sink) in order. By default the warnings are completed one after another, with an AdaptiveLimiter
+                by as many threads as its maximum limit (the limiter gates the running requests), 0 disables the
+                pipeline.
             expand: Out of Order (TODO)
 
-        Returns: A List with all available information to given warnings.
+        Returns: A List with all available information to given warnings or the number of warnings written to the
+        sink.
         """
+        fields = (None, None)
+        if selection is not None and not records:
+            fields = self._plan_selection(selection)
         genericCompList = list()
-        for resp in resp_warnings:
-            resp_id = resp.get('id')
-            if (selection is None):
-                genericCompEntry = {'warning': resp, 'warning_detail': self.warning_detail(key=resp_id),
-                                    'warning_geo': self.warning_geo(key=resp_id)}
-            else:
-                respDetail = self.warning_detail(key=resp_id)
-                respGeo = self.warning_geo(key=resp_id)
-                genericCompEntry = {
-                    'warning': {key: resp[key] for key in resp.keys() if key in selection},
-                    'warning_detail': {key: respDetail[key] for key in respDetail.keys() if key in selection},
-                    'warning_geo': {key: respGeo.get(key) for key in respGeo.keys() if key in selection}
-                }
-            genericCompList.append(genericCompEntry)
-        return genericCompList
+        missing = list()
+        emit = genericCompList.append if sink is None else sink.write
+        count_before = None if sink is None else sink.count
+        fetch_workers = self._bulk_workers(fetch_workers, 0)
+        if fetch_workers:
+            completed = self._complete_pipeline(selection, records, *fields, workers=fetch_workers).run(
+                resp_warnings, return_exceptions=deadline is not None)
+            for resp, entry in completed:
+                if isinstance(entry, Exception):
+                    logger.warning(f'Completion of {resp.get("id")} failed: {entry}')
+                    missing.append(resp.get('id'))
+                else:
+                    emit(entry)
+        else:
+            for resp in resp_warnings:
+                if deadline is None:
+                    emit(self._complete_entry(resp, selection, records, *fields))
+                    continue
+                if deadline.expired:
+                    missing.append(resp.get('id'))
+                    continue
+                try:
+                    emit(self._complete_entry(resp, selection, records, *fields))
+                except Exception as e:
+                    logger.warning(f'Completion of {resp.get("id")} failed: {e}')
+                    missing.append(resp.get('id'))
+        if sink is not None:
+            sink.flush()
+            count = sink.count - count_before
+            return count if deadline is None else PartialCount(count, missing)
+        return genericCompList if deadline is None else PartialList(genericCompList, missing)
+
+    def lazy_complete(self, resp_warnings, selection=None, records=False, lookahead=0, max_workers=None):
+        """
+        Complete the given warnings lazily: the result is returned without any request and the detail and the geojson
+        of a warning are requested on first access only (and memoized), so unused enrichments are never downloaded.
+        Args:
+            resp_warnings: A list with the response of the warnings which should be completed.
+            selection: A list with a selection of the toplevel fields of interest (see generic_complete).
+            records: OPTIONAL: Deliver the details as WarningDetail, LazyWarning.complete returns NinaWarning records.
+            lookahead: OPTIONAL: Number of warnings whose enrichments are prefetched in the background ahead of an
+                iteration (0 to fetch on access only), see LazyWarnings.prefetch for explicit hints.
+            max_workers: OPTIONAL: Maximum number of concurrent prefetch requests (by default 8, with an
+                AdaptiveLimiter its maximum limit).
+
+        Returns: LazyWarnings (a list of LazyWarning), close it to stop its prefetch threads.
+        """
+        from .lazy_warnings import LazyWarning, LazyWarnings
+
+        fields = (None, None)
+        if selection is not None and not records:
+            fields = self._plan_selection(selection)
+        return LazyWarnings((LazyWarning(self, resp, selection, records, *fields) for resp in resp_warnings),
+                            lookahead=lookahead, max_workers=self._bulk_workers(max_workers, 8))
+
+    def _complete_entry(self, resp, selection, records, detail_fields=None, geo_fields=None):
+        """
+        Returns: The completed warning (see generic_complete).
+        """
+        resp_id = resp.get('id')
+        detail = self._enrichment(resp_id, 'detail', selection, records, detail_fields)
+        geo = self._enrichment(resp_id, 'geo', selection, records, geo_fields)
+        return self._assemble_entry(resp, selection, records, detail, geo)
+
+    @staticmethod
+    def _assemble_entry(resp, selection, records, detail, geo):
+        if records:
+            return NinaWarning.from_dict(resp, detail=detail, geo=geo)
+        elif (selection is None):
+            return {'warning': resp, 'warning_detail': detail, 'warning_geo': geo}
+        return {'warning': {key: resp[key] for key in resp.keys() if key in selection}, 'warning_detail': detail,
+                'warning_geo': geo}
+
+    def _complete_pipeline(self, selection, records, detail_fields=None, geo_fields=None, workers=8):
+        """
+        Returns: Pipeline completing warnings (see generic_complete) in a fetch stage with the given number of threads
+        requesting the detail and geojson and a second stage assembling the completed warning.
+        """
+        fields = {'detail': detail_fields, 'geo': geo_fields}
+
+        def fetch(resp):
+            return resp, [self._enrichment(resp.get('id'), part, selection, records, fields[part]) for part in fields]
+
+        def assemble(fetched):
+            resp, parts = fetched
+            return self._assemble_entry(resp, selection, records, *parts)
+
+        return Pipeline().add_stage(fetch, workers=workers).add_stage(assemble)
+
+    def _enrichment(self, key, part, selection, records, fields=None):
+        """
+        Returns: The detail ('detail') or the geojson ('geo') of a warning as completed by generic_complete.
+        """
+        if selection is not None and not records:
+            return self._warning_projected(key, 'json' if part == 'detail' else 'geojson', fields)
+        if part == 'geo':
+            return self.warning_geo(key=key)
+        resp_detail = self.warning_detail(key=key)
+        return WarningDetail.from_dict(resp_detail) if records else resp_detail
+
+    def _plan_selection(self, selection):
+        """
+        Returns: The selected fields of the warning detail and of the geojson, None if the selection contains none of
+        their fields (so the request can be skipped).
+        """
+        selection = set(selection)
+        detail_fields = selection & self.DETAIL_FIELDS
+        geo_fields = selection & self.GEO_FIELDS
+        return detail_fields or None, geo_fields or None
+
+    def _warning_projected(self, key, suffix, fields):
+        """
+        Get the detail ('json') or the geojson ('geojson') of a warning reduced to the given fields.
+
+        Returns: Dict with the selected fields (empty if fields is None, no request is sent then).
+        """
+        if fields is None:
+            return {}
+        resp = self.get(f"{self.resource_url(resource='warnings')}/{key}.{suffix}")
+        if isinstance(resp, dict):
+            return {field: resp[field] for field in resp.keys() if field in fields}
+        return resp or {}
+
+    # toplevel fields of a warning detail (CAP 1.2 alert) and of a warning geojson (FeatureCollection)
+    DETAIL_FIELDS = frozenset(('identifier', 'sender', 'sent', 'status', 'msgType', 'source', 'scope', 'restriction',
+                               'addresses', 'code', 'note', 'references', 'incidents', 'info'))
+    GEO_FIELDS = frozenset(('type', 'features', 'bbox'))
+    # the feeds, details and dashboards are small enough to be hedged (see HedgePolicy), the geojsons are not
+    HEDGED_ENDPOINTS = r'(mapData|warnings/[^/]+|dashboard/[^/]+)\.json$'
 
     JSON_SCHEMA_DWD_WARNINGS = {
         'type': 'array',
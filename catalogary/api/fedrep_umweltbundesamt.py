@@ -2,13 +2,23 @@
 # Modifications copyright 2023 burrizza
 # Copyright 2014 Mateusz Harasymczuk, Gonchik Tsymzhitov (atlassian-api)
 ######
+import json
 import logging
-from time import sleep
+import sys
+import threading
+from datetime import date, datetime, timedelta
+from time import monotonic, sleep
 
-from .rest_client import FedRepRestAPI
+from .deadline import PartialCount, PartialDict, PartialList, with_deadline
+from .pipeline import Pipeline
+from .records import StationMeasurement, parse_timestamp
+from .rest_client import FedRepRestAPI, default_priority
 
 logger = logging.getLogger(__name__)
 
+# scopes which can be computed from the hourly means (see uba_scopes), kept here to avoid importing numpy eagerly
+DERIVED_SCOPES = ('1', '3', '6')
+
 
 class UmweltbundesamtAPI(FedRepRestAPI):
     """
@@ -17,18 +27,28 @@ class UmweltbundesamtAPI(FedRepRestAPI):
     API Documentation: https://luftqualitaet.api.bund.dev/
     """
 
-    def __init__(self, url, *args, **kwargs):
+    def __init__(self, url, *args, latest=None, **kwargs):
+        """
+        Args:
+            latest: OPTIONAL: A LatestValueIndex updated with every measures response (including the locally derived
+                scopes), so the current values can be looked up without requests.
+        """
         if 'api_version' not in kwargs:
             kwargs['api_version'] = 'v2'
         if 'api_root' not in kwargs:
             kwargs['api_root'] = None
+        self.latest = latest
         super(UmweltbundesamtAPI, self).__init__(url, *args, **kwargs)
 
     def measures(self, date_from, time_from='24', date_to='2999-12-31', time_to='24', station=None, scope='2',
-                 component='1', selection=None, expand=None):
+                 component='1', normalize=False, parser=None, raw=False, selection=None, expand=None):
         """
         Retrieve a component using the API of the Umweltbundesamt.
         Args:
+            normalize: OPTIONAL: Return a MeasuresFrame (NumPy columns) with the timestamp keys and the value
+                timestamps as int64 UTC epoch seconds instead of the response (requires numpy).
+            parser: OPTIONAL: A TimestampParser to share its cache of parsed timestamps between calls.
+            raw: OPTIONAL: Return the undecoded response (bytes) to decode it elsewhere (see _decode_measures).
             expand: Out of Order (TODO)
 
         Returns: List including the response.
@@ -45,22 +65,36 @@ class UmweltbundesamtAPI(FedRepRestAPI):
         if station is not None:
             params['station'] = station
 
-        return self.get(url, params=params)
-
+        if raw:
+            return self.get(url, params=params, not_json_response=True)
+        resp = self.get(url, params=params)
+        if self.latest is not None:
+            self.latest.update(resp)
+        if normalize:
+            from .uba_frame import normalize_measures
+            return normalize_measures(resp, parser=parser)
+        return resp
+
+    @default_priority('bulk')
+    @with_deadline
     def measures_components(self, respComponents, date_from, time_from='24', date_to='2999-12-31', time_to='24',
-                            scope='2', selection=None, expand=None):
+                            scope='2', deadline=None, selection=None, expand=None):
         """
         Request a list with all given information to the given scope.
         The Umweltbundesamt delivers inconsistent timestamps so their correctness is a little bit unclear. Seems that
         the one used as values is UTC+01:00 and the system works 1 hour delayed. The timestamp used as key could be
         UTC, but again not used by the search parameters.
         Args:
+            deadline: OPTIONAL: Time budget in seconds (or a Deadline) for all requests. The components which could
+                not be requested in time or failed are skipped and the result (PartialDict) names their ids in
+                'missing' instead of raising.
             selection: A list with a selection of the toplevel fields of interest.
             expand: Out of Order (TODO)
 
         Returns: A List with all available informations to given warnings.
         """
         genericCompDict = dict()
+        missing = list()
         for i in range(1, respComponents.get('count') + 1):
             # transfer given list to more comfortable dictionary
             compDescription = {
@@ -71,8 +105,18 @@ class UmweltbundesamtAPI(FedRepRestAPI):
                 'name': respComponents.get(str(i))[4]
             }
             # get the measurements from all stations for the current component
-            resp_measures = self.measures(date_from=date_from, time_from=time_from, date_to=date_to, time_to=time_to,
-                                          scope=scope, component=compDescription['id'])
+            if deadline is not None and deadline.expired:
+                missing.append(compDescription['id'])
+                continue
+            try:
+                resp_measures = self.measures(date_from=date_from, time_from=time_from, date_to=date_to,
+                                              time_to=time_to, scope=scope, component=compDescription['id'])
+            except Exception as e:
+                if deadline is None:
+                    raise
+                logger.warning(f'Measures of component {compDescription["id"]} failed: {e}')
+                missing.append(compDescription['id'])
+                continue
 
             for key, value in resp_measures['data'].items():
                 if genericCompDict.get(key) is None:
@@ -80,13 +124,43 @@ class UmweltbundesamtAPI(FedRepRestAPI):
                     genericCompDict[key] = {key2: {compDescription['id']: [compDescription, value2]} for (key2, value2)
                                             in value.items()}
                 else:
-                    for key2 in genericCompDict[key].keys():
+                    for (key2, value2) in value.items():
                         # key2 = date
-                        genericCompDict[key][key2][compDescription['id']] = {
-                            compDescription['id']: [compDescription, value.get(key2)]}
+                        genericCompDict[key].setdefault(key2, dict())[compDescription['id']] = [compDescription,
+                                                                                                 value2]
+
+        return genericCompDict if deadline is None else PartialDict(genericCompDict, missing)
 
-        return genericCompDict
+    @default_priority('bulk')
+    def measures_cube(self, respComponents, date_from, time_from='24', date_to='2999-12-31', time_to='24',
+                      scope='2', sleeptime=1):
+        """
+        Request the measurements of all given components and arrange them in a dense MeasuresCube with the shape
+        (stations, hours, components), see uba_cube (requires numpy).
+        The time axis uses the timestamp keys as UTC epoch seconds.
+        Args:
+            respComponents: The response of components.
+            scope: The scope of the measurements, the time axis is hourly so daily scopes leave gaps.
+            sleeptime: Seconds to wait between two requests (None to disable).
+
+        Returns: The MeasuresCube.
+        """
+        from .uba_cube import MeasuresCube
+        from .uba_frame import TimestampParser
 
+        parser = TimestampParser()
+        frames = dict()
+        for i in range(1, respComponents.get('count') + 1):
+            component_id, component_code = respComponents.get(str(i))[0], respComponents.get(str(i))[1]
+            frames[component_code] = self.measures(date_from=date_from, time_from=time_from, date_to=date_to,
+                                                   time_to=time_to, scope=scope, component=component_id,
+                                                   normalize=True, parser=parser)
+            if sleeptime is not None:
+                sleep(sleeptime)
+        return MeasuresCube.from_frames(frames)
+
+    @default_priority('bulk')
+    @with_deadline
     def measures_stations(self,
                                respComponents,
                                date_from,
@@ -94,7 +168,8 @@ class UmweltbundesamtAPI(FedRepRestAPI):
                                date_to='2999-12-31',
                                time_to='24',
                                dict_scopes = {'1': '1TMW', '2': '1SMW', '3': '1SMW_MAX', '6': '1TMWGL'},
-                               sleeptime=1, selection=None, expand=None):
+                               sleeptime=1, derive_scopes=False, records=False, sink=None, compact=False,
+                               deadline=None, fetch_workers=None, selection=None, expand=None):
         """
         Request a list with all given scope-based information.
         The Umweltbundesamt delivers inconsistent timestamps so their correctness is a little bit unclear. Seems that
@@ -108,10 +183,31 @@ class UmweltbundesamtAPI(FedRepRestAPI):
         5: 8SMW_MAX -> 8h Tagesmaxima
         4: 8SMW -> 8h Mittelwert
         Args:
+            derive_scopes: OPTIONAL: Request only the hourly means (scope 2) and compute the scopes 1, 3 and 6 locally
+                from them instead of requesting every scope (requires numpy).
+            records: OPTIONAL: Return compact StationMeasurement records with numeric timestamps and coordinates
+                instead of dicts.
+            sink: OPTIONAL: A RecordSink (e.g. NdjsonSink, CsvSink) the records are written into instead of
+                building the list. The measures of all stations are merged before the first record is written, the
+                merged measures of a station are released once its records are in the sink.
+            compact: OPTIONAL: Reduce the memory of large results. The timestamps are interned and equal values are
+                shared across all stations, the dicts reference one dict per station under 'station' (with the keys
+                station_active_from, station_active_to, station_lat and station_lon) instead of copying these fields
+                into every row and the records share the parsed station fields.
+            deadline: OPTIONAL: Time budget in seconds (or a Deadline) for all requests, the sleeptime is cut to it as
+                well. The (component code, scope) pairs which could not be requested in time or failed are skipped
+                and the result (PartialList or PartialCount) names them in 'missing' instead of raising.
+            fetch_workers: OPTIONAL: Request the scopes in a Pipeline: this many threads send the requests (started
+                at least sleeptime apart across all threads) while another one decodes the responses and the calling
+                thread merges them in the original order. With a deadline, the scopes of a failed derivation are
+                missing instead of being requested one by one. By default the scopes are requested one after
+                another, with an AdaptiveLimiter by as many threads as its maximum limit (the limiter gates the
+                running requests), 0 disables the pipeline.
             selection: A list with a selection of the toplevel fields of interest.
             expand: Out of Order (TODO)
 
-        Returns: A List with all available informations to given warnings.
+        Returns: A List with all available informations to given warnings or the number of records written to the
+        sink.
         """
 
         # get stations respective to given time
@@ -121,53 +217,258 @@ class UmweltbundesamtAPI(FedRepRestAPI):
         # new dictionary -> id
         l_stations_all = list()
         dict_stations_all = dict()
+        # compact: (type, value) -> the one shared value object
+        shared_values = dict()
+        missing = list()
+        wait = sleep if deadline is None else deadline.sleep
+        comp_descriptions = list()
         for i in range(1, respComponents.get('count') + 1):
             # transfer given list to more comfortable dictionary
             # active: 1: PM10 (Particulate matter),3: 03 (Ozone), 5: NO2 (Nitrogen dioxide)
-            comp_description = {
+            comp_descriptions.append({
                 'id': respComponents.get(str(i))[0],
                 'code': respComponents.get(str(i))[1],
                 'symbol': respComponents.get(str(i))[2],
                 'unit': respComponents.get(str(i))[3],
                 'name': respComponents.get(str(i))[4]
-            }
+            })
+        fetch_workers = self._bulk_workers(fetch_workers, 0)
+        scopes_derived = [scope_key for scope_key in dict_scopes if derive_scopes and scope_key in DERIVED_SCOPES]
+
+        def requested():
+            """Yields: (component, scope, response) requested one after another."""
+            for comp_description in comp_descriptions:
+                resp_local = dict()
+                if scopes_derived and not (deadline is not None and deadline.expired):
+                    # only the hourly means are requested, the daily scopes are computed from them
+                    try:
+                        resp_local = self._derive_scopes(scopes_derived, comp_description['id'], date_from,
+                                                         time_from, date_to, time_to)
+                    except Exception as e:
+                        if deadline is None:
+                            raise
+                        logger.warning(f'Deriving the scopes of component {comp_description["id"]} failed: {e}')
+                    if sleeptime is not None:
+                        wait(sleeptime)
+
+                for (scope_key, scope_val) in dict_scopes.items():
+                    # get the measurements from all stations for the current component
+                    resp_measures_scope = resp_local.get(scope_key)
+                    if resp_measures_scope is None and deadline is not None and deadline.expired:
+                        missing.append((comp_description['code'], scope_val))
+                        continue
+                    if resp_measures_scope is None:
+                        try:
+                            resp_measures_scope = self.measures(date_from=date_from, time_from=time_from,
+                                                                date_to=date_to, time_to=time_to, scope=scope_key,
+                                                                component=comp_description['id'])
+                        except Exception as e:
+                            if deadline is None:
+                                raise
+                            logger.warning(f'Measures of {comp_description["code"]} {scope_val} failed: {e}')
+                            missing.append((comp_description['code'], scope_val))
+                            continue
+                        if sleeptime is not None:
+                            wait(sleeptime)
+                    yield comp_description, scope_val, resp_measures_scope
+
+        def pipelined():
+            """Yields: (component, scope, response) in the same order, requested by fetch_workers threads."""
+            scopes_covered = set()
+            if scopes_derived:
+                from .uba_scopes import BASE_SCOPE
+                scopes_covered = set(scopes_derived) | {BASE_SCOPE}
+            # (component, scope key, scope name or the scopes to derive, kind)
+            tasks = list()
+            for comp_description in comp_descriptions:
+                if scopes_derived:
+                    tasks.append((comp_description, None, scopes_derived, 'derive'))
+                tasks.extend((comp_description, scope_key, scope_val,
+                              'derived' if scope_key in scopes_covered else 'request')
+                             for (scope_key, scope_val) in dict_scopes.items())
+            pipeline = self._scopes_pipeline(date_from, time_from, date_to, time_to, sleeptime, wait, fetch_workers)
+            resp_local = dict()
+            for (comp_description, scope_key, scope_val, kind), result in pipeline.run(
+                    tasks, return_exceptions=deadline is not None):
+                if kind == 'derive':
+                    if isinstance(result, Exception):
+                        logger.warning(f'Deriving the scopes of component {comp_description["id"]} failed: {result}')
+                    resp_local = {} if isinstance(result, Exception) else result
+                    continue
+                if kind == 'derived':
+                    result = resp_local.get(scope_key)
+                elif isinstance(result, Exception):
+                    logger.warning(f'Measures of {comp_description["code"]} {scope_val} failed: {result}')
+                    result = None
+                if result is None:
+                    missing.append((comp_description['code'], scope_val))
+                    continue
+                yield comp_description, scope_val, result
+
+        for comp_description, scope_val, resp_measures_scope in (pipelined() if fetch_workers else requested()):
+            for station_id, l_station in dict_stations.items():
+                dict_data_scope = resp_measures_scope.get('data').get(station_id)
+                if dict_data_scope is None:
+                    continue
+                values_scope = ((key_ts, val_measure[2]) for (key_ts, val_measure) in dict_data_scope.items())
+                if compact:
+                    values_scope = ((sys.intern(key_ts), shared_values.setdefault((type(value), value), value))
+                                    for (key_ts, value) in values_scope)
+
+                if dict_stations_all.get(station_id) is None:
+                    dict_stations_all[station_id] = {key_ts: {comp_description.get('code'): {scope_val: value}}
+                                                     for (key_ts, value) in values_scope}
+                else:
 
-            for (scope_key, scope_val) in dict_scopes.items():
-                # get the measurements from all stations for the current component
-                resp_measures_scope = self.measures(date_from=date_from, time_from=time_from, date_to=date_to, time_to=time_to,
-                                                 scope=scope_key, component=comp_description['id'])
-                if sleeptime is not None:
-                    sleep(sleeptime)
-
-                for station_id, l_station in dict_stations.items():
-                    dict_data_scope = resp_measures_scope.get('data').get(station_id)
-
-                    if dict_stations_all.get(station_id) is None and dict_data_scope is not None:
-                        dict_stations_all[station_id] = {key_ts: {comp_description.get('code'): {scope_val: val_measure[2]}}
-                                                         for (key_ts, val_measure) in dict_data_scope.items()}
-                    elif dict_stations_all.get(station_id) is not None and dict_data_scope is not None:
-
-                        for (key_ts, val_measure) in dict_data_scope.items():
-                            # timestamp already in dictionary of this station
-                            if (dict_stations_all[station_id].get(key_ts)):
-                                if (dict_stations_all[station_id].get(key_ts).get(comp_description.get('code'))):
-                                    dict_stations_all[station_id][key_ts][comp_description.get('code')].update({scope_val: val_measure[2]})
-                                else:
-                                    dict_stations_all[station_id][key_ts].update({comp_description.get('code'): {scope_val: val_measure[2]}})
+                    for (key_ts, value) in values_scope:
+                        # timestamp already in dictionary of this station
+                        if (dict_stations_all[station_id].get(key_ts)):
+                            if (dict_stations_all[station_id].get(key_ts).get(comp_description.get('code'))):
+                                dict_stations_all[station_id][key_ts][comp_description.get('code')].update({scope_val: value})
                             else:
-                                dict_stations_all[station_id][key_ts] = {comp_description.get('code'): {scope_val: val_measure[2]}}
+                                dict_stations_all[station_id][key_ts].update({comp_description.get('code'): {scope_val: value}})
+                        else:
+                            dict_stations_all[station_id][key_ts] = {comp_description.get('code'): {scope_val: value}}
+
+        # transform dict to list after enrichment (lazy), a given sink receives the records instead of the list
+        emit = l_stations_all.append if sink is None else sink.write
+        count_before = None if sink is None else sink.count
+        for station_id in list(dict_stations_all):
+            # release the merged measures of the station once its records are emitted
+            dict_station = dict_stations_all.pop(station_id)
+            l_station = dict_stations.get(station_id)
+            if compact:
+                # one station object referenced by all rows of the station
+                station = StationMeasurement.from_station(None, station_id, l_station, None) if records else {
+                    'station_active_from': l_station[5], 'station_active_to': l_station[6],
+                    'station_lat': l_station[8], 'station_lon': l_station[7]}
+            for ts, measures in dict_station.items():
+                if records and compact:
+                    emit(StationMeasurement(parse_timestamp(ts), station_id, station.active_from, station.active_to,
+                                            station.lat, station.lon, measures))
+                elif records:
+                    emit(StationMeasurement.from_station(ts, station_id, l_station, measures))
+                elif compact:
+                    emit({'timestamp': ts, 'station_id': station_id, 'station': station, 'measures': measures})
+                else:
+                    emit({'timestamp': ts, 'station_id': station_id, 'station_active_from': l_station[5],
+                          'station_active_to': l_station[6], 'station_lat': l_station[8],
+                          'station_lon': l_station[7], 'measures': measures})
 
+        if sink is not None:
+            sink.flush()
+            count = sink.count - count_before
+            return count if deadline is None else PartialCount(count, missing)
+        return l_stations_all if deadline is None else PartialList(l_stations_all, missing)
 
+    def _scopes_pipeline(self, date_from, time_from, date_to, time_to, sleeptime, wait, workers):
+        """
+        Returns: Pipeline for the tasks of measures_stations (component, scope key, scope name or scopes, kind): a
+        fetch stage with the given number of threads requesting a raw scope or deriving the scopes of a component and
+        a decode stage. The threads share the sleeptime, so the requests start at least sleeptime apart like the ones
+        of a single thread. Clients coalescing or caching responses fetch the decoded responses (raw responses are not
+        shared).
+        """
+        decoded = self.coalesce or self.shared_cache is not None
+        throttle_lock = threading.Lock()
+        next_start = [monotonic()]
+
+        def throttle():
+            # the waiting thread holds the lock, the others queue up behind it
+            with throttle_lock:
+                delay = next_start[0] - monotonic()
+                if delay > 0:
+                    wait(delay)
+                next_start[0] = monotonic() + sleeptime
+
+        def fetch(task):
+            comp_description, scope_key, scope_val, kind = task
+            if kind == 'derived':
+                # merged from the scopes derived for the component
+                return None
+            if sleeptime is not None:
+                throttle()
+            if kind == 'derive':
+                return self._derive_scopes(scope_val, comp_description['id'], date_from, time_from, date_to, time_to)
+            return self.measures(date_from=date_from, time_from=time_from, date_to=date_to, time_to=time_to,
+                                 scope=scope_key, component=comp_description['id'], raw=not decoded)
+
+        def decode(result):
+            # the derived scopes and the responses of a coalescing or caching client are decoded already
+            return self._decode_measures(result) if isinstance(result, bytes) else result
+
+        return Pipeline().add_stage(fetch, workers=workers).add_stage(decode)
+
+    def _decode_measures(self, raw):
+        """
+        Returns: The response decoded from the raw response of measures(raw=True), the latest index is updated.
+        """
+        resp = json.loads(raw)
+        if self.latest is not None:
+            self.latest.update(resp)
+        return resp
 
+    def _derive_scopes(self, scopes, component, date_from, time_from, date_to, time_to):
+        """
+        Request the hourly means of a component and derive the given daily scopes from them.
+        The whole day before date_from is requested as well (from its first hour, whatever time_from is), so the
+        sliding mean is computed from 24 hours from the start. The hours before the requested start are dropped
+        again, the daily scopes keep the day of date_from.
 
-        # transform dict to list after enrichment (lazy)
-        for station_id, dict_station in dict_stations_all.items():
-            for ts, measures in dict_station.items():
-                 l_stations_all.append({'timestamp': ts, 'station_id': station_id, 'station_active_from': dict_stations.get(station_id)[5],
-                                   'station_active_to':  dict_stations.get(station_id)[6], 'station_lat': dict_stations.get(station_id)[8],
-                                   'station_lon': dict_stations.get(station_id)[7], 'measures': measures})
+        Returns: Dict scope id -> measures response like structure including the hourly means ('2').
+        """
+        from .uba_scopes import BASE_SCOPE, HOURLY_SCOPES, derive_scopes
+
+        date_from_base, time_from_base = date_from, time_from
+        if '6' in scopes:
+            date_from_base = (date.fromisoformat(date_from) - timedelta(days=1)).isoformat()
+            time_from_base = '1'
+        resp_base = self.measures(date_from=date_from_base, time_from=time_from_base, date_to=date_to,
+                                  time_to=time_to, scope=BASE_SCOPE, component=component)
+        resp_local = derive_scopes(resp_base, scopes)
+        if self.latest is not None:
+            for resp_derived in resp_local.values():
+                self.latest.update(resp_derived)
+        resp_local[BASE_SCOPE] = resp_base
+        if date_from_base != date_from:
+            # drop the additional hours again, the hourly keys are the start of the hour ending at time_from
+            start_hour = (datetime.fromisoformat(date_from) + timedelta(hours=int(time_from) - 1)).strftime(
+                '%Y-%m-%d %H:%M:%S')
+            for scope, resp in resp_local.items():
+                start = start_hour if scope in HOURLY_SCOPES else date_from
+                resp['data'] = {station_id: {key_ts: val for key_ts, val in dict_data.items() if key_ts >= start}
+                                for station_id, dict_data in resp['data'].items()}
+        return resp_local
+
+    def backfill(self, out_dir, date_from, date_to, components=None, scopes=('2',), manifest=None, processes=4,
+                 rate=1.0, window_days=7):
+        """
+        Run (or resume) a historical backfill of the measurements on a process pool.
+        The work is split into (component, scope, time window) tasks, every finished task is recorded in the manifest
+        so a rerun after a crash continues where it stopped. See UmweltbundesamtBackfill.
+        Args:
+            out_dir: Directory for the raw measures responses ('<component>_<scope>_<from>_<to>.json.gz').
+            date_from: First day as date or 'YYYY-MM-DD'.
+            date_to: Last day (included) as date or 'YYYY-MM-DD'.
+            components: OPTIONAL: A list with component ids or the response of components, all if None.
+            scopes: A list with scope ids.
+            manifest: OPTIONAL: Path of the manifest file, '<out_dir>/manifest.jsonl' by default.
+            processes: Number of worker processes.
+            rate: Maximum number of requests per second of all workers together (None for no limit).
+            window_days: Number of days per task.
+
+        Returns: Dict with the lists of the 'done', 'skipped' and 'failed' task ids.
+        """
+        from .backfill import UmweltbundesamtBackfill
 
-        return l_stations_all
+        if components is None:
+            components = self.components()
+        job = UmweltbundesamtBackfill(self.url, out_dir, manifest=manifest, processes=processes, rate=rate,
+                                      window_days=window_days,
+                                      client_kwargs={'timeout': self.timeout, 'verify_ssl': self.verify_ssl,
+                                                     'proxies': self.proxies, 'api_root': self.api_root,
+                                                     'api_version': self.api_version})
+        return job.run(components, date_from, date_to, scopes=scopes)
 
     def components(self, lang='en'):
         """
@@ -216,6 +517,9 @@ class UmweltbundesamtAPI(FedRepRestAPI):
             params['expand'] = expand
         return self.get(url, params=params)
 
+    # only the components are small enough to be hedged (see HedgePolicy), not the measures, meta data or stations
+    HEDGED_ENDPOINTS = r'(^|/)components/json$'
+
     JSON_SCHEMA_UMWELTBAMT_MEASURES = {
         'type': 'object',
         'properties': {
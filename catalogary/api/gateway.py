@@ -0,0 +1,315 @@
+####
+# Copyright 2023 burrizza
+######
+"""
+Local fan-out gateway: one process owns the NINA and Umweltbundesamt clients, keeps their data fresh and serves it
+to any number of local consumers over HTTP, so the upstream load does not grow with the number of consumers.
+
+Routes:
+    GET /                       -> JSON index with every snapshot, its version and age in seconds
+    GET /<group>/<name>         -> JSON snapshot (e.g. /nina/dwd, /uba/components), 503 if none is available yet
+    GET /events                 -> server-sent events, one 'change' event per changed snapshot
+
+Usage: python -m catalogary.api.gateway --port 8080
+"""
+import argparse
+import logging
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+
+from .refresher import NinaRefresher, SnapshotRefresher
+
+logger = logging.getLogger(__name__)
+
+
+class _Snapshot(object):
+    """Encoded snapshot, serialized once per change instead of once per consumer."""
+    __slots__ = ('body', 'version', 'etag')
+
+    def __init__(self, body, version):
+        self.body = body
+        self.version = version
+        self.etag = f'"{version}"'
+
+
+class Subscription(object):
+    """
+    Event stream of one consumer of a FanoutGateway (see FanoutGateway.subscribe), a consumer falling behind by more
+    than the queue size is closed.
+    """
+
+    def __init__(self, gateway, queue_size):
+        self._gateway = gateway
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get(self, timeout=None):
+        """
+        Wait for the next event.
+        Args:
+            timeout: OPTIONAL: Seconds to wait, queue.Empty is raised after them.
+
+        Returns: The encoded server-sent event or None once the subscription is closed.
+        """
+        if self.closed:
+            return None
+        event = self._queue.get(timeout=timeout)
+        return None if self.closed else event
+
+    def _offer(self, event):
+        """
+        Returns: False if the queue of the consumer is full.
+        """
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        """Stop receiving events, a consumer waiting in get receives None."""
+        self.closed = True
+        self._gateway._unsubscribe(self)
+        # wakes a waiting consumer, a full queue wakes it anyway
+        self._offer(None)
+
+
+class FanoutGateway(object):
+    """
+    HTTP gateway serving the snapshots of one or more SnapshotRefreshers to local consumers.
+    """
+
+    def __init__(self, refreshers, host='127.0.0.1', port=8080, subscriber_queue_size=100, keepalive=15):
+        """
+        Args:
+            refreshers: Dict group name -> SnapshotRefresher, e.g. {'nina': NinaRefresher(...)}.
+            host: The address to listen on (local only by default).
+            port: The port to listen on (0 for a free one).
+            subscriber_queue_size: Number of pending events per event stream, slower consumers are disconnected.
+            keepalive: Seconds between two keep-alive comments on the event streams.
+        """
+        self.refreshers = dict(refreshers)
+        self.subscriber_queue_size = subscriber_queue_size
+        self.keepalive = keepalive
+        self._snapshots = dict()
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._version = 0
+        self._thread = None
+        for group, refresher in self.refreshers.items():
+            refresher.add_listener(self._listener(group))
+            for name, data in refresher.snapshots().items():
+                self._publish(group, name, data)
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @classmethod
+    def for_clients(cls, nina=None, uba=None, nina_feeds=NinaRefresher.FEEDS, nina_interval=60, complete=False,
+                    uba_sources=None, uba_interval=3600, **kwargs):
+        """
+        Build a gateway owning one set of clients.
+        Args:
+            nina: OPTIONAL: The NinaAPI, its feeds are served as /nina/<feed> (and /nina/<feed>_complete).
+            uba: OPTIONAL: The UmweltbundesamtAPI, served as /uba/<name>.
+            nina_feeds: The NINA feeds to keep fresh.
+            nina_interval: Seconds between two refreshes of the NINA feeds.
+            complete: Also serve the generic_complete view of every NINA feed.
+            uba_sources: OPTIONAL: Dict name -> callable delivering the data of the Umweltbundesamt, by default the
+                components and the stations.
+            uba_interval: Seconds between two refreshes of the Umweltbundesamt sources.
+
+        Returns: The FanoutGateway (not started yet).
+        """
+        refreshers = dict()
+        if nina is not None:
+            refreshers['nina'] = NinaRefresher(nina, feeds=nina_feeds, interval=nina_interval, complete=complete,
+                                               name='catalogary-gateway-nina')
+        if uba is not None:
+            if uba_sources is None:
+                uba_sources = {'components': uba.components, 'stations': uba.stations}
+            refreshers['uba'] = SnapshotRefresher(uba_sources, interval=uba_interval, name='catalogary-gateway-uba')
+        return cls(refreshers, **kwargs)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        """Start the refreshers and serve on a background thread."""
+        for refresher in self.refreshers.values():
+            refresher.start()
+        self._thread = threading.Thread(target=self.server.serve_forever, name='catalogary-gateway', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Start the refreshers and serve on the current thread."""
+        for refresher in self.refreshers.values():
+            refresher.start()
+        self.server.serve_forever()
+
+    def stop(self):
+        """Stop serving, close the event streams and stop the refreshers."""
+        self.server.shutdown()
+        self.server.server_close()
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.close()
+        for refresher in self.refreshers.values():
+            refresher.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _listener(self, group):
+        def listener(name, data):
+            self._publish(group, name, data)
+        return listener
+
+    def _publish(self, group, name, data):
+        body = dumps(data, ensure_ascii=False, default=lambda obj: obj.to_dict()).encode('utf-8')
+        with self._lock:
+            self._version += 1
+            snapshot = self._snapshots[f'{group}/{name}'] = _Snapshot(body, self._version)
+            subscribers = list(self._subscribers)
+        event = dumps({'source': f'{group}/{name}', 'version': snapshot.version, 'updated_at': time.time()})
+        event = f'event: change\nid: {snapshot.version}\ndata: {event}\n\n'.encode('utf-8')
+        for subscriber in subscribers:
+            if not subscriber._offer(event):
+                logger.warning('Dropping a slow event stream consumer')
+                subscriber.close()
+
+    def subscribe(self):
+        """
+        Receive a 'change' event for every changed snapshot (like the consumers of /events).
+
+        Returns: The Subscription, close it when done (or use it as context manager).
+        """
+        subscriber = Subscription(self, self.subscriber_queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def _unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def index(self):
+        """
+        Returns: Dict source -> dict with the 'version' and the 'age' (seconds) of its snapshot.
+        """
+        with self._lock:
+            versions = {source: snapshot.version for source, snapshot in self._snapshots.items()}
+        index = dict()
+        for source, version in versions.items():
+            group, name = source.split('/', 1)
+            index[source] = {'version': version, 'age': self.refreshers[group].age(name)}
+        return index
+
+    def _handler(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            wbufsize = -1
+
+            def log_message(self, format, *args):
+                logger.debug(f'{self.address_string()} {format % args}')
+
+            def do_GET(self):
+                path = self.path.split('?', 1)[0].strip('/')
+                if path == '':
+                    self._send(200, dumps(gateway.index()).encode('utf-8'))
+                elif path == 'events':
+                    self._events()
+                else:
+                    with gateway._lock:
+                        snapshot = gateway._snapshots.get(path)
+                    if snapshot is None:
+                        status = 404 if path.split('/', 1)[0] not in gateway.refreshers else 503
+                        self._send(status, dumps({'error': f'No snapshot available for {path}'}).encode('utf-8'))
+                    elif self.headers.get('If-None-Match') == snapshot.etag:
+                        self._send(304, b'', etag=snapshot.etag)
+                    else:
+                        group, name = path.split('/', 1)
+                        age = gateway.refreshers[group].age(name)
+                        self._send(200, snapshot.body, etag=snapshot.etag, age=age)
+
+            def _send(self, status, body, etag=None, age=None):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                if etag is not None:
+                    self.send_header('ETag', etag)
+                if age is not None:
+                    self.send_header('X-Snapshot-Age', f'{age:.3f}')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _events(self):
+                subscriber = gateway.subscribe()
+                try:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.send_header('Cache-Control', 'no-cache')
+                    self.send_header('Connection', 'close')
+                    self.end_headers()
+                    self.wfile.flush()
+                    while True:
+                        try:
+                            event = subscriber.get(timeout=gateway.keepalive)
+                        except queue.Empty:
+                            event = b': keep-alive\n\n'
+                        if event is None:
+                            break
+                        self.wfile.write(event)
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    subscriber.close()
+                    self.close_connection = True
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local fan-out gateway for the NINA and Umweltbundesamt APIs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--nina-url', default='https://nina.api.proxy.bund.dev/')
+    parser.add_argument('--uba-url', default='https://umweltbundesamt.api.proxy.bund.dev/api/air_data/')
+    parser.add_argument('--nina-interval', type=float, default=60)
+    parser.add_argument('--uba-interval', type=float, default=3600)
+    parser.add_argument('--complete', action='store_true', help='also serve the complete view of the NINA feeds')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    from .fedrep_nina import NinaAPI
+    from .fedrep_umweltbundesamt import UmweltbundesamtAPI
+    gateway = FanoutGateway.for_clients(nina=NinaAPI(args.nina_url), uba=UmweltbundesamtAPI(args.uba_url),
+                                        nina_interval=args.nina_interval, uba_interval=args.uba_interval,
+                                        complete=args.complete, host=args.host, port=args.port)
+    logger.info(f'Serving on {gateway.url}')
+    try:
+        gateway.serve_forever()
+    except KeyboardInterrupt:
+        gateway.stop()
+
+
+if __name__ == '__main__':
+    main()
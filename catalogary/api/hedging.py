@@ -0,0 +1,152 @@
+####
+# Copyright 2023 burrizza
+######
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from .deadline import current_deadline
+
+logger = logging.getLogger(__name__)
+
+
+class HedgePolicy(object):
+    """
+    Hedged requests for idempotent GETs of one or more clients (FedRepRestAPI): if a request did not answer within
+    the given percentile of the recent latencies, a second identical request is sent (on another pooled connection)
+    and the first answer wins. The hedges are paid from a budget which grows by the given fraction per request, so
+    they add at most that fraction of extra load. All attempts run on a bounded pool of reused threads, while it is
+    saturated the requests are sent unhedged on the calling thread.
+    Hedging is opt-in: the clients only hedge the GETs of their HEDGED_ENDPOINTS (small responses) or of calls with
+    get(..., hedge=True), so large responses (e.g. measures, geojsons) are never downloaded twice.
+    """
+
+    def __init__(self, percentile=95, initial_delay=0.5, min_delay=0.01, budget=0.05, max_tokens=10, window=200,
+                 min_samples=20, max_workers=16):
+        """
+        Args:
+            percentile: The percentile of the recent latencies after which a hedge is sent.
+            initial_delay: Seconds to wait before a hedge until min_samples latencies were observed.
+            min_delay: Seconds to wait at least before a hedge.
+            budget: Fraction of the requests which may be hedged (e.g. 0.05 for at most 5% extra requests).
+            max_tokens: Maximum number of hedges which can be saved up for a burst of slow requests.
+            window: Number of recent latencies the percentile is computed from.
+            min_samples: Number of latencies needed before the percentile is used.
+            max_workers: Number of threads sending the attempts (first requests and hedges).
+        """
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.budget = budget
+        self.max_tokens = max_tokens
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._tokens = float(max_tokens)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='catalogary-hedge')
+        # a slot per thread, so a submitted attempt never waits in the queue of the executor
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def delay(self):
+        """
+        Returns: Seconds to wait for the first request before a hedge is sent.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return max(self.min_delay, self.initial_delay)
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))
+        return max(self.min_delay, latencies[index])
+
+    def _take_token(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.hedges += 1
+            return True
+
+    def _attempt(self, fetch, future, record, pooled=True):
+        start = time.monotonic()
+        try:
+            result = fetch()
+        except BaseException as e:
+            future.set_exception(e)
+            return
+        finally:
+            if pooled:
+                self._slots.release()
+        if record:
+            with self._lock:
+                self._latencies.append(time.monotonic() - start)
+        future.set_result(result)
+
+    def _submit(self, fetch, record):
+        """
+        Returns: Future of an attempt sent by a thread of the pool (a slot must have been taken).
+        """
+        future = Future()
+        # every attempt runs in its own copy of the context (e.g. the priority of the caller)
+        self._executor.submit(contextvars.copy_context().run, self._attempt, fetch, future, record)
+        return future
+
+    def run(self, fetch):
+        """
+        Call fetch and hedge it if it is slow.
+        Args:
+            fetch: Callable (without arguments) sending the request and delivering its result.
+
+        Returns: The result of the first successful attempt (the error of the first attempt if all failed).
+        """
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(float(self.max_tokens), self._tokens + self.budget)
+        # the first attempt runs on a thread of the pool, so the caller is free to take the answer of a hedge. It is
+        # never queued: while the pool is saturated it is sent unhedged on the calling thread.
+        if not self._slots.acquire(blocking=False):
+            primary = Future()
+            self._attempt(fetch, primary, True, pooled=False)
+            return primary.result()
+        primary = self._submit(fetch, True)
+        done, _ = wait([primary], timeout=self.delay())
+        deadline = current_deadline.get()
+        # a hedge sent after the deadline of the request (see Deadline) could not answer in time
+        if done or (deadline is not None and deadline.expired):
+            return primary.result()
+        # while no thread is free the hedge is skipped instead of adding load
+        if not self._slots.acquire(blocking=False):
+            return primary.result()
+        if not self._take_token():
+            self._slots.release()
+            return primary.result()
+        logger.debug('Sending a hedged request')
+        hedge = self._submit(fetch, False)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in (primary, hedge):
+                if future in done and future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    # the slower attempt keeps running, its result is discarded
+                    return future.result()
+        return primary.result()
+
+    def stats(self):
+        """
+        Returns: Dict with the number of 'requests', 'hedges', hedges which answered first ('hedge_wins') and the
+        current hedge 'delay' in seconds.
+        """
+        return {'requests': self.requests, 'hedges': self.hedges, 'hedge_wins': self.hedge_wins,
+                'delay': self.delay()}
+
+    def close(self):
+        """Stop the threads (running attempts are finished)."""
+        self._executor.shutdown(wait=False)
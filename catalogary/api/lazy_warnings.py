@@ -0,0 +1,212 @@
+####
+# Copyright 2023 burrizza
+######
+import contextvars
+import logging
+import threading
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PARTS = ('detail', 'geo')
+# keys of a completed warning (see NinaAPI.generic_complete) -> lazily fetched part
+ENTRY_KEYS = {'warning_detail': 'detail', 'warning_geo': 'geo'}
+
+
+class LazyWarning(object):
+    """
+    A warning of a NINA feed whose detail and geojson are requested on first access and memoized, see
+    NinaAPI.lazy_complete. Reading 'warning', 'warning_detail' or 'warning_geo' like on a completed warning (dict)
+    works as well, concurrent accesses (e.g. by a prefetch) share one request.
+    """
+    __slots__ = ('resp', '_nina', '_selection', '_records', '_fields', '_futures', '_lock')
+
+    def __init__(self, nina, resp, selection=None, records=False, detail_fields=None, geo_fields=None):
+        """
+        Args:
+            nina: The NinaAPI used for the requests.
+            resp: One warning of the response of a NINA feed.
+            selection: OPTIONAL: The selection of generic_complete.
+            records: OPTIONAL: Deliver the detail as WarningDetail and complete to a NinaWarning record.
+            detail_fields: OPTIONAL: The selected fields of the detail (see NinaAPI._plan_selection).
+            geo_fields: OPTIONAL: The selected fields of the geojson.
+        """
+        self.resp = resp
+        self._nina = nina
+        self._selection = selection
+        self._records = records
+        self._fields = {'detail': detail_fields, 'geo': geo_fields}
+        self._futures = dict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        loaded = [part for part in PARTS if self.loaded(part)]
+        return f'LazyWarning(id={self.id!r}, loaded={loaded!r})'
+
+    def __getitem__(self, key):
+        if key == 'warning':
+            return self.warning
+        if key in ENTRY_KEYS:
+            return self._get(ENTRY_KEYS[key])
+        raise KeyError(key)
+
+    def keys(self):
+        return ['warning', 'warning_detail', 'warning_geo']
+
+    @property
+    def id(self):
+        return self.resp.get('id')
+
+    @property
+    def warning(self):
+        """
+        Returns: The warning of the feed (reduced to the selection).
+        """
+        if self._selection is None or self._records:
+            return self.resp
+        return {key: self.resp[key] for key in self.resp.keys() if key in self._selection}
+
+    @property
+    def detail(self):
+        """
+        Returns: The detail of the warning, requested on first access.
+        """
+        return self._get('detail')
+
+    @property
+    def geo(self):
+        """
+        Returns: The geojson of the warning, requested on first access.
+        """
+        return self._get('geo')
+
+    def loaded(self, part):
+        """
+        Returns: True if the part ('detail' or 'geo') was fetched successfully.
+        """
+        future = self._futures.get(part)
+        return future is not None and future.done() and future.exception() is None
+
+    def complete(self):
+        """
+        Returns: The completed warning as returned by NinaAPI.generic_complete (a dict or a NinaWarning record).
+        """
+        from .records import NinaWarning
+        if self._records:
+            return NinaWarning.from_dict(self.resp, detail=self.detail, geo=self.geo)
+        return {'warning': self.warning, 'warning_detail': self.detail, 'warning_geo': self.geo}
+
+    def _claim(self, part):
+        """
+        Returns: Tuple with the future of the part and whether the caller has to fetch it.
+        """
+        with self._lock:
+            future = self._futures.get(part)
+            if future is not None:
+                return future, False
+            future = self._futures[part] = Future()
+            return future, True
+
+    def _fetch(self, part, future):
+        try:
+            future.set_result(self._nina._enrichment(self.id, part, self._selection, self._records,
+                                                     self._fields[part]))
+        except BaseException as e:
+            # a failed request is not memoized, the next access tries again
+            with self._lock:
+                self._futures.pop(part, None)
+            future.set_exception(e)
+
+    def _get(self, part):
+        future, fetch = self._claim(part)
+        if fetch:
+            self._fetch(part, future)
+        return future.result()
+
+    def _prefetch(self, part, executor):
+        future, fetch = self._claim(part)
+        if fetch:
+            executor.submit(contextvars.copy_context().run, self._fetch, part, future)
+
+
+class LazyWarnings(list):
+    """
+    List of LazyWarning (see NinaAPI.lazy_complete) with a hint to fetch the enrichments of the items a consumer is
+    about to use in the background. With a lookahead, iterating prefetches the following items.
+    """
+
+    def __init__(self, iterable=(), lookahead=0, max_workers=8, parts=PARTS):
+        """
+        Args:
+            iterable: The LazyWarning objects.
+            lookahead: OPTIONAL: Number of items prefetched ahead of the iteration (0 to disable).
+            max_workers: Maximum number of concurrent prefetch requests.
+            parts: The parts ('detail', 'geo') to prefetch.
+        """
+        super(LazyWarnings, self).__init__(iterable)
+        self.lookahead = lookahead
+        self.max_workers = max_workers
+        self.parts = tuple(parts)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._finalizer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self):
+        if not self.lookahead:
+            return super(LazyWarnings, self).__iter__()
+        return self._iter_prefetched()
+
+    def _iter_prefetched(self):
+        prefetched = 0
+        for position in range(len(self)):
+            # keep the current item and the next lookahead items requested
+            self.prefetch(prefetched, position + 1 + self.lookahead)
+            prefetched = position + 1 + self.lookahead
+            yield self[position]
+
+    def prefetch(self, start=0, stop=None, parts=None):
+        """
+        Start fetching the enrichments of the given items in the background, accessing them later waits for the
+        running requests instead of sending new ones.
+        Args:
+            start: Position of the first item.
+            stop: OPTIONAL: Position after the last item (the end if None).
+            parts: OPTIONAL: The parts ('detail', 'geo') to prefetch, see parts if None.
+
+        Returns: The number of items.
+        """
+        items = super(LazyWarnings, self).__getitem__(slice(start, stop))
+        if not items:
+            return 0
+        executor = self._get_executor()
+        for item in items:
+            for part in parts or self.parts:
+                item._prefetch(part, executor)
+        return len(items)
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='catalogary-prefetch')
+                # stops the threads if the list is dropped without close
+                self._finalizer = weakref.finalize(self, self._executor.shutdown, wait=False)
+            return self._executor
+
+    def close(self):
+        """
+        Stop the prefetch threads (running requests are finished).
+        """
+        with self._executor_lock:
+            if self._executor is not None:
+                self._finalizer.detach()
+                self._executor.shutdown(wait=True)
+                self._executor = None
+                self._finalizer = None
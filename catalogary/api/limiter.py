@@ -0,0 +1,108 @@
+####
+# Copyright 2023 burrizza
+######
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# responses telling the client to slow down
+OVERLOAD_STATUS = frozenset((429, 503))
+
+
+class AdaptiveLimiter(object):
+    """
+    Adaptive concurrency limit (AIMD) for the requests of one or more clients (FedRepRestAPI).
+    While the latency stays stable and the limit is actually used, it grows by one per limit responses (additive
+    increase). On 429 / 503 responses, timeouts or latency spikes it is cut by the decrease factor (multiplicative
+    decrease). Signals of requests started before the last cut are ignored, so a burst of failures cuts only once.
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=64, decrease=0.5, latency_tolerance=2.0, smoothing=0.05):
+        """
+        Args:
+            initial: The limit to start with.
+            min_limit: The limit is never cut below this.
+            max_limit: The limit never grows above this.
+            decrease: Factor the limit is multiplied with on overload.
+            latency_tolerance: A response slower than this multiple of the baseline latency counts as overload.
+            smoothing: Weight of a new latency in the baseline (exponentially weighted moving average).
+        """
+        if not 0 < decrease < 1:
+            raise ValueError('decrease has to be between 0 and 1')
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise ValueError('The limits have to satisfy 1 <= min_limit <= initial <= max_limit')
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._baseline = None
+        self._last_decrease = 0.0
+        self._decreases = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        """The current number of requests allowed to run at the same time."""
+        return int(self._limit)
+
+    def acquire(self, timeout=None):
+        """
+        Block until the request may run.
+        Args:
+            timeout: OPTIONAL: Maximum seconds to wait.
+
+        Returns: The start time to pass to release, None if the timeout expired first (the request must not run then).
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            self._in_flight += 1
+        return time.monotonic()
+
+    def release(self, start, overload=False, ok=True):
+        """
+        Free the slot of a finished request and adapt the limit.
+        Args:
+            start: The start time returned by acquire.
+            overload: The request failed with a sign of overload (429 / 503 or a timeout).
+            ok: The request succeeded, its latency is used (failures without overload leave the limit as it is).
+        """
+        now = time.monotonic()
+        latency = now - start
+        with self._cond:
+            # the limit is only raised while at least half of it is used
+            saturated = self._in_flight * 2 >= int(self._limit)
+            self._in_flight -= 1
+            if ok and not overload:
+                if self._baseline is None:
+                    self._baseline = latency
+                spike = latency > self._baseline * self.latency_tolerance
+                self._baseline += self.smoothing * (latency - self._baseline)
+                overload = spike
+            if overload:
+                if start >= self._last_decrease:
+                    self._limit = max(float(self.min_limit), self._limit * self.decrease)
+                    self._last_decrease = now
+                    self._decreases += 1
+                    logger.debug(f'Concurrency limit decreased to {self.limit} (latency {latency:.3f}s)')
+            elif ok and saturated and self._limit < self.max_limit:
+                self._limit = min(float(self.max_limit), self._limit + 1 / self._limit)
+            self._cond.notify_all()
+
+    def stats(self):
+        """
+        Returns: Dict with the current 'limit', the requests 'in_flight', the 'baseline' latency in seconds and the
+        number of 'decreases'.
+        """
+        with self._cond:
+            return {'limit': int(self._limit), 'in_flight': self._in_flight, 'baseline': self._baseline,
+                    'decreases': self._decreases}
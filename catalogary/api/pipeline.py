@@ -0,0 +1,212 @@
+####
+# Copyright 2023 burrizza
+######
+import contextvars
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# seconds between two checks for an abort while a thread is blocked on a queue
+POLL_INTERVAL = 0.05
+# marks the end of the items in a queue
+_END = object()
+
+
+class _Envelope(object):
+    """An item on its way through the stages."""
+    __slots__ = ('seq', 'item', 'value', 'error')
+
+    def __init__(self, seq, item):
+        self.seq = seq
+        self.item = item
+        self.value = item
+        self.error = None
+
+
+class Stage(object):
+    """
+    One step of a Pipeline, func is called with the result of the previous stage by workers threads.
+    """
+
+    def __init__(self, func, workers=1, name=None):
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.name = name or getattr(func, '__name__', 'stage')
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def _account(self, seconds):
+        with self._lock:
+            self.items += 1
+            self.busy += seconds
+
+
+class Pipeline(object):
+    """
+    Staged pipeline (e.g. fetch -> decode -> merge -> sink) connected by bounded queues. Every stage runs on its own
+    threads, so the requests of some items overlap with the decoding of others and the calling thread consuming the
+    results (merging them or writing them to a sink) never waits for a single request. A full queue blocks the
+    stages before it (backpressure), so at most max_in_flight items are held at once and the throughput approaches
+    the one of the slowest stage. The stage threads inherit the context (e.g. priority class, deadline) of the caller.
+    """
+
+    def __init__(self, queue_size=8, name='catalogary-pipeline'):
+        """
+        Args:
+            queue_size: Maximum number of items waiting in front of every stage.
+            name: Prefix of the names of the stage threads.
+        """
+        self.queue_size = queue_size
+        self.name = name
+        self.stages = list()
+
+    def add_stage(self, func, workers=1, name=None):
+        """
+        Append a stage.
+        Args:
+            func: Callable receiving the result of the previous stage (the item for the first stage).
+            workers: Number of threads of the stage (e.g. the concurrent requests of a fetch stage).
+            name: OPTIONAL: Name of the stage (the name of func if None).
+
+        Returns: The Pipeline (to chain the calls).
+        """
+        self.stages.append(Stage(func, workers=workers, name=name))
+        return self
+
+    @property
+    def max_in_flight(self):
+        """
+        Returns: Maximum number of items between entering the first stage and being consumed.
+        """
+        return self.queue_size * (len(self.stages) + 1) + sum(stage.workers for stage in self.stages)
+
+    def stats(self):
+        """
+        Returns: Dict stage name -> dict with the number of threads, processed items and busy seconds, the stage with
+        the most busy seconds per thread limits the throughput.
+        """
+        return {stage.name: {'workers': stage.workers, 'items': stage.items, 'busy': stage.busy}
+                for stage in self.stages}
+
+    def run(self, items, ordered=True, return_exceptions=False):
+        """
+        Pass the items through all stages.
+        Args:
+            items: An iterable with the items, consumed by a background thread as the pipeline has room.
+            ordered: OPTIONAL: Yield the results in the order of the items (held back results count as in flight).
+            return_exceptions: OPTIONAL: Yield the exception of an item failing in a stage as its result instead of
+                raising it (and stopping the pipeline).
+
+        Yields: Tuples (item, result).
+        """
+        abort = threading.Event()
+        in_flight = threading.Semaphore(self.max_in_flight)
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        feed_errors = list()
+        threads = [threading.Thread(target=contextvars.copy_context().run, name=f'{self.name}-feed', daemon=True,
+                                    args=(self._feed, items, queues[0], in_flight, abort, feed_errors))]
+        for position, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            for worker in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=contextvars.copy_context().run, name=f'{self.name}-{stage.name}-{worker}', daemon=True,
+                    args=(self._work, stage, queues[position], queues[position + 1], remaining, abort)))
+        for thread in threads:
+            thread.start()
+
+        try:
+            pending = dict()
+            next_seq = 0
+            while True:
+                envelope = queues[-1].get()
+                if envelope is _END:
+                    break
+                if not ordered:
+                    in_flight.release()
+                    yield self._result(envelope, return_exceptions)
+                    continue
+                pending[envelope.seq] = envelope
+                while next_seq in pending:
+                    envelope = pending.pop(next_seq)
+                    next_seq += 1
+                    in_flight.release()
+                    yield self._result(envelope, return_exceptions)
+            if feed_errors:
+                raise feed_errors[0]
+        finally:
+            # also stops the threads if the consumer quits early
+            abort.set()
+            for thread in threads:
+                thread.join()
+
+    @staticmethod
+    def _result(envelope, return_exceptions):
+        if envelope.error is not None and not return_exceptions:
+            raise envelope.error
+        return envelope.item, envelope.value if envelope.error is None else envelope.error
+
+    @staticmethod
+    def _put(target, value, abort):
+        """
+        Returns: False if the pipeline was aborted while waiting for room.
+        """
+        while True:
+            try:
+                target.put(value, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                if abort.is_set():
+                    return False
+
+    @staticmethod
+    def _get(source, abort):
+        """
+        Returns: The next value or None if the pipeline was aborted while waiting.
+        """
+        while True:
+            try:
+                return source.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if abort.is_set():
+                    return None
+
+    def _feed(self, items, target, in_flight, abort, feed_errors):
+        try:
+            for seq, item in enumerate(items):
+                while not in_flight.acquire(timeout=POLL_INTERVAL):
+                    if abort.is_set():
+                        return
+                if not self._put(target, _Envelope(seq, item), abort):
+                    return
+        except Exception as e:
+            logger.warning(f'Pipeline input failed: {e}')
+            feed_errors.append(e)
+        self._put(target, _END, abort)
+
+    def _work(self, stage, source, target, remaining, abort):
+        while True:
+            envelope = self._get(source, abort)
+            if envelope is None:
+                return
+            if envelope is _END:
+                # leave the end for the other threads of the stage, the last one passes it on
+                self._put(source, _END, abort)
+                with stage._lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    self._put(target, _END, abort)
+                return
+            if envelope.error is None:
+                start = time.perf_counter()
+                try:
+                    envelope.value = stage.func(envelope.value)
+                except Exception as e:
+                    envelope.error = e
+                stage._account(time.perf_counter() - start)
+            if not self._put(target, envelope, abort):
+                return
@@ -0,0 +1,226 @@
+####
+# Copyright 2023 burrizza
+######
+import logging
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=65536)
+def parse_timestamp(value):
+    """
+    Convert a timestamp string of the NINA or Umweltbundesamt API to a unix timestamp.
+    ISO 8601 strings with offset (NINA) keep their offset, naive ones (Umweltbundesamt, 'YYYY-MM-DD HH:MM:SS' or
+    'YYYY-MM-DD') are read as UTC. The Umweltbundesamt hour '24:00:00' is the midnight of the following day.
+    Args:
+        value: The timestamp string (None is passed through).
+
+    Returns: Float with the seconds since epoch or None.
+    """
+    if value is None or value == '':
+        return None
+    shift = timedelta(0)
+    if value[11:13] == '24':
+        value = f'{value[:11]}00{value[13:]}'
+        shift = timedelta(days=1)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        logger.warning(f'Unable to parse timestamp {value}')
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return (parsed + shift).timestamp()
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Record(object):
+    """
+    Base class for the compact record types. Fields are stored in __slots__ instead of a per-record dict.
+    Records compare by their fields but are mutable, so they are deliberately unhashable (use e.g. the id as key).
+    """
+    __slots__ = ()
+    __hash__ = None
+
+    def to_dict(self):
+        """
+        Returns: Dict with all fields of the record.
+        """
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        fields = ', '.join(f'{field}={getattr(self, field)!r}' for field in self.__slots__[:3])
+        return f'{type(self).__name__}({fields}, ...)'
+
+
+class NinaWarning(_Record):
+    """
+    Compact warning of a NINA feed (mapData.json). Dates are unix timestamps, the detail and geo fields are filled by
+    NinaAPI.generic_complete(records=True).
+    """
+    __slots__ = ('id', 'version', 'urgency', 'start', 'expires', 'severity', 'type', 'title', 'trans_keys',
+                 'detail', 'geo')
+
+    def __init__(self, id, version=None, urgency=None, start=None, expires=None, severity=None, type=None,
+                 title=None, trans_keys=None, detail=None, geo=None):
+        self.id = id
+        self.version = version
+        self.urgency = urgency
+        self.start = start
+        self.expires = expires
+        self.severity = severity
+        self.type = type
+        self.title = title
+        self.trans_keys = trans_keys
+        self.detail = detail
+        self.geo = geo
+
+    @classmethod
+    def from_dict(cls, resp, detail=None, geo=None):
+        """
+        Args:
+            resp: One warning of the response of a NINA feed.
+            detail: OPTIONAL: The WarningDetail of the warning.
+            geo: OPTIONAL: The geojson of the warning.
+
+        Returns: The parsed NinaWarning.
+        """
+        return cls(id=resp.get('id'), version=resp.get('version'), urgency=resp.get('urgency'),
+                   start=parse_timestamp(resp.get('startDate')), expires=parse_timestamp(resp.get('expiresDate')),
+                   severity=resp.get('severity'), type=resp.get('type'), title=resp.get('i18nTitle'),
+                   trans_keys=resp.get('transKeys'), detail=detail, geo=geo)
+
+
+class WarningArea(_Record):
+    """
+    Area of a warning info with its description and geocodes (mostly the regional keys (ARS)).
+    """
+    __slots__ = ('description', 'geocodes')
+
+    def __init__(self, description=None, geocodes=()):
+        self.description = description
+        self.geocodes = geocodes
+
+    @classmethod
+    def from_dict(cls, resp):
+        return cls(description=resp.get('areaDesc'),
+                   geocodes=tuple(geocode.get('value') for geocode in resp.get('geocode', ())))
+
+
+class WarningInfo(_Record):
+    """
+    One (language specific) info block of a warning detail.
+    """
+    __slots__ = ('language', 'category', 'event', 'urgency', 'severity', 'certainty', 'headline', 'description',
+                 'instruction', 'onset', 'expires', 'areas')
+
+    def __init__(self, language=None, category=None, event=None, urgency=None, severity=None, certainty=None,
+                 headline=None, description=None, instruction=None, onset=None, expires=None, areas=()):
+        self.language = language
+        self.category = category
+        self.event = event
+        self.urgency = urgency
+        self.severity = severity
+        self.certainty = certainty
+        self.headline = headline
+        self.description = description
+        self.instruction = instruction
+        self.onset = onset
+        self.expires = expires
+        self.areas = areas
+
+    @classmethod
+    def from_dict(cls, resp):
+        return cls(language=resp.get('language'), category=resp.get('category'), event=resp.get('event'),
+                   urgency=resp.get('urgency'), severity=resp.get('severity'), certainty=resp.get('certainty'),
+                   headline=resp.get('headline'), description=resp.get('description'),
+                   instruction=resp.get('instruction'), onset=parse_timestamp(resp.get('onset')),
+                   expires=parse_timestamp(resp.get('expires')),
+                   areas=tuple(WarningArea.from_dict(area) for area in resp.get('area', ())))
+
+
+class WarningDetail(_Record):
+    """
+    Compact detail of a warning (warnings/{id}.json) with parsed info blocks and areas.
+    """
+    __slots__ = ('identifier', 'sender', 'sent', 'status', 'msg_type', 'scope', 'references', 'code', 'incidents',
+                 'info')
+
+    def __init__(self, identifier, sender=None, sent=None, status=None, msg_type=None, scope=None, references=None,
+                 code=(), incidents=None, info=()):
+        self.identifier = identifier
+        self.sender = sender
+        self.sent = sent
+        self.status = status
+        self.msg_type = msg_type
+        self.scope = scope
+        self.references = references
+        self.code = code
+        self.incidents = incidents
+        self.info = info
+
+    @classmethod
+    def from_dict(cls, resp):
+        """
+        Args:
+            resp: The response of NinaAPI.warning_detail.
+
+        Returns: The parsed WarningDetail.
+        """
+        return cls(identifier=resp.get('identifier'), sender=resp.get('sender'),
+                   sent=parse_timestamp(resp.get('sent')), status=resp.get('status'), msg_type=resp.get('msgType'),
+                   scope=resp.get('scope'), references=resp.get('references'), code=tuple(resp.get('code', ())),
+                   incidents=resp.get('incidents'),
+                   info=tuple(WarningInfo.from_dict(info) for info in resp.get('info', ())))
+
+    @property
+    def geocodes(self):
+        """
+        Returns: Set with the geocodes of all areas of all info blocks.
+        """
+        return {geocode for info in self.info for area in info.areas for geocode in area.geocodes}
+
+
+class StationMeasurement(_Record):
+    """
+    Compact measurement of a station at one timestamp as delivered by UmweltbundesamtAPI.measures_stations.
+    The measures are a dict component code -> scope -> value.
+    """
+    __slots__ = ('timestamp', 'station_id', 'active_from', 'active_to', 'lat', 'lon', 'measures')
+
+    def __init__(self, timestamp, station_id, active_from=None, active_to=None, lat=None, lon=None, measures=None):
+        self.timestamp = timestamp
+        self.station_id = station_id
+        self.active_from = active_from
+        self.active_to = active_to
+        self.lat = lat
+        self.lon = lon
+        self.measures = measures
+
+    @classmethod
+    def from_station(cls, ts, station_id, l_station, measures):
+        """
+        Args:
+            ts: The timestamp key of the measurement.
+            station_id: The id of the station.
+            l_station: The station list of the meta response.
+            measures: Dict component code -> scope -> value.
+
+        Returns: The parsed StationMeasurement.
+        """
+        return cls(timestamp=parse_timestamp(ts), station_id=station_id, active_from=parse_timestamp(l_station[5]),
+                   active_to=parse_timestamp(l_station[6]), lat=_float(l_station[8]), lon=_float(l_station[7]),
+                   measures=measures)
@@ -0,0 +1,186 @@
+####
+# Copyright 2023 burrizza
+######
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotRefresher(object):
+    """
+    Keeps in-memory snapshots of several sources fresh using a background thread (stale-while-revalidate).
+    Readers always get the current snapshot immediately and never wait for the network. If a source fails, the last
+    good snapshot is kept and the error is remembered.
+    """
+
+    def __init__(self, sources, interval=60, name='catalogary-refresher'):
+        """
+        Args:
+            sources: A dict with the name of every snapshot and the callable (without arguments) delivering its data.
+            interval: Seconds between two refresh rounds.
+            name: Name of the background thread.
+        """
+        self.sources = dict(sources)
+        self.interval = interval
+        self.name = name
+        self._snapshots = dict()
+        self._updated = dict()
+        self._errors = dict()
+        self._listeners = list()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """Start the background thread (the first refresh round starts immediately)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stop the background thread and wait for the running round to finish."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+    def refresh(self, name=None):
+        """
+        Fetch the given source (or all sources) synchronously and replace the snapshots on success.
+        Args:
+            name: OPTIONAL: The name of the source to refresh, all sources if None.
+
+        Returns: True if all refreshed sources succeeded.
+        """
+        names = list(self.sources) if name is None else [name]
+        succeeded = True
+        for source_name in names:
+            if self._stop.is_set() and name is None:
+                break
+            try:
+                data = self.sources[source_name]()
+            except Exception as e:
+                logger.warning(f'Refresh of {source_name} failed, keeping the last snapshot: {e}')
+                with self._lock:
+                    self._errors[source_name] = e
+                succeeded = False
+                continue
+            with self._lock:
+                changed = source_name not in self._snapshots or self._snapshots[source_name] != data
+                self._snapshots[source_name] = data
+                self._updated[source_name] = (time.monotonic(), time.time())
+                self._errors.pop(source_name, None)
+            if changed:
+                self._notify(source_name, data)
+        return succeeded
+
+    def add_listener(self, callback):
+        """
+        Register a callable which is called with the name and the data of a snapshot whenever its content changed.
+        It runs on the refresh thread, so it should return quickly.
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        """Unregister a callable registered by add_listener."""
+        self._listeners.remove(callback)
+
+    def _notify(self, name, data):
+        for callback in list(self._listeners):
+            try:
+                callback(name, data)
+            except Exception as e:
+                logger.error(f'Listener of {name} failed: {e}')
+
+    def snapshot(self, name, default=None):
+        """
+        Returns: The last good snapshot of the given source or default if none is available yet.
+        """
+        with self._lock:
+            return self._snapshots.get(name, default)
+
+    def snapshots(self):
+        """
+        Returns: Dict with the last good snapshot of every source which succeeded at least once.
+        """
+        with self._lock:
+            return dict(self._snapshots)
+
+    def age(self, name):
+        """
+        Returns: Seconds since the last successful refresh of the given source or None if it never succeeded.
+        """
+        with self._lock:
+            updated = self._updated.get(name)
+        if updated is None:
+            return None
+        return time.monotonic() - updated[0]
+
+    def ages(self):
+        """
+        Returns: Dict with the staleness in seconds of every source (None if it never succeeded).
+        """
+        return {name: self.age(name) for name in self.sources}
+
+    def updated_at(self, name):
+        """
+        Returns: Unix timestamp of the last successful refresh of the given source or None.
+        """
+        with self._lock:
+            updated = self._updated.get(name)
+        return None if updated is None else updated[1]
+
+    def last_error(self, name):
+        """
+        Returns: The exception of the last refresh if it failed, otherwise None.
+        """
+        with self._lock:
+            return self._errors.get(name)
+
+
+class NinaRefresher(SnapshotRefresher):
+    """
+    Background refresher for the NINA warning feeds and optionally their enriched generic_complete view.
+    The complete view of a feed is named '<feed>_complete' and is built from the feed snapshot of the same round.
+    """
+    FEEDS = ('mowas', 'katwarn', 'dwd', 'biwapp', 'police', 'lhp')
+
+    def __init__(self, nina, feeds=FEEDS, interval=60, complete=False, selection=None, **kwargs):
+        """
+        Args:
+            nina: The NinaAPI instance used for the requests.
+            feeds: The feeds to keep fresh (see FEEDS).
+            interval: Seconds between two refresh rounds.
+            complete: Also keep the generic_complete view of every feed fresh.
+            selection: A list with a selection of the toplevel fields of interest for the complete view.
+        """
+        self.nina = nina
+        sources = dict()
+        for feed in feeds:
+            sources[feed] = getattr(nina, f'{feed}_warnings')
+            if complete:
+                sources[f'{feed}_complete'] = self._complete_source(feed, selection)
+        super(NinaRefresher, self).__init__(sources, interval=interval, **kwargs)
+
+    def _complete_source(self, feed, selection):
+        def source():
+            resp_warnings = self.snapshot(feed)
+            if resp_warnings is None:
+                raise LookupError(f'No snapshot of {feed} available yet')
+            return self.nina.generic_complete(resp_warnings, selection=selection)
+        return source
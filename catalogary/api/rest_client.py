@@ -2,15 +2,53 @@
 # Modifications copyright 2023 burrizza
 # Copyright 2014 Mateusz Harasymczuk, Gonchik Tsymzhitov (atlassian-api)
 ######
+import functools
 import logging
+import re
+import threading
 import urllib.parse
+from contextlib import contextmanager
 from json import dumps
 
-import requests
+from .deadline import current_deadline
+from .limiter import OVERLOAD_STATUS
+from .scheduler import current_priority
+from .transport import TRANSPORTS, RequestsTransport
 
 logger = logging.getLogger(__name__)
 
 
+def default_priority(priority):
+    """
+    Decorator running all requests of a client method with the given priority class of the scheduler, unless the
+    caller already set one (see FedRepRestAPI.priority).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if current_priority.get() is not None:
+                return func(*args, **kwargs)
+            token = current_priority.set(priority)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                current_priority.reset(token)
+        return wrapper
+    return decorator
+
+
+class _InFlight(object):
+    """
+    A GET request which is currently running and can be joined by identical requests (single-flight)
+    """
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
 class FedRepRestAPI(object):
     """
     FedRep API client constructor
@@ -39,6 +77,8 @@ class FedRepRestAPI(object):
         'X-ExperimentalApi': 'opt-in',
     }
     response = None
+    # GETs with a path matching this pattern are hedged (see HedgePolicy), None to hedge only calls with hedge=True
+    HEDGED_ENDPOINTS = None
 
     def __init__(
             self,
@@ -58,11 +98,21 @@ class FedRepRestAPI(object):
             cloud=False,
             proxies=None,
             token=None,
+            coalesce=False,
+            transport=None,
+            scheduler=None,
+            default_priority='interactive',
+            shared_cache=None,
+            cache_ttl=None,
+            limiter=None,
+            hedge=None,
+            connect_timeout=None,
     ):
         self.url = url
         self.username = username
         self.password = password
         self.timeout = int(timeout)
+        self.connect_timeout = connect_timeout
         self.verify_ssl = verify_ssl
         self.api_root = api_root
         self.api_version = api_version
@@ -70,10 +120,31 @@ class FedRepRestAPI(object):
         self.advanced_mode = advanced_mode
         self.cloud = cloud
         self.proxies = proxies
-        if session is None:
-            self._session = requests.Session()
+        self.coalesce = coalesce
+        self.scheduler = scheduler
+        self.default_priority = default_priority
+        self.shared_cache = shared_cache
+        self.cache_ttl = cache_ttl
+        self.limiter = limiter
+        self.hedge = hedge
+        self._inflight = dict()
+        self._inflight_lock = threading.Lock()
+        # requests is imported on first use (by the transport) to keep the import of the package fast
+        if transport is None or transport == 'requests':
+            self._transport = RequestsTransport(session)
+        elif isinstance(transport, str):
+            self._transport = TRANSPORTS[transport]()
         else:
-            self._session = session
+            self._transport = transport
+        self._session = getattr(self._transport, 'session', None)
+        if self._session is None:
+            # the authentication and the cookies are set up on the requests session
+            unsupported = [name for name, value in (('session', session), ('username/password', username and password),
+                                                    ('token', token), ('oauth', oauth), ('oauth2', oauth2),
+                                                    ('kerberos', kerberos), ('cookies', cookies)) if value]
+            if unsupported:
+                raise ValueError(f'The transport {type(self._transport).__name__} has no requests session, the '
+                                 f'options {", ".join(unsupported)} are not supported')
         if username and password:
             self._create_basic_session(username, password)
         elif token is not None:
@@ -88,13 +159,30 @@ class FedRepRestAPI(object):
             self._session.cookies.update(cookies)
 
     def close(self):
-        return self._session.close()
+        return self._transport.close()
 
     @property
     def session(self):
         """Providing access to the restricted field"""
         return self._session
 
+    @contextmanager
+    def priority(self, priority):
+        """
+        Run all requests of the current thread (or asyncio task) inside the block with the given priority class of
+        the scheduler, e.g. with nina.priority('bulk'): ...
+        """
+        token = current_priority.set(priority)
+        try:
+            yield
+        finally:
+            current_priority.reset(token)
+
+    @property
+    def transport(self):
+        """The transport sending the requests (see transport.py)"""
+        return self._transport
+
     @staticmethod
     def url_joiner(url, path, trailing=None):
         url_link = '/'.join(str(s).strip('/') for s in [url, path] if s is not None)
@@ -153,7 +241,8 @@ class FedRepRestAPI(object):
                 logger.error(e)
                 response.raise_for_status()
             else:
-                raise requests.HTTPError(error_msg, response=response)
+                from requests import HTTPError
+                raise HTTPError(error_msg, response=response)
         else:
             response.raise_for_status()
 
@@ -209,26 +298,86 @@ class FedRepRestAPI(object):
         #    data=data if data else json_dump,
         #)
         headers = headers or self.default_headers
-        response = self._session.request(
+        if self.scheduler is None:
+            response = self._send_limited(method, url, headers, data, json, files)
+        else:
+            priority = current_priority.get() or self.default_priority
+            deadline = current_deadline.get()
+            if not self.scheduler.acquire(priority, timeout=None if deadline is None else deadline.remaining()):
+                raise deadline.exceeded('a slot of the scheduler')
+            try:
+                response = self._send_limited(method, url, headers, data, json, files)
+            finally:
+                self.scheduler.release(priority)
+        response.encoding = 'utf-8'
+
+        if logger.isEnabledFor(logging.DEBUG):
+            # decoding the text of every response is expensive, so it is only done for the debug output
+            logger.debug(f'HTTP: {method} {path} -> {response.status_code} {response.reason}')
+            logger.debug(f'HTTP: Response text -> {response.text}')
+        if self.advanced_mode or advanced_mode:
+            return response
+
+        self.raise_for_status(response)
+        return response
+
+    def _send_limited(self, method, url, headers, data, json, files):
+        """
+        Send inside a slot of the adaptive limiter (if configured), which learns from the outcome of the request.
+        """
+        if self.limiter is None:
+            return self._send(method, url, headers, data, json, files)
+        deadline = current_deadline.get()
+        start = self.limiter.acquire(timeout=None if deadline is None else deadline.remaining())
+        if start is None:
+            raise deadline.exceeded('a slot of the limiter')
+        try:
+            response = self._send(method, url, headers, data, json, files)
+        except Exception as e:
+            from requests import Timeout
+            self.limiter.release(start, overload=isinstance(e, Timeout), ok=False)
+            raise
+        overload = response.status_code in OVERLOAD_STATUS
+        self.limiter.release(start, overload=overload, ok=not overload and response.status_code < 500)
+        return response
+
+    def _bulk_workers(self, workers, default):
+        """
+        Returns: The number of threads of a bulk operation (e.g. warning_details): the given number, with an adaptive
+        limiter enough threads for its maximum limit (the limiter gates how many requests actually run), otherwise
+        the default.
+        """
+        if workers is not None:
+            return workers
+        if self.limiter is not None:
+            return self.limiter.max_limit
+        return default
+
+    def _timeout(self):
+        """
+        The timeout of the transport: the read timeout or a tuple (connect, read) if a connect timeout is set or a
+        deadline applies (see Deadline), which cuts both to its remaining time.
+        """
+        deadline = current_deadline.get()
+        if deadline is not None:
+            return deadline.timeout(self.timeout if self.connect_timeout is None else self.connect_timeout,
+                                    self.timeout)
+        if self.connect_timeout is None:
+            return self.timeout
+        return self.connect_timeout, self.timeout
+
+    def _send(self, method, url, headers, data, json, files):
+        return self._transport.request(
             method=method,
             url=url,
             headers=headers,
             data=data,
             json=json,
-            timeout=self.timeout,
+            timeout=self._timeout(),
             verify=self.verify_ssl,
             files=files,
             proxies=self.proxies,
         )
-        response.encoding = 'utf-8'
-
-        logger.debug(f'HTTP: {method} {path} -> {response.status_code} {response.reason}')
-        logger.debug(f'HTTP: Response text -> {response.text}')
-        if self.advanced_mode or advanced_mode:
-            return response
-
-        self.raise_for_status(response)
-        return response
 
     def get(
             self,
@@ -241,9 +390,16 @@ class FedRepRestAPI(object):
             trailing=None,
             absolute=False,
             advanced_mode=False,
+            hedge=None,
     ):
         """
         Get request based on the python-requests module. You can override headers, and also, get not json response
+        If the client was created with coalesce=True, identical GETs running at the same time are sent only once and
+        all callers receive the same result object (treat it as read-only).
+        If the client was created with a shared_cache (SharedCache), json responses are served from and stored in it
+        for cache_ttl seconds (the default TTL of the cache if None).
+        If the client was created with a hedge (HedgePolicy), a slow request to one of the HEDGED_ENDPOINTS is raced
+        by a second identical one.
         :param path:
         :param data:
         :param flags:
@@ -253,9 +409,76 @@ class FedRepRestAPI(object):
         :param trailing: OPTIONAL: for wrap slash symbol in the end of string
         :param absolute: bool, OPTIONAL: Do not prefix url, url is absolute
         :param advanced_mode: bool, OPTIONAL: Return the raw response
+        :param hedge: bool, OPTIONAL: Hedge this request or not, by default if the path matches HEDGED_ENDPOINTS
         :return:
         """
-        response = self.request(
+        if (not self.coalesce and self.shared_cache is None) or self.advanced_mode or advanced_mode \
+                or data is not None:
+            return self._get(path, data=data, flags=flags, params=params, headers=headers,
+                             not_json_response=not_json_response, trailing=trailing, absolute=absolute,
+                             advanced_mode=advanced_mode, hedge=hedge)
+
+        key = (path, bool(absolute), bool(trailing), bool(not_json_response), urllib.parse.urlencode(params or {}),
+               tuple(flags or ()), tuple(sorted(headers.items())) if headers else None)
+        if not self.coalesce:
+            return self._get_shared(key, path, flags=flags, params=params, headers=headers,
+                                    not_json_response=not_json_response, trailing=trailing, absolute=absolute,
+                                    hedge=hedge)
+
+        # single-flight: identical GETs running at the same time share one request and its (same) result object
+        with self._inflight_lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _InFlight()
+        if not leader:
+            deadline = current_deadline.get()
+            if not call.event.wait(None if deadline is None else deadline.remaining()):
+                raise deadline.exceeded('an identical running request')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._get_shared(key, path, flags=flags, params=params, headers=headers,
+                                           not_json_response=not_json_response, trailing=trailing, absolute=absolute,
+                                           hedge=hedge)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            call.event.set()
+        return call.result
+
+    def _get_shared(self, key, path, not_json_response=None, **kwargs):
+        """
+        GET through the shared cache (if configured), so all processes of a host request an url only once per TTL.
+        Raw (not json) responses are not cached.
+        """
+        if self.shared_cache is None or not_json_response:
+            return self._get(path, not_json_response=not_json_response, **kwargs)
+        cache_key = dumps([self.url] + list(key))
+        deadline = current_deadline.get()
+        return self.shared_cache.get_or_fetch(cache_key, lambda: self._get(path, **kwargs), ttl=self.cache_ttl,
+                                              timeout=None if deadline is None else deadline.remaining())
+
+    def _get(
+            self,
+            path,
+            data=None,
+            flags=None,
+            params=None,
+            headers=None,
+            not_json_response=None,
+            trailing=None,
+            absolute=False,
+            advanced_mode=False,
+            hedge=None,
+    ):
+        send = functools.partial(
+            self.request,
             'GET',
             path=path,
             flags=flags,
@@ -266,6 +489,10 @@ class FedRepRestAPI(object):
             absolute=absolute,
             advanced_mode=advanced_mode,
         )
+        # GETs are idempotent, so a slow one may be hedged by a second identical request
+        if hedge is None:
+            hedge = self.HEDGED_ENDPOINTS is not None and re.search(self.HEDGED_ENDPOINTS, path) is not None
+        response = self.hedge.run(send) if self.hedge is not None and hedge else send()
         if self.advanced_mode or advanced_mode:
             return response
         if not_json_response:
@@ -0,0 +1,144 @@
+####
+# Copyright 2023 burrizza
+######
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# priority classes from the most to the least urgent
+PRIORITIES = ('critical', 'interactive', 'bulk')
+
+# priority of the requests of the current thread / task, see FedRepRestAPI.priority
+current_priority = contextvars.ContextVar('catalogary_priority', default=None)
+
+
+class PriorityScheduler(object):
+    """
+    Schedules the requests of one or more clients (FedRepRestAPI) by priority classes.
+    Every class has its own concurrency limit below a global one. A free slot goes to the most urgent class with
+    waiting requests, within a class the requests are served first come, first served. So an urgent warning refresh
+    overtakes hundreds of queued bulk measurements but bulk traffic can never occupy all connections.
+    A waiting class ages: once more urgent classes were served aging times while it waited, its next request goes
+    first, so even bulk gets at least one of every aging + 1 slots under a steady stream of urgent requests.
+    """
+    DEFAULT_LIMITS = {'critical': None, 'interactive': None, 'bulk': 4}
+
+    def __init__(self, max_concurrency=8, limits=None, aging=16):
+        """
+        Args:
+            max_concurrency: Maximum number of requests running at the same time over all classes.
+            limits: OPTIONAL: Dict priority class -> maximum number of running requests (None for no own limit),
+                see DEFAULT_LIMITS.
+            aging: OPTIONAL: Number of requests of more urgent classes a waiting class lets go first before its own
+                next request runs, None for strict priorities (less urgent classes may starve then).
+        """
+        self.max_concurrency = max_concurrency
+        self.aging = aging
+        self.limits = dict(self.DEFAULT_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        unknown = set(self.limits) - set(PRIORITIES)
+        if unknown:
+            raise ValueError(f'Unknown priority classes: {sorted(unknown)}')
+        self._cond = threading.Condition()
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._total = 0
+        # number of requests of more urgent classes which ran while a class was waiting
+        self._skipped = {priority: 0 for priority in PRIORITIES}
+
+    def _has_capacity(self, priority):
+        limit = self.limits.get(priority)
+        return self._total < self.max_concurrency and (limit is None or self._running[priority] < limit)
+
+    def _rank(self, priority):
+        # aged classes go first, then the most urgent one
+        aged = self.aging is not None and self._skipped[priority] >= self.aging
+        return 0 if aged else 1, PRIORITIES.index(priority)
+
+    def _may_run(self, priority, ticket):
+        if self._queues[priority][0] is not ticket or not self._has_capacity(priority):
+            return False
+        # classes of a higher rank with waiting requests go first, if they are not blocked by their own limit
+        rank = self._rank(priority)
+        for other in PRIORITIES:
+            if other != priority and self._queues[other] and self._has_capacity(other) and self._rank(other) < rank:
+                return False
+        return True
+
+    def _dequeue(self, priority):
+        self._queues[priority].popleft()
+        self._skipped[priority] = 0
+        for other in PRIORITIES[PRIORITIES.index(priority) + 1:]:
+            # only the classes which could have run are skipped, not the ones blocked by their own limit
+            if self._queues[other] and self._has_capacity(other):
+                self._skipped[other] += 1
+        self._running[priority] += 1
+        self._total += 1
+        # the next request of the class or one it held back may run on another free slot
+        self._cond.notify_all()
+
+    def acquire(self, priority='interactive', timeout=None):
+        """
+        Block until the request may run.
+        Args:
+            priority: The priority class of the request.
+            timeout: OPTIONAL: Maximum seconds to wait.
+
+        Returns: True, False if the timeout expired first (the request must not run then).
+        """
+        if priority not in self._queues:
+            raise ValueError(f'Unknown priority class: {priority}')
+        ticket = object()
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._queues[priority].append(ticket)
+            try:
+                while not self._may_run(priority, ticket):
+                    remaining = None if end is None else end - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError
+                    self._cond.wait(remaining)
+            except TimeoutError:
+                self._leave(priority, ticket)
+                return False
+            except BaseException:
+                self._leave(priority, ticket)
+                raise
+            self._dequeue(priority)
+        return True
+
+    def _leave(self, priority, ticket):
+        self._queues[priority].remove(ticket)
+        if not self._queues[priority]:
+            self._skipped[priority] = 0
+        self._cond.notify_all()
+
+    def release(self, priority='interactive'):
+        """Free the slot of a finished request."""
+        with self._cond:
+            self._running[priority] -= 1
+            self._total -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority='interactive'):
+        """Context manager holding a slot of the given priority class."""
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self):
+        """
+        Returns: Dict priority class -> dict with the number of 'running' and 'queued' requests.
+        """
+        with self._cond:
+            return {priority: {'running': self._running[priority], 'queued': len(self._queues[priority])}
+                    for priority in PRIORITIES}
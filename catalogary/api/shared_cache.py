@@ -0,0 +1,197 @@
+####
+# Copyright 2023 burrizza
+######
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCache(object):
+    """
+    Response cache shared by all processes (e.g. gunicorn workers) of a host, stored in a local SQLite database.
+    Entries expire after their TTL and the least recently used ones are evicted when the size limit is exceeded.
+    A hit records its access time only if the recorded one is older than touch_interval, so reads rarely write.
+    A lock per key lets only one process refresh an entry, the others wait for its result.
+    The size of all entries is kept up to date by triggers, so a write does not have to sum up the whole table.
+    """
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, expires REAL, size INTEGER, '
+        'accessed REAL)',
+        'CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)',
+        'CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires)',
+        'CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, owner TEXT, until REAL)',
+        'CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER)',
+        # databases created before the totals start with the current size
+        'INSERT OR IGNORE INTO totals (id, size) SELECT 0, COALESCE(SUM(size), 0) FROM entries',
+        'CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN '
+        'UPDATE totals SET size = size + NEW.size WHERE id = 0; END',
+        'CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN '
+        'UPDATE totals SET size = size - OLD.size WHERE id = 0; END',
+    )
+
+    def __init__(self, path, ttl=60, max_bytes=256 * 1024 * 1024, lock_timeout=30, poll_interval=0.05,
+                 touch_interval=10):
+        """
+        Args:
+            path: Path of the SQLite database file (created if missing).
+            ttl: Default seconds an entry stays valid.
+            max_bytes: Maximum size of all (compressed) entries.
+            lock_timeout: Seconds a refresh may hold the lock of a key, waiting processes fetch themselves after it.
+            poll_interval: Seconds between two checks of a waiting process.
+            touch_interval: Seconds the recorded access time of an entry may lag behind (precision of the LRU
+                eviction), a hit within this time does not take the write lock.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.touch_interval = touch_interval
+        self._instance = uuid.uuid4().hex
+        self._local = threading.local()
+        connection = self._connection()
+        with self._transaction(connection):
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+
+    @property
+    def _owner(self):
+        # a forked process must not release the locks of its parent (or the other way round)
+        return f'{self._instance}-{os.getpid()}'
+
+    @staticmethod
+    @contextmanager
+    def _transaction(connection):
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _connection(self):
+        # one connection per thread and process, connections must not be used after a fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.lock_timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        """
+        Returns: The cached value or None if it is missing or expired.
+        """
+        now = time.time()
+        row = self._connection().execute('SELECT value, expires, accessed FROM entries WHERE key = ?',
+                                         (key,)).fetchone()
+        if row is None or row[1] < now:
+            return None
+        if now - row[2] > self.touch_interval:
+            self._connection().execute('UPDATE entries SET accessed = ? WHERE key = ? AND accessed < ?',
+                                       (now, key, now - self.touch_interval))
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, key, value, ttl=None):
+        """Store a JSON serializable value."""
+        now = time.time()
+        blob = zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+        connection = self._connection()
+        with self._transaction(connection):
+            # delete and insert instead of a replace, which would skip the delete trigger of the totals
+            connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            connection.execute('INSERT INTO entries (key, value, expires, size, accessed) VALUES (?, ?, ?, ?, ?)',
+                               (key, blob, now + (self.ttl if ttl is None else ttl), len(blob), now))
+            self._evict(connection, now)
+
+    def size(self):
+        """
+        Returns: The size of all (compressed) entries in bytes.
+        """
+        return self._connection().execute('SELECT size FROM totals WHERE id = 0').fetchone()[0]
+
+    def _evict(self, connection, now):
+        connection.execute('DELETE FROM entries WHERE expires < ?', (now,))
+        total = connection.execute('SELECT size FROM totals WHERE id = 0').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evict = list()
+        for key, size in connection.execute('SELECT key, size FROM entries ORDER BY accessed'):
+            if total <= self.max_bytes:
+                break
+            evict.append((key,))
+            total -= size
+        connection.executemany('DELETE FROM entries WHERE key = ?', evict)
+
+    def delete(self, key):
+        """Remove an entry."""
+        self._connection().execute('DELETE FROM entries WHERE key = ?', (key,))
+
+    def clear(self):
+        """Remove all entries and locks."""
+        connection = self._connection()
+        connection.execute('DELETE FROM entries')
+        connection.execute('DELETE FROM locks')
+
+    def acquire(self, key):
+        """
+        Try to take the refresh lock of a key (expired locks of crashed processes are taken over).
+
+        Returns: True if the lock was taken.
+        """
+        now = time.time()
+        connection = self._connection()
+        connection.execute('DELETE FROM locks WHERE key = ? AND until < ?', (key, now))
+        cursor = connection.execute('INSERT OR IGNORE INTO locks (key, owner, until) VALUES (?, ?, ?)',
+                                    (key, self._owner, now + self.lock_timeout))
+        return cursor.rowcount == 1
+
+    def release(self, key):
+        """Free the refresh lock of a key."""
+        self._connection().execute('DELETE FROM locks WHERE key = ? AND owner = ?', (key, self._owner))
+
+    def get_or_fetch(self, key, fetch, ttl=None, timeout=None):
+        """
+        Get a value from the cache or fetch and store it. Only one process fetches a key at a time, the others wait
+        for the result (at most lock_timeout seconds, then they fetch on their own).
+        Args:
+            key: The key of the entry.
+            fetch: Callable (without arguments) delivering the value.
+            ttl: OPTIONAL: Seconds the entry stays valid, the default TTL if None.
+            timeout: OPTIONAL: Maximum seconds to wait for another process if shorter than lock_timeout.
+
+        Returns: The value.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        deadline = time.time() + (self.lock_timeout if timeout is None else min(self.lock_timeout, timeout))
+        while True:
+            if self.acquire(key):
+                try:
+                    value = self.get(key)
+                    if value is None:
+                        value = fetch()
+                        if value is not None:
+                            self.set(key, value, ttl=ttl)
+                    return value
+                finally:
+                    self.release(key)
+            time.sleep(self.poll_interval)
+            value = self.get(key)
+            if value is not None:
+                return value
+            if time.time() > deadline:
+                logger.warning(f'Timeout waiting for the refresh of {key}, fetching without lock')
+                return fetch()
@@ -0,0 +1,135 @@
+####
+# Copyright 2023 burrizza
+######
+import csv
+import gzip
+import io
+import logging
+from json import dumps
+
+logger = logging.getLogger(__name__)
+
+
+def _plain(obj):
+    """json default for the compact record types"""
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class RecordSink(object):
+    """
+    Base class of the writer sinks. Records are collected and written in batches with one bulk write per batch,
+    so the sink holds at most batch size records instead of the whole output.
+    NinaAPI.generic_complete streams every completed warning into it directly. UmweltbundesamtAPI.measures_stations
+    has to merge all scopes of all components before the first station is complete (every response covers all
+    stations), so its memory is bounded by the merged measures and the sink only saves the list of records.
+    """
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, target, batch_size=1000, compress=None, encoding='utf-8'):
+        """
+        Args:
+            target: A path or an already opened text file.
+            batch_size: Number of records collected before they are written.
+            compress: Write gzip compressed output, by default if the path ends with '.gz'.
+            encoding: Encoding of the output file.
+        """
+        self.batch_size = batch_size
+        self.count = 0
+        self._batch = list()
+        if isinstance(target, str):
+            if compress is None:
+                compress = target.endswith('.gz')
+            if compress:
+                self._file = io.TextIOWrapper(io.BufferedWriter(gzip.open(target, 'wb'), self.BUFFER_SIZE),
+                                              encoding=encoding, newline='')
+            else:
+                self._file = open(target, 'w', encoding=encoding, newline='', buffering=self.BUFFER_SIZE)
+            self._owns_file = True
+        else:
+            self._file = target
+            self._owns_file = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, record):
+        """Add a record (dict or compact record), the batch is written if full."""
+        self._batch.append(record)
+        self.count += 1
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, records):
+        """Add all records of an iterable."""
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        """Write the collected batch."""
+        if self._batch:
+            self._file.write(self._format(self._batch))
+            self._batch = list()
+        self._file.flush()
+
+    def close(self):
+        """Write the remaining batch and close the file if it was opened by the sink."""
+        self.flush()
+        if self._owns_file:
+            self._file.close()
+
+    def _format(self, batch):
+        raise NotImplementedError
+
+
+class NdjsonSink(RecordSink):
+    """
+    Writes every record as one JSON line (NDJSON), gzip compressed if the path ends with '.gz'.
+    """
+
+    def _format(self, batch):
+        return ''.join(dumps(record, ensure_ascii=False, default=_plain) + '\n' for record in batch)
+
+
+class CsvSink(RecordSink):
+    """
+    Writes the records as CSV with a fixed column layout, gzip compressed if the path ends with '.gz'.
+    Nested values (e.g. the measures of measures_stations) are written as JSON, missing ones as empty cells.
+    """
+
+    def __init__(self, target, columns, header=True, delimiter=',', **kwargs):
+        """
+        Args:
+            target: A path or an already opened text file.
+            columns: List with the keys (fields) of the records written as columns.
+            header: Write the column names as first row.
+            delimiter: The delimiter of the columns.
+        """
+        super(CsvSink, self).__init__(target, **kwargs)
+        self.columns = list(columns)
+        self.delimiter = delimiter
+        self._header = header
+
+    def _format(self, batch):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=self.delimiter, lineterminator='\n')
+        if self._header:
+            writer.writerow(self.columns)
+            self._header = False
+        for record in batch:
+            if not isinstance(record, dict):
+                record = record.to_dict()
+            writer.writerow([self._cell(record.get(column)) for column in self.columns])
+        return buffer.getvalue()
+
+    @staticmethod
+    def _cell(value):
+        if isinstance(value, (dict, list, tuple)) or hasattr(value, 'to_dict'):
+            return dumps(value, ensure_ascii=False, default=_plain)
+        return value
@@ -0,0 +1,171 @@
+####
+# Copyright 2023 burrizza
+######
+import json as _json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Transport(object):
+    """
+    Sends the HTTP requests of FedRepRestAPI. Responses have to offer the attributes of requests.Response used by
+    the clients (status_code, reason, headers, url, content, text, encoding, json(), raise_for_status()).
+    """
+
+    def request(self, method, url, headers=None, data=None, json=None, timeout=None, verify=True, files=None,
+                proxies=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(Transport):
+    """
+    Default transport using a requests.Session.
+    """
+
+    def __init__(self, session=None):
+        if session is None:
+            import requests
+            session = requests.Session()
+        self.session = session
+
+    def request(self, method, url, headers=None, data=None, json=None, timeout=None, verify=True, files=None,
+                proxies=None):
+        return self.session.request(method=method, url=url, headers=headers, data=data, json=json, timeout=timeout,
+                                    verify=verify, files=files, proxies=proxies)
+
+    def close(self):
+        return self.session.close()
+
+
+class Urllib3Response(object):
+    """
+    Minimal response of the Urllib3Transport with the interface of requests.Response used by the clients.
+    """
+    __slots__ = ('status_code', 'reason', 'headers', 'url', 'content', 'encoding', '_text')
+
+    def __init__(self, status_code, reason, headers, url, content):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.url = url
+        self.content = content
+        self.encoding = 'utf-8'
+        self._text = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.content.decode(self.encoding or 'utf-8', errors='replace')
+        return self._text
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self, **kwargs):
+        return _json.loads(self.content, **kwargs)
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 600:
+            from requests import HTTPError
+            kind = 'Client' if self.status_code < 500 else 'Server'
+            raise HTTPError(f'{self.status_code} {kind} Error: {self.reason} for url: {self.url}', response=self)
+
+
+class Urllib3Transport(Transport):
+    """
+    Lean transport using a pooled urllib3.PoolManager directly. It skips the hooks, the cookie handling, the
+    environment lookups and the response wrapping of requests, which dominate the cost of small responses.
+    Redirects are followed like by requests. Uploads of files, cookies and the authentication of a requests session
+    are not supported. Connection errors, timeouts and too many redirects are raised as the requests exceptions.
+    """
+
+    def __init__(self, num_pools=10, maxsize=10, retries=None, max_redirects=30, **pool_kwargs):
+        """
+        Args:
+            num_pools: Number of connection pools (hosts) to cache.
+            maxsize: Number of connections to keep per pool.
+            retries: OPTIONAL: The urllib3 retry configuration (by default no retries but up to max_redirects
+                redirects like requests).
+            max_redirects: Maximum number of redirects followed by the default retry configuration.
+        """
+        self.num_pools = num_pools
+        self.maxsize = maxsize
+        self.retries = retries
+        self.max_redirects = max_redirects
+        self.pool_kwargs = pool_kwargs
+        self._managers = dict()
+
+    def _manager(self, verify, proxy):
+        key = (verify, proxy)
+        manager = self._managers.get(key)
+        if manager is None:
+            import urllib3
+            retries = self.retries
+            if retries is None:
+                # retries=False would disable the redirects as well
+                retries = urllib3.Retry(total=None, connect=0, read=0, status=0, other=0,
+                                        redirect=self.max_redirects)
+            kwargs = dict(num_pools=self.num_pools, maxsize=self.maxsize, retries=retries, **self.pool_kwargs)
+            if verify is False:
+                kwargs['cert_reqs'] = 'CERT_NONE'
+            elif isinstance(verify, str):
+                kwargs['ca_certs'] = verify
+            manager = urllib3.ProxyManager(proxy, **kwargs) if proxy else urllib3.PoolManager(**kwargs)
+            manager = self._managers.setdefault(key, manager)
+        return manager
+
+    def request(self, method, url, headers=None, data=None, json=None, timeout=None, verify=True, files=None,
+                proxies=None):
+        import urllib3
+
+        if files is not None:
+            raise ValueError('The urllib3 transport does not support file uploads')
+        body = data
+        if json is not None and data is None:
+            body = _json.dumps(json)
+        if isinstance(timeout, tuple):
+            timeout = urllib3.Timeout(connect=timeout[0], read=timeout[1])
+        proxy = None
+        if proxies:
+            proxy = proxies.get(url.split(':', 1)[0]) or proxies.get('all')
+        try:
+            resp = self._manager(verify, proxy).request(method, url, body=body, headers=headers, timeout=timeout,
+                                                        preload_content=True)
+        except urllib3.exceptions.HTTPError as e:
+            raise self._requests_exception(e)
+        # the url of the last response if redirected
+        return Urllib3Response(resp.status, resp.reason, resp.headers, getattr(resp, 'url', None) or url, resp.data)
+
+    @staticmethod
+    def _requests_exception(error):
+        import requests
+        import urllib3
+
+        reason = getattr(error, 'reason', None) or error
+        if isinstance(reason, urllib3.exceptions.ResponseError) and 'redirect' in str(reason):
+            return requests.TooManyRedirects(error)
+        if isinstance(reason, urllib3.exceptions.NewConnectionError):
+            return requests.ConnectionError(error)
+        if isinstance(reason, urllib3.exceptions.ConnectTimeoutError):
+            return requests.ConnectTimeout(error)
+        if isinstance(reason, urllib3.exceptions.TimeoutError):
+            return requests.ReadTimeout(error)
+        if isinstance(reason, urllib3.exceptions.SSLError):
+            return requests.exceptions.SSLError(error)
+        return requests.ConnectionError(error)
+
+    def close(self):
+        for manager in self._managers.values():
+            manager.clear()
+        self._managers = dict()
+
+
+TRANSPORTS = {
+    'requests': RequestsTransport,
+    'urllib3': Urllib3Transport,
+}
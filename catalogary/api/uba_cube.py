@@ -0,0 +1,127 @@
+####
+# Copyright 2023 burrizza
+######
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+AXES = {'station': 0, 'time': 1, 'component': 2}
+
+
+class MeasuresCube(object):
+    """
+    Dense cube of Umweltbundesamt measurements with the shape (stations, hours, components).
+    values: float64 array (NaN where nothing was measured)
+    mask: bool array, True where a value exists
+    stations, timestamps, components: the labels of the axes (station ids, UTC epoch seconds, component codes)
+    Slicing and aggregations work on the whole arrays without Python loops.
+    """
+    __slots__ = ('values', 'mask', 'stations', 'timestamps', 'components', 'step', '_station_index',
+                 '_component_index')
+
+    def __init__(self, values, mask, stations, timestamps, components, step=3600):
+        self.values = values
+        self.mask = mask
+        self.stations = np.asarray(stations, dtype=str)
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.components = np.asarray(components, dtype=str)
+        self.step = step
+        self._station_index = {station: i for i, station in enumerate(self.stations.tolist())}
+        self._component_index = {component: i for i, component in enumerate(self.components.tolist())}
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @classmethod
+    def from_frames(cls, frames, column='key_ts', step=3600):
+        """
+        Build the cube from normalized measures responses.
+        Args:
+            frames: Dict component code -> MeasuresFrame (see UmweltbundesamtAPI.measures(normalize=True)).
+            column: The timestamp column used as time axis ('key_ts' or 'value_ts').
+            step: Seconds between two timestamps of the time axis.
+
+        Returns: The MeasuresCube.
+        """
+        components = list(frames)
+        frames = [frames[component] for component in components]
+        stations = np.unique(np.concatenate([frame.station for frame in frames])) if frames else np.empty(0, str)
+        all_ts = np.concatenate([getattr(frame, column) for frame in frames]) if frames else np.empty(0, np.int64)
+        if all_ts.size:
+            timestamps = np.arange(all_ts.min(), all_ts.max() + step, step, dtype=np.int64)
+        else:
+            timestamps = np.empty(0, dtype=np.int64)
+
+        values = np.full((len(stations), len(timestamps), len(components)), np.nan)
+        for component_pos, frame in enumerate(frames):
+            if not len(frame):
+                continue
+            station_pos = np.searchsorted(stations, frame.station)
+            time_pos = (getattr(frame, column) - timestamps[0]) // step
+            values[station_pos, time_pos, component_pos] = frame.value
+        return cls(values, ~np.isnan(values), stations, timestamps, components, step=step)
+
+    def station_index(self, station):
+        """
+        Returns: The position of a station id on the station axis.
+        """
+        return self._station_index[str(station)]
+
+    def component_index(self, component):
+        """
+        Returns: The position of a component code on the component axis.
+        """
+        return self._component_index[str(component)]
+
+    def sel(self, stations=None, time_from=None, time_to=None, components=None):
+        """
+        Select a sub cube.
+        Args:
+            stations: OPTIONAL: A list with station ids.
+            time_from: OPTIONAL: First UTC epoch second (included).
+            time_to: OPTIONAL: Last UTC epoch second (excluded).
+            components: OPTIONAL: A list with component codes.
+
+        Returns: New MeasuresCube (sharing no memory with this one if stations or components are given).
+        """
+        station_sel = slice(None) if stations is None else [self.station_index(station) for station in stations]
+        component_sel = slice(None) if components is None else \
+            [self.component_index(component) for component in components]
+        time_start = 0 if time_from is None else int(np.searchsorted(self.timestamps, time_from, side='left'))
+        time_stop = len(self.timestamps) if time_to is None else \
+            int(np.searchsorted(self.timestamps, time_to, side='left'))
+        time_sel = slice(time_start, time_stop)
+        values = self.values[station_sel][:, time_sel][:, :, component_sel]
+        mask = self.mask[station_sel][:, time_sel][:, :, component_sel]
+        return MeasuresCube(values, mask, self.stations[station_sel], self.timestamps[time_sel],
+                            self.components[component_sel], step=self.step)
+
+    def aggregate(self, func='mean', axis='time'):
+        """
+        Aggregate the valid values along one or more axes.
+        Args:
+            func: 'mean', 'sum', 'min', 'max' or 'count'.
+            axis: 'station', 'time', 'component' (or a tuple of them / their positions).
+
+        Returns: Array with the aggregated values, NaN where no valid value exists.
+        """
+        if isinstance(axis, (tuple, list)):
+            axis = tuple(AXES.get(name, name) for name in axis)
+        else:
+            axis = AXES.get(axis, axis)
+        count = self.mask.sum(axis=axis)
+        if func == 'count':
+            return count
+        if func == 'min':
+            return np.fmin.reduce(self.values, axis=axis)
+        if func == 'max':
+            return np.fmax.reduce(self.values, axis=axis)
+        total = np.where(self.mask, self.values, 0.0).sum(axis=axis)
+        if func == 'sum':
+            return np.where(count > 0, total, np.nan)
+        if func == 'mean':
+            return np.divide(total, count, out=np.full(np.shape(total), np.nan), where=count > 0)
+        raise ValueError(f'Unknown aggregation: {func}')
@@ -0,0 +1,140 @@
+####
+# Copyright 2023 burrizza
+######
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# the value timestamps of the Umweltbundesamt look like UTC+01:00, the timestamp keys like UTC
+KEY_UTC_OFFSET = 0
+VALUE_UTC_OFFSET = 3600
+
+
+class TimestampParser(object):
+    """
+    Vectorized parser for the timestamp strings of the Umweltbundesamt ('YYYY-MM-DD HH:MM:SS', the hour '24' is
+    the midnight of the following day) into int64 seconds since epoch. Already parsed strings are cached, so a
+    parser shared over many responses only parses every distinct timestamp once.
+    """
+
+    def __init__(self):
+        self._cache = dict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def parse(self, timestamps, utc_offset=0):
+        """
+        Args:
+            timestamps: A sequence (or array) of timestamp strings.
+            utc_offset: Offset of the timestamps to UTC in seconds, subtracted from the result.
+
+        Returns: Array (int64) with the UTC epoch seconds of the timestamps.
+        """
+        timestamps = np.asarray(timestamps, dtype=str)
+        if not timestamps.size:
+            return np.empty(0, dtype=np.int64)
+        unique, inverse = np.unique(timestamps, return_inverse=True)
+        cache = self._cache
+        missing = [timestamp for timestamp in unique.tolist() if timestamp not in cache]
+        if missing:
+            missing = np.asarray(missing)
+            midnight = np.char.find(missing, ' 24:') >= 0
+            parsed = np.char.replace(missing, ' 24:', ' 00:').astype('datetime64[s]').astype(np.int64)
+            parsed[midnight] += 86400
+            cache.update(zip(missing.tolist(), parsed.tolist()))
+        epochs = np.fromiter((cache[timestamp] for timestamp in unique.tolist()), dtype=np.int64, count=len(unique))
+        return epochs[inverse.reshape(-1)] - utc_offset
+
+
+class MeasuresFrame(object):
+    """
+    Columnar form of a measures response of the Umweltbundesamt with one row per (station, timestamp) and the
+    timestamps as int64 UTC epoch seconds, so filtering and joins are integer operations on NumPy arrays.
+    Columns: station (str), key_ts (int64), value_ts (int64), component (int64), scope (int64), value (float64,
+    NaN if missing).
+    """
+    __slots__ = ('station', 'key_ts', 'value_ts', 'component', 'scope', 'value')
+    COLUMNS = __slots__
+
+    def __init__(self, station, key_ts, value_ts, component, scope, value):
+        self.station = station
+        self.key_ts = key_ts
+        self.value_ts = value_ts
+        self.component = component
+        self.scope = scope
+        self.value = value
+
+    def __len__(self):
+        return len(self.key_ts)
+
+    def __getitem__(self, selector):
+        """Select rows by a boolean mask, an index array or a slice."""
+        return MeasuresFrame(*(getattr(self, column)[selector] for column in self.COLUMNS))
+
+    def between(self, ts_from=None, ts_to=None, column='key_ts'):
+        """
+        Args:
+            ts_from: OPTIONAL: First UTC epoch second (included).
+            ts_to: OPTIONAL: Last UTC epoch second (excluded).
+            column: The timestamp column to filter ('key_ts' or 'value_ts').
+
+        Returns: New MeasuresFrame with the rows in the given time range.
+        """
+        ts = getattr(self, column)
+        mask = np.ones(len(ts), dtype=bool)
+        if ts_from is not None:
+            mask &= ts >= ts_from
+        if ts_to is not None:
+            mask &= ts < ts_to
+        return self[mask]
+
+    def to_dict(self):
+        """
+        Returns: Dict column name -> array.
+        """
+        return {column: getattr(self, column) for column in self.COLUMNS}
+
+    @classmethod
+    def concat(cls, frames):
+        """
+        Returns: New MeasuresFrame with the rows of all given frames.
+        """
+        frames = list(frames)
+        if not frames:
+            return normalize_measures({'data': {}})
+        return cls(*(np.concatenate([getattr(frame, column) for frame in frames]) for column in cls.COLUMNS))
+
+
+def normalize_measures(resp_measures, parser=None, key_utc_offset=KEY_UTC_OFFSET,
+                       value_utc_offset=VALUE_UTC_OFFSET):
+    """
+    Turn a response of UmweltbundesamtAPI.measures into a MeasuresFrame. The timestamp keys and the value timestamps
+    of the whole response are parsed in one vectorized pass.
+    Args:
+        resp_measures: The response of UmweltbundesamtAPI.measures.
+        parser: OPTIONAL: A TimestampParser to share its cache between responses.
+        key_utc_offset: Offset of the timestamp keys to UTC in seconds.
+        value_utc_offset: Offset of the value timestamps to UTC in seconds.
+
+    Returns: The MeasuresFrame.
+    """
+    if parser is None:
+        parser = TimestampParser()
+    stations = list()
+    keys = list()
+    rows = list()
+    for station_id, dict_data in resp_measures.get('data', {}).items():
+        stations.extend([station_id] * len(dict_data))
+        keys.extend(dict_data.keys())
+        rows.extend(dict_data.values())
+    count = len(rows)
+    # value lists: [component id, scope id, value, date end, index]
+    component = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+    scope = np.fromiter((row[1] for row in rows), dtype=np.int64, count=count)
+    value = np.array([row[2] for row in rows], dtype=np.float64).reshape(count)
+    value_ts = parser.parse([row[3] for row in rows], utc_offset=value_utc_offset)
+    key_ts = parser.parse(keys, utc_offset=key_utc_offset)
+    return MeasuresFrame(np.asarray(stations, dtype=str), key_ts, value_ts, component, scope, value)
@@ -0,0 +1,181 @@
+####
+# Copyright 2023 burrizza
+######
+import logging
+import threading
+from collections import namedtuple
+
+from .records import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# offsets of the timestamp keys and the value timestamps to UTC in seconds as in uba_frame (not imported to avoid
+# importing numpy eagerly)
+KEY_UTC_OFFSET = 0
+VALUE_UTC_OFFSET = 3600
+
+
+class LatestValue(namedtuple('LatestValue', ['value', 'key_ts', 'value_ts'])):
+    """
+    The latest measured value of a (station, component, scope) with the timestamp key and the value timestamp as UTC
+    epoch seconds.
+    """
+    __slots__ = ()
+
+
+class LatestValueIndex(object):
+    """
+    In-memory index of the latest measured value per (station, component, scope) of the Umweltbundesamt, updated
+    incrementally from every measures response (see UmweltbundesamtAPI(latest=...)) so lookups never touch the network
+    or parse responses again. Missing values (None) do not replace a measured one and older responses never replace
+    newer values, so overlapping syncs and polls can be applied in any order.
+    Lookups are dict accesses, snapshot returns the values of all stations as MeasuresFrame (requires numpy).
+    """
+
+    def __init__(self):
+        # station id -> scope -> component -> LatestValue
+        self._stations = dict()
+        # (component, scope) -> number of changes (invalidates the cached snapshots)
+        self._versions = dict()
+        self._snapshots = dict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(components) for scopes in self._stations.values() for components in scopes.values())
+
+    def __contains__(self, key):
+        return self.get(*key) is not None
+
+    def update(self, resp_measures):
+        """
+        Apply a response of UmweltbundesamtAPI.measures (or a derived scope, see uba_scopes).
+        Args:
+            resp_measures: The response.
+
+        Returns: Number of (station, component, scope) entries which changed.
+        """
+        changed = 0
+        with self._lock:
+            for station_id, dict_data in resp_measures.get('data', {}).items():
+                # the newest key with a value per (component, scope) of this station, the keys compare like their
+                # timestamps ('24:00:00' sorts after '23:00:00' of the same day)
+                newest = dict()
+                for key_ts, row in dict_data.items():
+                    if row[2] is None:
+                        continue
+                    current = newest.get((row[0], row[1]))
+                    if current is None or key_ts > current[0]:
+                        newest[(row[0], row[1])] = (key_ts, row)
+                if not newest:
+                    continue
+                scopes = self._stations.setdefault(str(station_id), dict())
+                for (component, scope), (key_ts, row) in newest.items():
+                    key_epoch, value_epoch = parse_timestamp(key_ts), parse_timestamp(row[3])
+                    if key_epoch is None or value_epoch is None:
+                        continue
+                    changed += self._set(scopes, int(component), int(scope), int(key_epoch) - KEY_UTC_OFFSET,
+                                         int(value_epoch) - VALUE_UTC_OFFSET, float(row[2]))
+        return changed
+
+    def update_frame(self, frame):
+        """
+        Apply a MeasuresFrame (see UmweltbundesamtAPI.measures(normalize=True)), the newest row per (station,
+        component, scope) is selected vectorized.
+        Args:
+            frame: The MeasuresFrame.
+
+        Returns: Number of (station, component, scope) entries which changed.
+        """
+        import numpy as np
+
+        frame = frame[~np.isnan(frame.value)]
+        if not len(frame):
+            return 0
+        order = np.lexsort((frame.key_ts, frame.scope, frame.component, frame.station))
+        frame = frame[order]
+        # the last row of every (station, component, scope) group
+        last = np.ones(len(frame), dtype=bool)
+        last[:-1] = (frame.station[1:] != frame.station[:-1]) | (frame.component[1:] != frame.component[:-1]) | \
+            (frame.scope[1:] != frame.scope[:-1])
+        rows = zip(*(getattr(frame[last], column).tolist() for column in
+                     ('station', 'component', 'scope', 'key_ts', 'value_ts', 'value')))
+        changed = 0
+        with self._lock:
+            for station_id, component, scope, key_ts, value_ts, value in rows:
+                changed += self._set(self._stations.setdefault(station_id, dict()), component, scope, key_ts,
+                                     value_ts, value)
+        return changed
+
+    def _set(self, scopes, component, scope, key_ts, value_ts, value):
+        components = scopes.setdefault(scope, dict())
+        current = components.get(component)
+        if current is not None and (current.key_ts > key_ts or current == (value, key_ts, value_ts)):
+            return 0
+        components[component] = LatestValue(value, key_ts, value_ts)
+        self._versions[(component, scope)] = self._versions.get((component, scope), 0) + 1
+        return 1
+
+    def get(self, station, component, scope=2):
+        """
+        Args:
+            station: The station id.
+            component: The component id.
+            scope: The scope id.
+
+        Returns: The LatestValue or None if nothing was measured.
+        """
+        return self._stations.get(str(station), {}).get(int(scope), {}).get(int(component))
+
+    def value(self, station, component, scope=2, default=None):
+        """
+        Returns: The latest value of a (station, component, scope) or default if nothing was measured.
+        """
+        latest = self.get(station, component, scope)
+        return default if latest is None else latest.value
+
+    def station(self, station, scope=2):
+        """
+        Args:
+            station: The station id.
+            scope: The scope id.
+
+        Returns: Dict component id -> LatestValue with the current values of all components at the station.
+        """
+        return dict(self._stations.get(str(station), {}).get(int(scope), {}))
+
+    def stations(self):
+        """
+        Returns: List with the ids of all stations with values.
+        """
+        return list(self._stations)
+
+    def snapshot(self, component, scope=2):
+        """
+        Latest values of one component at all stations, e.g. to render a map. The snapshot is cached until the
+        values of the component change (requires numpy).
+        Args:
+            component: The component id.
+            scope: The scope id.
+
+        Returns: MeasuresFrame with one row per station (sorted by station id), the arrays must not be modified.
+        """
+        import numpy as np
+        from .uba_frame import MeasuresFrame
+
+        component, scope = int(component), int(scope)
+        with self._lock:
+            version = self._versions.get((component, scope), 0)
+            cached = self._snapshots.get((component, scope))
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            rows = sorted((station_id, scopes[scope][component]) for station_id, scopes in self._stations.items()
+                          if component in scopes.get(scope, ()))
+            count = len(rows)
+            frame = MeasuresFrame(np.asarray([row[0] for row in rows], dtype=str).reshape(count),
+                                  np.fromiter((row[1].key_ts for row in rows), dtype=np.int64, count=count),
+                                  np.fromiter((row[1].value_ts for row in rows), dtype=np.int64, count=count),
+                                  np.full(count, component, dtype=np.int64), np.full(count, scope, dtype=np.int64),
+                                  np.fromiter((row[1].value for row in rows), dtype=np.float64, count=count))
+            self._snapshots[(component, scope)] = (version, frame)
+            return frame
@@ -0,0 +1,94 @@
+####
+# Copyright 2023 burrizza
+######
+import logging
+
+import numpy as np
+
+from .uba_frame import normalize_measures
+
+logger = logging.getLogger(__name__)
+
+# hourly mean (1SMW) -> every other scope derivable from it
+BASE_SCOPE = '2'
+DERIVED_SCOPES = {
+    '1': '1TMW',  # Tagesmittel -> daily mean
+    '3': '1SMW_MAX',  # Ein-Stunden-Tagesmaxima -> daily maximum of the hourly means
+    '6': '1TMWGL',  # Tagesmittel stuendlich gleitend -> mean of the last 24 hourly means, every hour
+}
+# scopes keyed by the hour instead of the day
+HOURLY_SCOPES = (BASE_SCOPE, '6')
+HOURS_PER_DAY = 24
+
+
+def _format(epochs):
+    return np.char.replace(np.datetime_as_string(epochs.astype('datetime64[s]'), unit='s'), 'T', ' ')
+
+
+def derive_scopes(resp_measures, scopes=tuple(DERIVED_SCOPES), min_coverage=0.75):
+    """
+    Compute the daily scopes of the Umweltbundesamt locally from a response of the hourly mean scope (1SMW), with
+    vectorized (rolling) windows over a dense station x hour grid.
+    The timestamp keys are the start of the hourly interval: a day consists of the hours with its date as key, the
+    daily scopes are keyed with the start of the day and the sliding mean is keyed like the hour it ends with.
+    Like the Umweltbundesamt, a mean or maximum is only given if enough hourly values exist.
+    Args:
+        resp_measures: The response of UmweltbundesamtAPI.measures with scope '2' (1SMW).
+        scopes: The scope ids to derive, see DERIVED_SCOPES.
+        min_coverage: Minimum share of valid hourly values in a window (0.75 -> 18 of 24 hours).
+
+    Returns: Dict scope id -> measures response like structure ({'data': {station: {timestamp: [component, scope,
+    value, date end, 0]}}}).
+    """
+    unknown = set(scopes) - set(DERIVED_SCOPES)
+    if unknown:
+        raise ValueError(f'Scopes {sorted(unknown)} can not be derived from the hourly means')
+    frame = normalize_measures(resp_measures, key_utc_offset=0, value_utc_offset=0)
+    resp_derived = {scope: {'data': dict()} for scope in scopes}
+    if not len(frame):
+        return resp_derived
+
+    min_count = int(np.ceil(min_coverage * HOURS_PER_DAY))
+    stations, station_idx = np.unique(frame.station, return_inverse=True)
+    component = int(frame.component[0])
+    day_start = frame.key_ts.min() // 86400 * 86400
+    hour_idx = (frame.key_ts - day_start) // 3600
+    days = int(hour_idx.max()) // HOURS_PER_DAY + 1
+
+    # dense grid station x hour, NaN for missing values
+    grid = np.full((len(stations), days * HOURS_PER_DAY), np.nan)
+    grid[station_idx.reshape(-1), hour_idx] = frame.value
+    valid = ~np.isnan(grid)
+    filled = np.where(valid, grid, 0.0)
+
+    daily = grid.reshape(len(stations), days, HOURS_PER_DAY)
+    daily_count = valid.reshape(daily.shape).sum(axis=2)
+    daily_ok = daily_count >= min_count
+    day_keys = day_start + np.arange(days, dtype=np.int64) * 86400
+    day_keys_str = _format(day_keys)
+    day_ends_str = _format(day_keys + 86400)
+    if '1' in scopes:
+        daily_mean = filled.reshape(daily.shape).sum(axis=2) / np.maximum(daily_count, 1)
+        _collect(resp_derived['1']['data'], stations, daily_ok, daily_mean, day_keys_str, day_ends_str, component, 1)
+    if '3' in scopes:
+        daily_max = np.fmax.reduce(daily, axis=2)
+        _collect(resp_derived['3']['data'], stations, daily_ok, daily_max, day_keys_str, day_ends_str, component, 3)
+    if '6' in scopes:
+        # rolling sums over the 24 hours ending with every hour using cumulative sums
+        sums = np.cumsum(np.pad(filled, ((0, 0), (1, 0))), axis=1)
+        counts = np.cumsum(np.pad(valid, ((0, 0), (1, 0))), axis=1)
+        start = np.maximum(np.arange(1, grid.shape[1] + 1) - HOURS_PER_DAY, 0)
+        window_sum = sums[:, 1:] - sums[:, start]
+        window_count = counts[:, 1:] - counts[:, start]
+        rolling_ok = (window_count >= min_count) & valid
+        rolling_mean = window_sum / np.maximum(window_count, 1)
+        hour_keys = day_start + np.arange(grid.shape[1], dtype=np.int64) * 3600
+        _collect(resp_derived['6']['data'], stations, rolling_ok, rolling_mean, _format(hour_keys),
+                 _format(hour_keys + 3600), component, 6)
+    return resp_derived
+
+
+def _collect(dict_data, stations, ok, values, keys, ends, component, scope):
+    for station_pos, column_pos in zip(*np.nonzero(ok)):
+        dict_data.setdefault(str(stations[station_pos]), dict())[str(keys[column_pos])] = \
+            [component, scope, float(values[station_pos, column_pos]), str(ends[column_pos]), 0]
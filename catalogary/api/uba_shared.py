@@ -0,0 +1,141 @@
+####
+# Copyright 2023 burrizza
+######
+import logging
+import sys
+import threading
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from .uba_cube import MeasuresCube
+from .uba_frame import MeasuresFrame
+
+logger = logging.getLogger(__name__)
+
+# kind -> (class, array attributes, other attributes passed to the constructor)
+KINDS = {
+    'cube': (MeasuresCube, ('values', 'mask', 'stations', 'timestamps', 'components'), ('step',)),
+    'frame': (MeasuresFrame, MeasuresFrame.COLUMNS, ()),
+}
+ALIGNMENT = 64
+# closed blocks whose arrays were still referenced, their mappings are released by a later close
+_pending = list()
+_pending_lock = threading.Lock()
+
+
+def _open(name):
+    """
+    Attach to an existing block without leaving it registered with the resource tracker, which would unlink it when
+    this process exits.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    block = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(block._name, 'shared_memory')
+    return block
+
+
+class SharedMeasures(object):
+    """
+    A MeasuresCube or MeasuresFrame published to one multiprocessing shared memory block. The small, picklable
+    descriptor is sent to worker processes, which attach to the block and get the same object on read-only NumPy views
+    of the shared memory instead of a copy of the arrays.
+    The publishing process owns the block and unlinks it on close, the arrays of an attached object must not be used
+    after closing its handle. Used as context manager, the handle returns its data and closes on exit.
+    """
+
+    def __init__(self, block, descriptor, data, owner):
+        self._block = block
+        self.descriptor = descriptor
+        self.data = data
+        self.owner = owner
+
+    def __enter__(self):
+        return self.data
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @classmethod
+    def publish(cls, data, name=None):
+        """
+        Copy the arrays of a MeasuresCube or MeasuresFrame into a new shared memory block.
+        Args:
+            data: The MeasuresCube or MeasuresFrame.
+            name: OPTIONAL: Name of the block (generated if None).
+
+        Returns: The owning SharedMeasures, its data uses the shared arrays as well.
+        """
+        kind = next((kind for kind, (klass, _, _) in KINDS.items() if isinstance(data, klass)), None)
+        if kind is None:
+            raise TypeError(f'Unable to share {type(data).__name__}')
+        _, array_names, attribute_names = KINDS[kind]
+        arrays = {array_name: np.ascontiguousarray(getattr(data, array_name)) for array_name in array_names}
+        layout = dict()
+        size = 0
+        for array_name, array in arrays.items():
+            layout[array_name] = (size, array.dtype.str, array.shape)
+            size += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        block = shared_memory.SharedMemory(name=name, create=True, size=max(size, 1))
+        try:
+            for array_name, array in arrays.items():
+                offset, dtype, shape = layout[array_name]
+                np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)[...] = array
+            descriptor = {'name': block.name, 'kind': kind, 'arrays': layout,
+                          'attributes': {attribute: getattr(data, attribute) for attribute in attribute_names}}
+            return cls(block, descriptor, cls._build(block, descriptor), True)
+        except BaseException:
+            block.close()
+            block.unlink()
+            raise
+
+    @classmethod
+    def attach(cls, descriptor):
+        """
+        Attach to a published block (zero-copy).
+        Args:
+            descriptor: The descriptor of the publishing SharedMeasures.
+
+        Returns: SharedMeasures with the MeasuresCube or MeasuresFrame on read-only views as data.
+        """
+        block = _open(descriptor['name'])
+        return cls(block, descriptor, cls._build(block, descriptor), False)
+
+    @staticmethod
+    def _build(block, descriptor):
+        klass, array_names, _ = KINDS[descriptor['kind']]
+        arrays = list()
+        for array_name in array_names:
+            offset, dtype, shape = descriptor['arrays'][array_name]
+            array = np.ndarray(tuple(shape), dtype=dtype, buffer=block.buf, offset=offset)
+            array.flags.writeable = False
+            arrays.append(array)
+        return klass(*arrays, **descriptor['attributes'])
+
+    @property
+    def nbytes(self):
+        return self._block.size
+
+    def close(self):
+        """
+        Release the data and detach from the block, the owner removes the block as well.
+        """
+        if self._block is None:
+            return
+        self.data = None
+        if self.owner:
+            if sys.version_info < (3, 13):
+                # an attached process sharing the resource tracker (spawn) unregistered the name already
+                resource_tracker.register(self._block._name, 'shared_memory')
+            self._block.unlink()
+        with _pending_lock:
+            _pending.append(self._block)
+            self._block = None
+            for block in list(_pending):
+                try:
+                    block.close()
+                    _pending.remove(block)
+                except BufferError:
+                    # arrays of the data are still referenced, retried on the next close
+                    logger.debug(f'Shared measures {block.name} are still in use, the mapping stays open')
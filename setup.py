@@ -27,6 +27,7 @@ setup(
     maintainer_email='',
     url='https://github.com/burrizza/CATalogary',
     install_requires=['requests', 'jsonschema'],
+    extras_require={'numpy': ['numpy']},
     platforms='Platform Independent',
     keywords=['CATalog', 'REST API', 'Open APIs', 'Bundesrepublik Deutschland', 'NINA', 'KATwarn', 'MoWaS', 'BIWapp', 'LHP', 'DWD', 'POLICE', 'Air Data', 'Bevoelkerungsschutz', 'Umweltbundesamt'],
     classifiers=[
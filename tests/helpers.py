@@ -0,0 +1,64 @@
+####
+# Copyright 2023 burrizza
+######
+import json as _json
+import threading
+import time
+import urllib.parse
+
+from catalogary.api.transport import Transport, Urllib3Response
+
+
+class StubTransport(Transport):
+    """
+    Transport answering every request locally (no requests), recording the calls, the requested urls, the start
+    times and the peak of concurrent requests.
+    """
+
+    def __init__(self, content=b'{"id": "dwd.1"}', status=200, delay=0, answer=None, blocking=False):
+        """
+        Args:
+            content: The body of every response.
+            status: The status code of every response.
+            delay: Seconds every request takes.
+            answer: OPTIONAL: Function (path, query) -> JSON value of the response, instead of the content.
+            blocking: Every request waits until the test sets release (at most 5 seconds).
+        """
+        self.content = content
+        self.status = status
+        self.delay = delay
+        self.answer = answer
+        self.calls = 0
+        self.urls = list()
+        self.started = list()
+        self.running = 0
+        self.peak = 0
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        if not blocking:
+            self.release.set()
+        self._lock = threading.Lock()
+
+    def request(self, method, url, headers=None, data=None, json=None, timeout=None, verify=True, files=None,
+                proxies=None):
+        with self._lock:
+            self.calls += 1
+            self.urls.append(url)
+            self.started.append(time.monotonic())
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        self.entered.set()
+        try:
+            self.release.wait(5)
+            if self.delay:
+                time.sleep(self.delay)
+        finally:
+            with self._lock:
+                self.running -= 1
+        return Urllib3Response(self.status, 'OK' if self.status < 400 else 'Error', {}, url, self._content(url))
+
+    def _content(self, url):
+        if self.answer is None:
+            return self.content
+        parsed = urllib.parse.urlparse(url)
+        return _json.dumps(self.answer(parsed.path, urllib.parse.parse_qs(parsed.query))).encode('utf-8')
@@ -0,0 +1,133 @@
+####
+# Copyright 2023 burrizza
+######
+import copy
+import json
+import os
+import zlib
+import tempfile
+import unittest
+from unittest import TestCase
+
+from catalogary.api import WarningArchive
+
+T0 = 1690880400.0  # 2023-08-01 09:00 UTC
+
+
+def entry(key, version=1, headline='Sturm', ars='091620000000', expires='2023-08-02T10:00:00+02:00'):
+    return {
+        'warning': {'id': key, 'version': version, 'startDate': '2023-08-01T10:00:00+02:00',
+                    'expiresDate': expires, 'severity': 'Minor', 'type': 'Alert'},
+        'warning_detail': {'identifier': key, 'sender': 'DWD', 'info': [
+            {'headline': headline, 'description': 'Es treten Sturmboeen auf. ' * 20,
+             'area': [{'areaDesc': 'Kreis', 'geocode': [{'valueName': 'SHN', 'value': ars}]}]}]},
+        'warning_geo': {'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [[[11.5, 48.1], [11.6, 48.2]]]}}]},
+    }
+
+
+class TestWarningArchive(TestCase):
+    """
+    Tests for the historical warning archive
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.archive = WarningArchive(os.path.join(self.tmp_dir.name, 'archive.db'), keyframe_interval=4)
+        self.first = [entry('dwd.1'), entry('dwd.2', ars='010010000000', expires=None)]
+        self.archive.record(self.first, source='dwd', seen=T0)
+
+    def tearDown(self):
+        self.archive.close()
+        self.tmp_dir.cleanup()
+
+    def _keys(self, entries):
+        """Returns: The (id, version) of the entries"""
+        return [(e['warning']['id'], e['warning']['version']) for e in entries]
+
+    def test_versions(self):
+        """Only new versions are stored, the previous one is superseded"""
+        self.assertEqual(self.archive.record(self.first, source='dwd', seen=T0 + 60), 0)
+        self.assertEqual(self.archive.record([entry('dwd.1', 2, headline='Orkan'), self.first[1]], source='dwd',
+                                             seen=T0 + 3600), 1)
+        self.assertEqual(self.archive.get('dwd.1', 1), self.first[0])
+        self.assertEqual(self.archive.get('dwd.1')['warning_detail']['info'][0]['headline'], 'Orkan')
+        self.assertEqual([version['until'] for version in self.archive.versions('dwd.1')], [T0 + 3600, None])
+
+    def test_active_at(self):
+        """Point in time queries return the version valid at that time"""
+        self.archive.record([entry('dwd.1', 2)], source='dwd', seen=T0 + 3600)
+        self.assertEqual(self._keys(self.archive.active_at(T0 + 10)), [('dwd.1', 1), ('dwd.2', 1)])
+        # dwd.2 vanished from the feed, dwd.1 was updated
+        self.assertEqual(self._keys(self.archive.active_at(T0 + 7200)), [('dwd.1', 2)])
+        self.assertEqual(self._keys(self.archive.active_at('2023-08-03T00:00:00+02:00')), [])
+        self.assertEqual(self._keys(self.archive.active_at(T0 - 7200)), [])
+
+    def test_active_between(self):
+        """Interval queries return every version valid at some time of the interval"""
+        self.archive.record([entry('dwd.1', 2)], source='dwd', seen=T0 + 3600)
+        self.assertEqual(self._keys(self.archive.active_between(T0, T0 + 7200)),
+                         [('dwd.1', 1), ('dwd.2', 1), ('dwd.1', 2)])
+        self.assertEqual(self._keys(self.archive.active_between(T0 + 3700, T0 + 7200)), [('dwd.1', 2)])
+
+    def test_region(self):
+        """Regional queries match the regional key prefix and the superordinate regions"""
+        self.assertEqual(self._keys(self.archive.active_at(T0, ars='09')), [('dwd.1', 1)])
+        self.assertEqual(self._keys(self.archive.active_at(T0, ars='09163')), [])
+        self.archive.record([entry('dwd.3', ars='090000000000')], seen=T0)
+        # a warning for the whole Land covers its Kreise
+        self.assertEqual(self._keys(self.archive.active_at(T0, ars='09162')), [('dwd.1', 1), ('dwd.3', 1)])
+        self.assertEqual(self._keys(self.archive.active_at(T0, ars='09162', covering=False)), [('dwd.1', 1)])
+        with self.assertRaises(ValueError):
+            self.archive.active_at(T0, ars='Bayern')
+
+    def test_delta_compression(self):
+        """Changed parts are stored as deltas, unchanged parts only once"""
+        size = self.archive.stats()['bytes']
+        for version in range(2, 10):
+            self.archive.record([entry('dwd.1', version, headline=f'Sturm {version}')], seen=T0 + version)
+        stats = self.archive.stats()
+        self.assertEqual(stats['versions'], 10)
+        full = sum(len(zlib.compress(json.dumps(entry('dwd.1', version, headline=f'Sturm {version}')).encode(), 9))
+                   for version in range(2, 10))
+        self.assertLess(stats['bytes'] - size, full / 2)
+        for version in range(2, 10):
+            self.assertEqual(self.archive.get('dwd.1', version), entry('dwd.1', version, headline=f'Sturm {version}'))
+
+    def test_large_delta(self):
+        """A change of a large geojson is stored as a small patch, not compressed again as a whole"""
+        large = entry('dwd.1', 2)
+        large['warning_geo']['features'][0]['geometry']['coordinates'] = [
+            [[11 + i / 1000, 48 + (i * 7 % 1000) / 1000] for i in range(20000)]]
+        self.archive.record([large], seen=T0 + 10)
+        size = self.archive.stats()['bytes']
+        changed = copy.deepcopy(large)
+        changed['warning']['version'] = 3
+        changed['warning_geo']['features'][0]['geometry']['coordinates'][0][5000] = [12.5, 49.5]
+        changed['warning_geo']['features'][0]['geometry']['coordinates'][0].append([11.0, 48.0])
+        self.archive.record([changed], seen=T0 + 20)
+        self.assertLess(self.archive.stats()['bytes'] - size, 500)
+        self.archive._decoded.clear()
+        self.assertEqual(self.archive.get('dwd.1', 3), changed)
+
+    def test_cache_bound(self):
+        """The decoded blobs kept as delta bases are bounded by their size"""
+        archive = WarningArchive(os.path.join(self.tmp_dir.name, 'small.db'), cache_bytes=2000)
+        for key in range(10):
+            archive.record([entry(f'dwd.{key}')], seen=T0)
+            archive.get(f'dwd.{key}')
+        self.assertLessEqual(archive._decoded_bytes, 2000)
+        self.assertEqual(archive._decoded_bytes, sum(len(raw) for raw in archive._decoded.values()))
+        self.assertEqual(archive.get('dwd.0'), entry('dwd.0'))
+        archive.close()
+
+    def test_lzma(self):
+        """Keyframes can be compressed with lzma"""
+        archive = WarningArchive(os.path.join(self.tmp_dir.name, 'lzma.db'), codec='lzma')
+        archive.record([copy.deepcopy(self.first[0])], seen=T0)
+        self.assertEqual(archive.get('dwd.1'), self.first[0])
+        archive.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
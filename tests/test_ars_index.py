@@ -0,0 +1,53 @@
+####
+# Copyright 2023 burrizza
+######
+import unittest
+from unittest import TestCase
+
+from catalogary.api import ArsIndex, normalize_ars
+
+
+def detail(*codes):
+    return {'info': [{'area': [{'areaDesc': code, 'geocode': [{'valueName': code, 'value': code}]}
+                               for code in codes]}]}
+
+
+class TestArsIndex(TestCase):
+    """
+    Tests for the regional key (ARS) index
+    """
+
+    def test_normalize_ars(self):
+        """Reduce regional keys to their significant prefix"""
+        self.assertEqual(normalize_ars('091620000000'), '09162')
+        self.assertEqual(normalize_ars('091620000001'), '091620000001')
+        self.assertEqual(normalize_ars('09'), '09')
+        self.assertEqual(normalize_ars('091620000001', level='kreis'), '09162')
+        self.assertEqual(normalize_ars('000000000000'), '')
+        self.assertIsNone(normalize_ars('DWD-123'))
+
+    def test_query(self):
+        """Query the warnings of Land, Kreis and Gemeinde"""
+        index = ArsIndex.from_details({'kreis': detail('091620000000'),
+                                       'gemeinde': detail('091610000001', '052220000000'),
+                                       'land': detail('090000000000')})
+        self.assertEqual(index.query('09', covering=False), {'kreis', 'gemeinde', 'land'})
+        self.assertEqual(index.query('05'), {'gemeinde'})
+        self.assertEqual(index.query('091620000042'), {'kreis', 'land'})
+        self.assertEqual(index.query('091610000001'), {'gemeinde', 'land'})
+        self.assertEqual(index.query('091610000001', level='kreis', covering=False), {'gemeinde'})
+
+    def test_update_and_remove(self):
+        """Keep the index consistent when warnings change or expire"""
+        index = ArsIndex()
+        index.update('warning', detail('091620000000'), version=1)
+        index.update('warning', detail('052220000000'), version=2)
+        self.assertEqual(index.query('09'), set())
+        self.assertEqual(index.version('warning'), 2)
+        index.remove('warning')
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.query('05'), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
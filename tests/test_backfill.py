@@ -0,0 +1,114 @@
+####
+# Copyright 2023 burrizza
+######
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import TestCase
+from urllib.parse import parse_qs, urlsplit
+
+from catalogary.api import UmweltbundesamtBackfill, plan_tasks
+from catalogary.api.backfill import RateBudget
+from tests.helpers import StubTransport
+
+
+class RecordingTransport(StubTransport):
+    """StubTransport logging the time and the url of every request to a file (shared by the worker processes)"""
+
+    def __init__(self, log_path):
+        super(RecordingTransport, self).__init__(content=b'{"data": {}}')
+        self.log_path = log_path
+
+    def request(self, method, url, *args, **kwargs):
+        with open(self.log_path, 'a', encoding='utf-8') as f_log:
+            f_log.write(f'{time.time()} {url}\n')
+        return super(RecordingTransport, self).request(method, url, *args, **kwargs)
+
+
+class TestBackfill(TestCase):
+    """
+    Tests for the resumable backfill (no requests, the workers answer locally)
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.out_dir = os.path.join(self.tmp_dir.name, 'out')
+        self.log_path = os.path.join(self.tmp_dir.name, 'requests.log')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def backfill(self, rate=None):
+        return UmweltbundesamtBackfill('http://localhost/', self.out_dir, processes=2, rate=rate, window_days=2,
+                                       client_kwargs={'transport': RecordingTransport(self.log_path)})
+
+    def requests(self):
+        """Returns: List with the time and the query of every request sent by the workers"""
+        if not os.path.exists(self.log_path):
+            return list()
+        with open(self.log_path, encoding='utf-8') as f_log:
+            return [(float(sent), {key: value[0] for key, value in parse_qs(urlsplit(url).query).items()})
+                    for sent, url in (line.split(' ', 1) for line in f_log)]
+
+    def test_resume(self):
+        """Completed tasks are skipped on a rerun, the others run once"""
+        tasks = [task.id for task in plan_tasks(['1', '5'], ['2'], '2023-01-01', '2023-01-04', window_days=2)]
+        resp = self.backfill().run(['1', '5'], '2023-01-01', '2023-01-02')
+        self.assertEqual(sorted(resp['done']), tasks[:1] + tasks[2:3])
+        for task_id in resp['done']:
+            self.assertTrue(os.path.exists(os.path.join(self.out_dir, f'{task_id}.json.gz')))
+        resp_resumed = self.backfill().run(['1', '5'], '2023-01-01', '2023-01-04')
+        self.assertEqual(sorted(resp_resumed['skipped']), sorted(resp['done']))
+        self.assertEqual(sorted(resp_resumed['done']), tasks[1:2] + tasks[3:])
+        self.assertEqual(resp_resumed['failed'], [])
+        # every task was requested exactly once
+        self.assertEqual(len(self.requests()), len(tasks))
+
+    def test_truncated_manifest(self):
+        """A manifest line cut off by a crash is ignored and its task is repeated"""
+        backfill = self.backfill()
+        first, second = plan_tasks(['1'], ['2'], '2023-01-01', '2023-01-04', window_days=2)
+        os.makedirs(self.out_dir)
+        with open(backfill.manifest, 'w', encoding='utf-8') as f_manifest:
+            f_manifest.write(f'{{"id": "{first.id}", "finished": 1.0}}\n{{"id": "{second.id[:8]}')
+        with self.assertLogs('catalogary.api.backfill', level='WARNING'):
+            self.assertEqual(backfill.completed(), {first.id})
+        resp = backfill.run(['1'], '2023-01-01', '2023-01-04')
+        self.assertEqual((resp['skipped'], resp['done']), ([first.id], [second.id]))
+        self.assertEqual([query['date_from'] for _, query in self.requests()], [second.date_from])
+
+    def test_rate_budget(self):
+        """The workers request the planned windows no faster than the shared rate"""
+        rate = 20
+        tasks = plan_tasks(['1', '5'], ['2'], '2023-01-01', '2023-01-06', window_days=2)
+        self.backfill(rate=rate).run(['1', '5'], '2023-01-01', '2023-01-06')
+        requests = sorted(self.requests(), key=lambda request: request[0])
+        self.assertEqual(sorted((query['component'], query['date_from'], query['date_to']) for _, query in requests),
+                         sorted((task.component, task.date_from, task.date_to) for task in tasks))
+        # the slots are spaced by 1 / rate, the requests of both processes follow them
+        self.assertGreaterEqual(requests[-1][0] - requests[0][0], (len(tasks) - 1) / rate * 0.9)
+
+    def test_budget_spacing(self):
+        """The slots of a budget are handed out 1 / rate apart, also to concurrent callers"""
+        budget = RateBudget(50, lock=threading.Lock())
+        slots = list()
+        lock = threading.Lock()
+
+        def acquire():
+            budget.acquire()
+            with lock:
+                slots.append(time.time())
+
+        threads = [threading.Thread(target=acquire) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        slots.sort()
+        self.assertGreaterEqual(slots[-1] - slots[0], 5 / 50 * 0.9)
+
+
+if __name__ == '__main__':
+    unittest.main()
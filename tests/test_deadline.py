@@ -0,0 +1,128 @@
+####
+# Copyright 2023 burrizza
+######
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+from catalogary import NinaAPI
+from catalogary.api import (AdaptiveLimiter, Deadline, DeadlineExceeded, PartialCount, PartialDict, PartialList,
+                            PriorityScheduler)
+from catalogary.api.deadline import current_deadline, with_deadline
+from tests.helpers import StubTransport
+
+
+class TestDeadline(TestCase):
+    """
+    Tests for deadline budgets and partial results (no requests)
+    """
+
+    def test_timeout(self):
+        """The timeouts and the sleeps are cut to the remaining time, an expired deadline raises"""
+        deadline = Deadline(10)
+        self.assertEqual(deadline.timeout(3, 75)[0], 3)
+        self.assertLessEqual(deadline.timeout(3, 75)[1], 10)
+        self.assertFalse(deadline.expired)
+        expired = Deadline(0)
+        self.assertTrue(expired.expired)
+        self.assertEqual(expired.remaining(), 0)
+        with self.assertRaises(DeadlineExceeded):
+            expired.timeout(3, 75)
+        start = time.monotonic()
+        Deadline(0.05).sleep(10)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_applied(self):
+        """An outer deadline expiring earlier stays in force"""
+        outer, inner = Deadline(1), Deadline(10)
+        with outer.applied():
+            # the earlier deadline stays in force
+            with inner.applied():
+                self.assertIs(current_deadline.get(), outer)
+            with Deadline(0.5).applied() as earlier:
+                self.assertIs(current_deadline.get(), earlier)
+        self.assertIsNone(current_deadline.get())
+
+    def test_with_deadline(self):
+        """The decorated method receives a Deadline which is applied to its requests"""
+        @with_deadline
+        def operation(value, deadline=None):
+            return deadline, current_deadline.get()
+
+        self.assertEqual(operation(1), (None, None))
+        deadline, applied = operation(1, deadline=5)
+        self.assertIsInstance(deadline, Deadline)
+        self.assertIs(deadline, applied)
+        deadline, applied = operation(1, 5)
+        self.assertIs(deadline, applied)
+
+    def test_partial(self):
+        """The partial results behave like their base types and name the missing parts"""
+        result = PartialList([1, 2], missing=['dwd.3'])
+        self.assertEqual(result, [1, 2])
+        self.assertFalse(result.complete)
+        self.assertTrue(PartialDict({'a': 1}).complete)
+        count = PartialCount(3, ['dwd.3'])
+        self.assertEqual(count + 1, 4)
+        self.assertEqual(count.missing, ['dwd.3'])
+
+    def test_client_timeout(self):
+        """The client cuts its timeouts to the deadline and sends no request once it expired"""
+        self.assertEqual(NinaAPI(url='http://localhost/')._timeout(), 75)
+        nina = NinaAPI(url='http://localhost/', connect_timeout=3, timeout=30)
+        self.assertEqual(nina._timeout(), (3, 30))
+        with Deadline(10).applied():
+            connect, read = nina._timeout()
+            self.assertEqual(connect, 3)
+            self.assertLessEqual(read, 10)
+        with Deadline(0).applied():
+            with self.assertRaises(DeadlineExceeded):
+                nina.warning_detail('dwd.1')
+
+    def test_generic_complete(self):
+        """An expired deadline returns an empty partial result naming all warnings instead of raising"""
+        nina = NinaAPI(url='http://localhost:9/')
+        result = nina.generic_complete([{'id': 'dwd.1'}, {'id': 'dwd.2'}], deadline=0)
+        self.assertEqual(result, [])
+        self.assertEqual(result.missing, ['dwd.1', 'dwd.2'])
+
+    def test_waiting(self):
+        """Waiting for a slot of the scheduler or the limiter ends with the deadline, no request is sent"""
+        scheduler = PriorityScheduler(max_concurrency=1)
+        limiter = AdaptiveLimiter(initial=1)
+        for options, hold, free in ((dict(scheduler=scheduler), scheduler.acquire, lambda _: scheduler.release()),
+                                    (dict(limiter=limiter), limiter.acquire, limiter.release)):
+            transport = StubTransport()
+            nina = NinaAPI(url='http://localhost/', transport=transport, **options)
+            held = hold()
+            try:
+                start = time.monotonic()
+                with Deadline(0.1).applied():
+                    with self.assertRaises(DeadlineExceeded):
+                        nina.warning_detail('dwd.1')
+                self.assertLess(time.monotonic() - start, 2)
+                self.assertEqual(transport.calls, 0)
+            finally:
+                free(held)
+            self.assertEqual(nina.warning_detail('dwd.1'), {'id': 'dwd.1'})
+        self.assertEqual(scheduler.stats()['interactive'], {'running': 0, 'queued': 0})
+
+    def test_waiting_coalesced(self):
+        """Waiting for an identical running request ends with the deadline of the follower"""
+        nina = NinaAPI(url='http://localhost/', transport=StubTransport(blocking=True), coalesce=True)
+        leader = threading.Thread(target=nina.warning_detail, args=('dwd.1',))
+        leader.start()
+        try:
+            self.assertTrue(nina.transport.entered.wait(5))
+            with Deadline(0.1).applied():
+                with self.assertRaises(DeadlineExceeded):
+                    nina.warning_detail('dwd.1')
+        finally:
+            nina.transport.release.set()
+            leader.join()
+        self.assertEqual(nina.transport.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,11 +6,13 @@ import json
 import logging
 import sys
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase
 
 from jsonschema import validate
 
 from catalogary import NinaAPI
+from catalogary.api import NinaRefresher
 
 logger = logging.getLogger()
 
@@ -26,6 +28,19 @@ class TestNina(TestCase):
                                                              # https://stackoverflow.com/a/7483862)
         self.nina = NinaAPI(url=f'https://nina.api.proxy.bund.dev/')
 
+    # Dashboard - warnings of a region
+    def test_get_dashboard(self):
+        """Retrieve the warnings of Muenchen (Kreis) from NINA interface if exist"""
+        resp = self.nina.dashboard(ars='091620000000')
+        self.assertIsInstance(resp, list)
+
+    def test_update_ars_index(self):
+        """Index the D_wD warnings by the regional keys of their details"""
+        resp_warnings = self.nina.dwd_warnings()
+        index, errors = self.nina.update_ars_index(resp_warnings)
+        self.assertEqual(len(index) + len(errors), len({resp['id'] for resp in resp_warnings}))
+        self.assertLessEqual(index.query('00', covering=False), index.keys())
+
     # KAT_warn
     def test_get_katwarn_warnings(self):
         """Retrieve KAT_wARN warnings from NINA interface if exist"""
@@ -136,6 +151,54 @@ class TestNina(TestCase):
             resp_geo = self.nina.warning_geo(key=resp_id)
             validate(instance=resp_geo, schema=self.nina.JSON_SCHEMA_WARNINGS_GEO)
 
+    def test_get_dwd_warning_detail_urllib3(self):
+        """Retrieve D_wD warnings and a detail using the lean urllib3 transport"""
+        nina = NinaAPI(url=f'https://nina.api.proxy.bund.dev/', transport='urllib3')
+        resp = nina.dwd_warnings()
+        self.assertIsInstance(resp, list)
+        if len(resp):
+            validate(instance=resp, schema=self.nina.JSON_SCHEMA_DWD_WARNINGS)
+            resp_detail = nina.warning_detail(key=resp[0]['id'])
+            validate(instance=resp_detail, schema=self.nina.JSON_SCHEMA_WARNINGS_DETAIL)
+        nina.close()
+
+    def test_get_dwd_warnings_coalesced(self):
+        """Retrieve D_wD warnings concurrently through one shared in-flight request"""
+        nina = NinaAPI(url=f'https://nina.api.proxy.bund.dev/', coalesce=True)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            resps = list(executor.map(lambda _: nina.dwd_warnings(), range(8)))
+        for resp in resps:
+            self.assertIsInstance(resp, list)
+        if len(resps[0]):
+            validate(instance=resps[0], schema=self.nina.JSON_SCHEMA_DWD_WARNINGS)
+
+    def test_refresh_dwd_snapshot(self):
+        """Keep a snapshot of the D_wD warnings and their complete view"""
+        refresher = NinaRefresher(self.nina, feeds=('dwd',), complete=True)
+        self.assertIsNone(refresher.snapshot('dwd'))
+        self.assertIsNone(refresher.age('dwd'))
+        refresher.refresh()
+        resp = refresher.snapshot('dwd')
+        self.assertIsInstance(resp, list)
+        self.assertGreaterEqual(refresher.age('dwd'), 0)
+        if len(resp):
+            validate(instance=resp, schema=self.nina.JSON_SCHEMA_DWD_WARNINGS)
+            validate(instance=refresher.snapshot('dwd_complete'), schema=self.nina.JSON_SCHEMA_WARNINGS_COMPLETE)
+
+    def test_get_dwd_warning_details(self):
+        """Retrieve the details and geo information of all D_wD warnings in bulk if exist"""
+        resp = self.nina.dwd_warnings()
+        self.assertIsInstance(resp, list)
+        keys = [warning['id'] for warning in resp]
+        resp_details, errors_details = self.nina.warning_details(keys + keys[:1])
+        resp_geos, errors_geos = self.nina.warning_geos(keys)
+        self.assertEqual(set(resp_details) | set(errors_details), set(keys))
+        self.assertEqual(set(resp_geos) | set(errors_geos), set(keys))
+        for resp_detail in resp_details.values():
+            validate(instance=resp_detail, schema=self.nina.JSON_SCHEMA_WARNINGS_DETAIL)
+        for resp_geo in resp_geos.values():
+            validate(instance=resp_geo, schema=self.nina.JSON_SCHEMA_WARNINGS_GEO)
+
     def test_get_dwdComplete(self):
         """Retrieve D_wD warnings from NINA interface if exist"""
         resp_warnings = self.nina.dwd_warnings()
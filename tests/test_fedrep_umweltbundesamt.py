@@ -4,7 +4,9 @@
 ######
 import json
 import logging
+import os
 import sys
+import tempfile
 import unittest
 from datetime import datetime, date, timedelta
 from unittest import TestCase
@@ -12,6 +14,7 @@ from unittest import TestCase
 from jsonschema import validate
 
 from catalogary import UmweltbundesamtAPI
+from catalogary.api import plan_tasks
 
 logger = logging.getLogger()
 
@@ -73,6 +76,15 @@ class TestUmweltbundesamt(TestCase):
             self.assertIsInstance(resp, dict)
             logger.debug(json.dumps(resp.get('21'), ensure_ascii=False))
 
+    def test_get_measuresCube(self):
+        """Retrieve the hourly measurements of all components as dense cube."""
+        yesterday = date.today() - timedelta(days=1)
+        resp_comp = self.umbamt.components()
+        cube = self.umbamt.measures_cube(respComponents=resp_comp, date_from=yesterday.strftime("%Y-%m-%d"),
+                                         date_to=yesterday.strftime("%Y-%m-%d"))
+        self.assertEqual(cube.shape[2], resp_comp.get('count'))
+        self.assertEqual(cube.values.shape, cube.mask.shape)
+
     def test_get_measuresAll(self):
         """Should cover the default use cases including stations and hourly bases measurements."""
         yesterday = date.today() - timedelta(days=1)
@@ -89,5 +101,76 @@ class TestUmweltbundesamt(TestCase):
             self.assertIsInstance(resp, list)
             logger.debug(json.dumps(resp[:20], ensure_ascii=False))
 
+    def test_get_measuresAllDerived(self):
+        """Should deliver the default scopes computed locally from the hourly measurements."""
+        yesterday = date.today() - timedelta(days=1)
+        resp_comp = self.umbamt.components()
+        resp = self.umbamt.measures_stations(respComponents=resp_comp,
+                                             date_from=yesterday.strftime("%Y-%m-%d"),
+                                             date_to=yesterday.strftime("%Y-%m-%d"),
+                                             derive_scopes=True)
+        self.assertIsInstance(resp, list)
+        if (len(resp)):
+            self.assertTrue(any('1TMWGL' in measures for row in resp for measures in row['measures'].values()))
+            logger.debug(json.dumps(resp[:20], ensure_ascii=False))
+
+    def test_derive_previous_day(self):
+        """The sliding mean is computed from the whole previous day but starts like the direct request (no request is
+        sent)."""
+        calls = list()
+
+        def measures(**kwargs):
+            calls.append(kwargs)
+            hours = [datetime(2023, 8, 4) + timedelta(hours=hour) for hour in range(48)]
+            return {'data': {'238': {ts.strftime('%Y-%m-%d %H:%M:%S'): [5, kwargs['scope'], 10.0, '', 0]
+                                     for ts in hours if ts >= datetime.fromisoformat(kwargs['date_from'])
+                                     + timedelta(hours=int(kwargs['time_from']) - 1)}}}
+
+        self.umbamt.measures = measures
+        direct = measures(date_from='2023-08-05', time_from='12', scope='6')['data']['238']
+        resp = self.umbamt._derive_scopes(['1', '6'], 5, '2023-08-05', '12', '2023-08-05', '24')
+        self.assertEqual((calls[1]['date_from'], calls[1]['time_from']), ('2023-08-04', '1'))
+        self.assertEqual(sorted(resp['6']['data']['238']), sorted(direct))
+        self.assertEqual(sorted(resp['2']['data']['238']), sorted(direct))
+        self.assertEqual(min(direct), '2023-08-05 11:00:00')
+        # the daily mean of the first day is kept, the one of the additional day is dropped
+        self.assertEqual(list(resp['1']['data']['238']), ['2023-08-05 00:00:00'])
+        resp_hourly = self.umbamt._derive_scopes(['1'], 5, '2023-08-05', '12', '2023-08-05', '24')
+        self.assertEqual(sorted(resp_hourly['2']['data']['238']), sorted(direct))
+
+    def test_get_measuresAllCompact(self):
+        """Should deliver the same measurements with one shared station dict per station."""
+        yesterday = date.today() - timedelta(days=1)
+        resp_comp = self.umbamt.components()
+        kwargs = dict(respComponents=resp_comp, date_from=yesterday.strftime("%Y-%m-%d"),
+                      date_to=yesterday.strftime("%Y-%m-%d"), dict_scopes={'2': '1SMW'})
+        resp = self.umbamt.measures_stations(**kwargs)
+        resp_compact = self.umbamt.measures_stations(compact=True, **kwargs)
+        self.assertEqual(len(resp), len(resp_compact))
+        if (len(resp_compact) > 1):
+            self.assertEqual(set(resp_compact[0]), {'timestamp', 'station_id', 'station', 'measures'})
+            rows = [row for row in resp_compact if row['station_id'] == resp_compact[0]['station_id']]
+            self.assertTrue(all(row['station'] is rows[0]['station'] for row in rows))
+
+    def test_plan_backfill(self):
+        """Partition a backfill into (component, scope, time window) tasks."""
+        tasks = plan_tasks(['1', '5'], ['2'], '2023-01-01', '2023-01-10', window_days=7)
+        self.assertEqual([task.id for task in tasks], ['1_2_2023-01-01_2023-01-07', '1_2_2023-01-08_2023-01-10',
+                                                       '5_2_2023-01-01_2023-01-07', '5_2_2023-01-08_2023-01-10'])
+
+    def test_backfill(self):
+        """Backfill the hourly measurements of one component for two days and resume it."""
+        day_before_yesterday = date.today() - timedelta(days=2)
+        yesterday = date.today() - timedelta(days=1)
+        with tempfile.TemporaryDirectory() as out_dir:
+            resp = self.umbamt.backfill(out_dir, day_before_yesterday, yesterday, components=['1'], processes=2,
+                                        window_days=1)
+            self.assertEqual(len(resp['done']) + len(resp['failed']), 2)
+            for task_id in resp['done']:
+                self.assertTrue(os.path.exists(os.path.join(out_dir, f'{task_id}.json.gz')))
+            resp_resumed = self.umbamt.backfill(out_dir, day_before_yesterday, yesterday, components=['1'],
+                                                processes=2, window_days=1)
+            self.assertEqual(sorted(resp_resumed['skipped']), sorted(resp['done']))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,99 @@
+####
+# Copyright 2023 burrizza
+######
+import json
+import unittest
+import urllib.error
+import urllib.request
+from unittest import TestCase
+
+from catalogary.api import FanoutGateway, SnapshotRefresher
+
+
+class TestFanoutGateway(TestCase):
+    """
+    Tests for the local fan-out gateway (served from local sources, no upstream requests)
+    """
+
+    def setUp(self):
+        self.data = {'a': [1, 2, 3]}
+        self.calls = 0
+
+        def source():
+            self.calls += 1
+            return dict(self.data)
+
+        self.refresher = SnapshotRefresher({'feed': source}, interval=3600)
+        self.gateway = FanoutGateway({'test': self.refresher}, port=0, keepalive=0.2, subscriber_queue_size=2)
+        self.gateway.start()
+
+    def tearDown(self):
+        self.gateway.stop()
+
+    def _get(self, path, headers=None):
+        request = urllib.request.Request(self.gateway.url + path, headers=headers or {})
+        return urllib.request.urlopen(request, timeout=5)
+
+    def test_snapshot(self):
+        """Snapshots are served from the gateway with ETag and age, a matching If-None-Match gets 304"""
+        self.refresher.refresh()
+        for _ in range(5):
+            with self._get('test/feed') as resp:
+                self.assertEqual(json.loads(resp.read()), self.data)
+                self.assertIsNotNone(resp.headers['X-Snapshot-Age'])
+                etag = resp.headers['ETag']
+        # the consumers never reach the source
+        self.assertLessEqual(self.calls, 2)
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            self._get('test/feed', headers={'If-None-Match': etag})
+        self.assertEqual(cm.exception.code, 304)
+        with self._get('') as resp:
+            self.assertIn('test/feed', json.loads(resp.read()))
+
+    def test_missing(self):
+        """Unknown sources answer 404"""
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            self._get('unknown/feed')
+        self.assertEqual(cm.exception.code, 404)
+
+    def test_events(self):
+        """The event stream announces a changed snapshot"""
+        self.refresher.refresh()
+        with self._get('events') as resp:
+            self.assertEqual(resp.headers['Content-Type'], 'text/event-stream')
+            self.data = {'a': [4]}
+            self.refresher.refresh()
+            lines = list()
+            while b'event: change\n' not in lines or lines[-1] != b'\n':
+                lines.append(resp.readline())
+        self.assertIn(b'event: change\n', lines)
+        event = json.loads([line for line in lines if line.startswith(b'data: ')][0][6:])
+        self.assertEqual(event['source'], 'test/feed')
+
+    def test_subscribe(self):
+        """A subscription receives the change events until it is closed"""
+        self.refresher.refresh()
+        with self.gateway.subscribe() as subscription:
+            self.data = {'a': [4]}
+            self.refresher.refresh()
+            self.assertIn(b'"source": "test/feed"', subscription.get(timeout=5))
+        self.assertTrue(subscription.closed)
+        self.assertIsNone(subscription.get(timeout=5))
+        # a closed subscription no longer receives events
+        self.data = {'a': [5]}
+        self.refresher.refresh()
+        self.assertIsNone(subscription.get(timeout=5))
+
+    def test_slow_consumer(self):
+        """A consumer falling behind by more than the queue size is closed"""
+        self.refresher.refresh()
+        subscription = self.gateway.subscribe()
+        for value in range(3):
+            self.data = {'a': [value]}
+            self.refresher.refresh()
+        self.assertTrue(subscription.closed)
+        self.assertIsNone(subscription.get(timeout=5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+####
+# Copyright 2023 burrizza
+######
+import itertools
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+from catalogary import NinaAPI
+from catalogary.api import HedgePolicy
+from tests.helpers import StubTransport
+
+
+class TestHedgePolicy(TestCase):
+    """
+    Tests for hedged requests (no requests, the attempts are local callables)
+    """
+
+    def setUp(self):
+        self.policy = HedgePolicy(initial_delay=0.05, min_delay=0.01, budget=0.5, max_tokens=1)
+        self.calls = itertools.count()
+
+    def tearDown(self):
+        self.policy.close()
+
+    def _fetch(self, latencies):
+        """Returns: An attempt sleeping the latency of its call and returning the number of the call"""
+        def fetch():
+            call = next(self.calls)
+            time.sleep(latencies[call])
+            return call
+        return fetch
+
+    def test_fast(self):
+        """A fast request is not hedged"""
+        self.assertEqual(self.policy.run(self._fetch([0])), 0)
+        self.assertEqual(self.policy.stats()['hedges'], 0)
+
+    def test_hedge_wins(self):
+        """The answer of a hedge is returned if it arrives first"""
+        start = time.monotonic()
+        self.assertEqual(self.policy.run(self._fetch([1, 0])), 1)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(self.policy.stats()['hedge_wins'], 1)
+
+    def test_budget(self):
+        """No hedge is sent once the budget is spent"""
+        self.policy.run(self._fetch([0.2, 0]))
+        # the only token was spent, the next slow request is not hedged
+        self.assertEqual(self.policy.run(self._fetch([None, None, 0.2])), 2)
+        self.assertEqual(self.policy.stats()['hedges'], 1)
+
+    def test_errors(self):
+        """The error is raised if all attempts fail, a failed attempt does not win"""
+        def fail():
+            time.sleep(0.1)
+            raise ValueError('failed')
+        with self.assertRaises(ValueError):
+            self.policy.run(fail)
+
+        def fail_first():
+            if next(self.calls) == 0:
+                fail()
+            return 'hedge'
+        self.policy._tokens = 1
+        # a failed attempt does not win
+        self.assertEqual(self.policy.run(fail_first), 'hedge')
+
+    def test_delay(self):
+        """The hedge delay is the percentile of the recent latencies once enough were observed"""
+        policy = HedgePolicy(percentile=90, min_samples=10, min_delay=0)
+        self.assertEqual(policy.delay(), policy.initial_delay)
+        policy._latencies.extend(i / 100 for i in range(100))
+        self.assertAlmostEqual(policy.delay(), 0.9)
+        policy.close()
+
+    def test_primary_not_queued(self):
+        """The first requests are not queued while the pool is saturated, so their concurrency is not capped"""
+        policy = HedgePolicy(initial_delay=10, max_workers=1)
+        barrier = threading.Barrier(4, timeout=5)
+        results = list()
+        threads = [threading.Thread(target=lambda: results.append(policy.run(barrier.wait))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        policy.close()
+        self.assertEqual(sorted(results), [0, 1, 2, 3])
+        self.assertEqual(policy.stats()['hedges'], 0)
+
+    def test_saturated(self):
+        """No hedge is sent while all threads of the pool are busy"""
+        policy = HedgePolicy(initial_delay=0.05, min_delay=0.01, max_workers=1)
+        self.assertEqual(policy.run(self._fetch([0.2, 0])), 0)
+        self.assertEqual(policy.stats()['hedges'], 0)
+        self.assertEqual(policy._tokens, policy.max_tokens)
+        policy.close()
+
+    def test_opt_in(self):
+        """Only the GETs of the hedged endpoints or with hedge=True go through the policy"""
+        nina = NinaAPI(url='http://localhost/', transport=StubTransport(content=b'{}'), hedge=self.policy)
+        nina.warning_detail('dwd.1')
+        nina.dwd_warnings()
+        self.assertEqual(self.policy.stats()['requests'], 2)
+        nina.warning_geo('dwd.1')
+        nina.get('warnings/dwd.1.json', hedge=False)
+        self.assertEqual(self.policy.stats()['requests'], 2)
+        nina.get('warnings/dwd.1.geojson', hedge=True)
+        self.assertEqual(self.policy.stats()['requests'], 3)
+        self.assertEqual(len(nina.transport.urls), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
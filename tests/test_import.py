@@ -0,0 +1,52 @@
+####
+# Copyright 2023 burrizza
+######
+import os
+import subprocess
+import sys
+import unittest
+from unittest import TestCase
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestImport(TestCase):
+    """
+    Guards the lazy import of the package against regressions (every check uses a fresh interpreter)
+    """
+
+    def modules_after(self, statement):
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        proc = subprocess.run([sys.executable, '-c', f'import sys\n{statement}\nprint(" ".join(sys.modules))'],
+                              env=env, capture_output=True, text=True, check=True)
+        return set(proc.stdout.split())
+
+    def test_import_package(self):
+        """Importing the package does not import any API"""
+        modules = self.modules_after('import catalogary')
+        self.assertNotIn('catalogary.api', modules)
+        self.assertNotIn('requests', modules)
+
+    def test_import_api(self):
+        """Importing an API only imports its own module and defers requests to the first client"""
+        modules = self.modules_after('from catalogary import NinaAPI')
+        self.assertIn('catalogary.api.fedrep_nina', modules)
+        self.assertNotIn('catalogary.api.fedrep_umweltbundesamt', modules)
+        self.assertNotIn('requests', modules)
+        modules = self.modules_after('from catalogary.api import UmweltbundesamtAPI')
+        self.assertNotIn('catalogary.api.fedrep_nina', modules)
+        self.assertNotIn('multiprocessing', modules)
+        self.assertNotIn('requests', modules)
+
+    def test_lazy_attributes(self):
+        """The lazy attributes resolve to the API classes"""
+        import catalogary
+        from catalogary.api.fedrep_nina import NinaAPI
+        self.assertIs(catalogary.NinaAPI, NinaAPI)
+        self.assertIs(catalogary.api.NinaAPI, NinaAPI)
+        with self.assertRaises(AttributeError):
+            catalogary.api.MissingAPI
+
+
+if __name__ == '__main__':
+    unittest.main()
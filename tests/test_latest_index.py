@@ -0,0 +1,83 @@
+####
+# Copyright 2023 burrizza
+######
+import unittest
+from unittest import TestCase
+
+from catalogary.api import LatestValueIndex
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RESP_MEASURES = {
+    'request': {},
+    'indices': {},
+    'data': {
+        '238': {'2023-08-01 22:00:00': [5, 2, 12.5, '2023-08-01 23:00:00', 0],
+                '2023-08-01 23:00:00': [5, 2, 13.0, '2023-08-01 24:00:00', 0],
+                '2023-08-02 00:00:00': [5, 2, None, '2023-08-02 01:00:00', 0]},
+        '239': {'2023-08-01 22:00:00': [5, 2, 7, '2023-08-01 23:00:00', 0]},
+    },
+}
+
+
+class TestLatestValueIndex(TestCase):
+    """
+    Tests for the index of the latest Umweltbundesamt values (no requests)
+    """
+
+    def setUp(self):
+        self.index = LatestValueIndex()
+        self.assertEqual(self.index.update(RESP_MEASURES), 2)
+
+    def test_lookup(self):
+        """The newest measured value wins, missing values are skipped"""
+        latest = self.index.get('238', 5)
+        self.assertEqual(latest.value, 13.0)
+        self.assertEqual(latest.key_ts, 1690930800)
+        # the value timestamps are UTC+01:00, '24:00:00' is the midnight of the next day
+        self.assertEqual(latest.value_ts, 1690930800)
+        self.assertEqual(self.index.value(239, '5', '2'), 7.0)
+        self.assertIsNone(self.index.get('238', 5, scope=1))
+        self.assertEqual(self.index.value('240', 5, default=-1), -1)
+        self.assertIn(('238', 5), self.index)
+        self.assertEqual(list(self.index.station('238')), [5])
+        self.assertEqual(len(self.index), 2)
+
+    def test_incremental(self):
+        """Newer responses update single entries, older ones and repeated ones change nothing"""
+        self.assertEqual(self.index.update(RESP_MEASURES), 0)
+        older = {'data': {'238': {'2023-08-01 20:00:00': [5, 2, 1.0, '2023-08-01 21:00:00', 0]}}}
+        self.assertEqual(self.index.update(older), 0)
+        newer = {'data': {'238': {'2023-08-02 00:00:00': [5, 2, 14.0, '2023-08-02 01:00:00', 0]},
+                          '239': {'2023-08-02 00:00:00': [1, 2, 20.0, '2023-08-02 01:00:00', 0]}}}
+        self.assertEqual(self.index.update(newer), 2)
+        self.assertEqual(self.index.value('238', 5), 14.0)
+        self.assertEqual(sorted(self.index.station('239')), [1, 5])
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_snapshot(self):
+        """The snapshot of a component is a cached MeasuresFrame, rebuilt after an update only"""
+        frame = self.index.snapshot(5)
+        self.assertEqual(frame.station.tolist(), ['238', '239'])
+        self.assertEqual(frame.value.tolist(), [13.0, 7.0])
+        # cached until the component changes
+        self.assertIs(self.index.snapshot(5), frame)
+        self.index.update({'data': {'240': {'2023-08-01 22:00:00': [5, 2, 3.0, '2023-08-01 23:00:00', 0]}}})
+        self.assertEqual(self.index.snapshot(5).station.tolist(), ['238', '239', '240'])
+        self.assertEqual(len(self.index.snapshot(1)), 0)
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_update_frame(self):
+        """A MeasuresFrame updates the index like the response it was normalized from"""
+        from catalogary.api import normalize_measures
+        index = LatestValueIndex()
+        self.assertEqual(index.update_frame(normalize_measures(RESP_MEASURES)), 2)
+        self.assertEqual(index.get('238', 5), self.index.get('238', 5))
+        self.assertEqual(index.get('239', 5), self.index.get('239', 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
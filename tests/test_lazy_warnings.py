@@ -0,0 +1,127 @@
+####
+# Copyright 2023 burrizza
+######
+import gc
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+from catalogary import NinaAPI
+from catalogary.api import NinaWarning, WarningDetail
+
+FEED = [{'id': f'dwd.{i}', 'version': 1, 'severity': 'Minor', 'type': 'Alert'} for i in range(20)]
+
+
+class CountingNina(NinaAPI):
+    """NinaAPI answering the detail and geojson requests locally and counting them"""
+
+    def __init__(self, delay=0.0):
+        super(CountingNina, self).__init__(url='http://localhost/')
+        self.delay = delay
+        self.requests = list()
+        self.failing = set()
+        self._requests_lock = threading.Lock()
+
+    def _answer(self, key, suffix):
+        with self._requests_lock:
+            self.requests.append((key, suffix))
+        time.sleep(self.delay)
+        if key in self.failing:
+            raise ConnectionError(key)
+
+    def warning_detail(self, key, expand=None):
+        self._answer(key, 'json')
+        return {'identifier': key, 'sender': 'DWD', 'info': [{'headline': 'Sturm'}]}
+
+    def warning_geo(self, key, expand=None):
+        self._answer(key, 'geojson')
+        return {'type': 'FeatureCollection', 'features': []}
+
+    def _warning_projected(self, key, suffix, fields):
+        if fields is None:
+            return {}
+        resp = self.warning_detail(key) if suffix == 'json' else self.warning_geo(key)
+        return {field: resp[field] for field in resp.keys() if field in fields}
+
+
+class TestLazyWarnings(TestCase):
+    """
+    Tests for the lazy completion of warnings (no requests, the client answers locally)
+    """
+
+    def setUp(self):
+        self.nina = CountingNina()
+
+    def test_on_access(self):
+        """Nothing is requested up front, every part once on first access"""
+        lazy = self.nina.lazy_complete(FEED)
+        self.assertEqual(len(lazy), 20)
+        self.assertEqual(self.nina.requests, [])
+        self.assertEqual(lazy[3].detail['identifier'], 'dwd.3')
+        self.assertEqual(lazy[3]['warning_detail']['identifier'], 'dwd.3')
+        self.assertEqual(self.nina.requests, [('dwd.3', 'json')])
+        self.assertTrue(lazy[3].loaded('detail'))
+        self.assertFalse(lazy[3].loaded('geo'))
+        self.assertEqual(lazy[3]['warning'], FEED[3])
+
+    def test_complete(self):
+        """Completed lazy warnings equal the ones of generic_complete"""
+        self.assertEqual([warning.complete() for warning in self.nina.lazy_complete(FEED[:2])],
+                         self.nina.generic_complete(FEED[:2]))
+        records = [warning.complete() for warning in self.nina.lazy_complete(FEED[:2], records=True)]
+        self.assertIsInstance(records[0], NinaWarning)
+        self.assertIsInstance(records[0].detail, WarningDetail)
+        self.assertEqual(records, self.nina.generic_complete(FEED[:2], records=True))
+
+    def test_selection(self):
+        """Parts without selected fields are never requested"""
+        lazy = self.nina.lazy_complete(FEED[:1], selection=['id', 'type'])
+        self.assertEqual(lazy[0].complete(), {'warning': {'id': 'dwd.0', 'type': 'Alert'}, 'warning_detail': {},
+                                              'warning_geo': {'type': 'FeatureCollection'}})
+        self.assertEqual(self.nina.requests, [('dwd.0', 'geojson')])
+
+    def test_prefetch(self):
+        """Prefetched parts are requested once in the background"""
+        self.nina.delay = 0.05
+        with self.nina.lazy_complete(FEED, max_workers=20) as lazy:
+            self.assertEqual(lazy.prefetch(0, 10, parts=['detail']), 10)
+            start = time.monotonic()
+            details = [warning.detail for warning in lazy[:10]]
+            self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual([detail['identifier'] for detail in details], [f'dwd.{i}' for i in range(10)])
+        self.assertEqual(sorted(self.nina.requests), sorted((f'dwd.{i}', 'json') for i in range(10)))
+
+    def test_lookahead(self):
+        """Iterating prefetches the following items up to the lookahead"""
+        self.nina.delay = 0.02
+        with self.nina.lazy_complete(FEED, lookahead=4) as lazy:
+            for position, warning in enumerate(lazy):
+                if position == 1:
+                    break
+            time.sleep(0.1)
+        # the two iterated warnings and the lookahead, both parts each
+        self.assertEqual(len(self.nina.requests), 12)
+
+    def test_dropped(self):
+        """The prefetch threads stop when the list is dropped without close"""
+        lazy = self.nina.lazy_complete(FEED[:2])
+        lazy.prefetch()
+        executor = lazy._executor
+        del lazy
+        gc.collect()
+        self.assertTrue(executor._shutdown)
+
+    def test_failure(self):
+        """Failed requests are not memoized"""
+        self.nina.failing.add('dwd.0')
+        lazy = self.nina.lazy_complete(FEED[:1])
+        with self.assertRaises(ConnectionError):
+            lazy[0].detail
+        self.nina.failing.clear()
+        self.assertEqual(lazy[0].detail['identifier'], 'dwd.0')
+        self.assertEqual(len(self.nina.requests), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
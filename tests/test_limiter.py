@@ -0,0 +1,118 @@
+####
+# Copyright 2023 burrizza
+######
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+from catalogary import NinaAPI
+from catalogary.api import AdaptiveLimiter
+from tests.helpers import StubTransport
+
+CONTENT = b'{"identifier": "dwd.1", "type": "FeatureCollection"}'
+
+
+class TestAdaptiveLimiter(TestCase):
+    """
+    Tests for the adaptive concurrency limit (no requests)
+    """
+
+    def _round(self, limiter, latency=0.01, **kwargs):
+        """Run a saturated round of limit requests with the given latency."""
+        starts = [limiter.acquire() for _ in range(limiter.limit)]
+        for start in starts:
+            limiter.release(start - latency, **kwargs)
+
+    def test_additive_increase(self):
+        """The limit grows by one per limit saturated responses up to the maximum"""
+        limiter = AdaptiveLimiter(initial=4, max_limit=6)
+        self._round(limiter)
+        self._round(limiter)
+        self.assertEqual(limiter.limit, 5)
+        for _ in range(10):
+            self._round(limiter)
+        self.assertEqual(limiter.limit, 6)
+
+    def test_no_increase_when_idle(self):
+        """The limit does not grow while it is not used"""
+        limiter = AdaptiveLimiter(initial=4)
+        for _ in range(20):
+            limiter.release(limiter.acquire() - 0.01)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_multiplicative_decrease(self):
+        """Overload halves the limit once per burst"""
+        limiter = AdaptiveLimiter(initial=16)
+        self._round(limiter)
+        # a burst of failures of requests started before the cut only cuts once
+        starts = [limiter.acquire() for _ in range(8)]
+        for start in starts:
+            limiter.release(start, overload=True, ok=False)
+        self.assertEqual(limiter.limit, 8)
+        limiter.release(limiter.acquire(), overload=True, ok=False)
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.stats()['decreases'], 2)
+
+    def test_latency_spike(self):
+        """A response much slower than the baseline counts as overload"""
+        limiter = AdaptiveLimiter(initial=8)
+        self._round(limiter, latency=0.01)
+        limiter.release(limiter.acquire() - 0.1)
+        self.assertEqual(limiter.limit, 4)
+        # errors without overload do not change the limit
+        limiter.release(limiter.acquire(), ok=False)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_min_limit(self):
+        """The limit is never cut below the minimum"""
+        limiter = AdaptiveLimiter(initial=2, min_limit=2)
+        limiter.release(limiter.acquire(), overload=True, ok=False)
+        self.assertEqual(limiter.limit, 2)
+        with self.assertRaises(ValueError):
+            AdaptiveLimiter(initial=1, min_limit=2)
+
+    def test_blocks_above_limit(self):
+        """Requests above the limit wait for a free slot"""
+        limiter = AdaptiveLimiter(initial=1)
+        start = limiter.acquire()
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+        thread.start()
+        time.sleep(0.05)
+        self.assertFalse(acquired.is_set())
+        self.assertEqual(limiter.stats()['in_flight'], 1)
+        limiter.release(start)
+        thread.join(1)
+        self.assertTrue(acquired.is_set())
+
+    def test_bulk_workers(self):
+        """Bulk requests of a client with a limiter run concurrently, gated by the limiter instead of a fixed pool"""
+        limiter = AdaptiveLimiter(initial=2, max_limit=12, latency_tolerance=100)
+        nina = NinaAPI(url='http://localhost/', transport=StubTransport(content=CONTENT, delay=0.02), limiter=limiter)
+        self.assertEqual(nina._bulk_workers(None, 8), 12)
+        self.assertEqual(nina._bulk_workers(3, 8), 3)
+        resp_details, errors = nina.warning_details([f'dwd.{i}' for i in range(60)])
+        self.assertEqual((len(resp_details), errors), (60, {}))
+        # the limit grew beyond the former fixed pool of 8 threads and was never exceeded
+        self.assertGreater(limiter.limit, 8)
+        self.assertGreater(nina.transport.peak, 8)
+        self.assertLessEqual(nina.transport.peak, limiter.limit)
+        self.assertEqual(NinaAPI(url='http://localhost/')._bulk_workers(None, 8), 8)
+
+    def test_complete_concurrent(self):
+        """generic_complete of a client with a limiter sends its requests concurrently by default"""
+        limiter = AdaptiveLimiter(initial=4, max_limit=4, latency_tolerance=100)
+        nina = NinaAPI(url='http://localhost/', transport=StubTransport(content=CONTENT, delay=0.02), limiter=limiter)
+        resp_warnings = [{'id': f'dwd.{i}'} for i in range(12)]
+        completed = nina.generic_complete(resp_warnings)
+        self.assertEqual([entry['warning'] for entry in completed], resp_warnings)
+        self.assertGreater(nina.transport.peak, 1)
+        self.assertLessEqual(nina.transport.peak, 4)
+        nina = NinaAPI(url='http://localhost/', transport=StubTransport(content=CONTENT, delay=0.02), limiter=limiter)
+        nina.generic_complete(resp_warnings, fetch_workers=0)
+        self.assertEqual(nina.transport.peak, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
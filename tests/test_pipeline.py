@@ -0,0 +1,185 @@
+####
+# Copyright 2023 burrizza
+######
+import contextvars
+import random
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+from catalogary import NinaAPI, UmweltbundesamtAPI
+from catalogary.api import Pipeline
+from tests.helpers import StubTransport
+
+marker = contextvars.ContextVar('marker', default=None)
+
+FEED = [{'id': f'dwd.{i}', 'version': 1, 'severity': 'Minor', 'type': 'Alert'} for i in range(12)]
+COMPONENTS = {'count': 2, '1': ['1', 'PM10', 'PM10', 'µg/m³', 'Feinstaub'], '2': ['5', 'NO2', 'NO2', 'µg/m³',
+                                                                                   'Stickstoffdioxid']}
+STATIONS = {station_id: [station_id, f'DE{station_id}', 'Station', 'Stadt', '', '2000-01-01', None, '7.0', '51.0']
+            for station_id in ('238', '239')}
+
+
+def answer_nina(path, query):
+    """Returns: The detail or geojson of a warning"""
+    key, suffix = path.rsplit('/', 1)[-1].rsplit('.', 1)
+    if suffix == 'json':
+        return {'identifier': key, 'sender': 'DWD', 'info': [{'headline': f'Sturm {key}'}]}
+    return {'type': 'FeatureCollection', 'features': [{'id': key}]}
+
+
+def answer_uba(path, query):
+    """Returns: The stations (meta) or the hourly measures of a component and scope of the day before and after"""
+    if path.endswith('meta/json'):
+        return {'stations': STATIONS}
+    component, scope = int(query['component'][0]), int(query['scope'][0])
+    hours = [f'2023-08-0{day} {hour:02}:00:00' for day in (4, 5) for hour in range(24)]
+    return {'data': {station_id: {ts: [component, scope, component * 10 + scope + position / 10 + int(station_id),
+                                       ts, 0] for position, ts in enumerate(hours)}
+                     for station_id in STATIONS}}
+
+
+class TestPipeline(TestCase):
+    """
+    Tests for the staged pipeline with bounded queues (no requests)
+    """
+
+    def test_order(self):
+        """Results keep the order of the items although the fetch threads finish out of order"""
+        def fetch(item):
+            time.sleep(random.random() / 100)
+            return item * 2
+
+        pipeline = Pipeline(queue_size=2).add_stage(fetch, workers=8).add_stage(str, name='decode')
+        self.assertEqual(list(pipeline.run(range(50))), [(item, str(item * 2)) for item in range(50)])
+        self.assertEqual(pipeline.stats()['fetch']['items'], 50)
+        self.assertEqual(pipeline.stats()['decode']['workers'], 1)
+        unordered = Pipeline().add_stage(fetch, workers=8).run(range(50), ordered=False)
+        self.assertEqual(sorted(result for _, result in unordered), [item * 2 for item in range(50)])
+
+    def test_overlap(self):
+        """Stages run concurrently, a stage works on the next item while the following stage is busy"""
+        fetched_next = threading.Event()
+        decoded_next = threading.Event()
+        overlapped = list()
+
+        def fetch(item):
+            if item == 1:
+                fetched_next.set()
+            return item
+
+        def decode(item):
+            if item == 0:
+                # blocks the decode stage until the fetch stage went on with the next item
+                overlapped.append(fetched_next.wait(5))
+            elif item == 1:
+                decoded_next.set()
+            return item
+
+        pipeline = Pipeline().add_stage(fetch, name='fetch').add_stage(decode, name='decode')
+        for item, _ in pipeline.run(range(3)):
+            if item == 0:
+                # the consumer holds the first result while the decode stage goes on
+                overlapped.append(decoded_next.wait(5))
+        self.assertEqual(overlapped, [True, True])
+
+    def test_backpressure(self):
+        """A slow consumer blocks the stages, the items in flight are bounded"""
+        fed = list()
+
+        def items():
+            for item in range(1000):
+                fed.append(item)
+                yield item
+
+        pipeline = Pipeline(queue_size=2).add_stage(lambda item: item, workers=2)
+        results = pipeline.run(items())
+        next(results)
+        time.sleep(0.2)
+        self.assertLessEqual(len(fed), pipeline.max_in_flight + 2)
+        results.close()
+
+    def test_errors(self):
+        """A failing item stops the pipeline with its exception or is yielded as its result"""
+        def fetch(item):
+            if item == 3:
+                raise ValueError(item)
+            return item
+
+        with self.assertRaises(ValueError):
+            list(Pipeline().add_stage(fetch, workers=4).run(range(10)))
+        results = dict(Pipeline().add_stage(fetch, workers=4).add_stage(lambda item: -item)
+                       .run(range(10), return_exceptions=True))
+        self.assertIsInstance(results.pop(3), ValueError)
+        self.assertEqual(results, {item: -item for item in range(10) if item != 3})
+
+    def test_stop(self):
+        """Closing the results early stops all threads"""
+        threads = threading.active_count()
+        results = Pipeline().add_stage(lambda item: item, workers=4).run(iter(int, 1))
+        next(results)
+        results.close()
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_context(self):
+        """The stage threads inherit the context of the caller"""
+        token = marker.set('bulk')
+        try:
+            results = list(Pipeline().add_stage(lambda item: marker.get(), workers=2).run(range(3)))
+        finally:
+            marker.reset(token)
+        self.assertEqual(results, [(0, 'bulk'), (1, 'bulk'), (2, 'bulk')])
+
+
+class TestBulkPipelines(TestCase):
+    """
+    Tests for the pipelines of the bulk calls (no requests, the transport answers locally)
+    """
+
+    def test_generic_complete(self):
+        """Warnings completed by the pipeline equal the ones completed one after another"""
+        for kwargs in ({}, {'records': True}, {'selection': ['id', 'type']}):
+            for client_kwargs in ({}, {'coalesce': True}):
+                nina = NinaAPI(url='http://localhost/', transport=StubTransport(answer=answer_nina), **client_kwargs)
+                self.assertEqual(nina.generic_complete(FEED, fetch_workers=4, **kwargs),
+                                 nina.generic_complete(FEED, fetch_workers=0, **kwargs))
+
+    def test_measures_stations(self):
+        """Measures merged from the pipeline equal the ones requested one after another"""
+        decoded = list()
+
+        class Umweltbundesamt(UmweltbundesamtAPI):
+            def _decode_measures(self, raw):
+                decoded.append(raw)
+                return super(Umweltbundesamt, self)._decode_measures(raw)
+
+        for options in ({}, {'records': True}, {'derive_scopes': True}):
+            for client_kwargs in ({}, {'coalesce': True}):
+                del decoded[:]
+                umbamt = Umweltbundesamt(url='http://localhost/', transport=StubTransport(answer=answer_uba),
+                                         **client_kwargs)
+                kwargs = dict(options, respComponents=COMPONENTS, date_from='2023-08-05', time_from='1',
+                              date_to='2023-08-05', sleeptime=None)
+                resp = umbamt.measures_stations(fetch_workers=4, **kwargs)
+                self.assertEqual(resp, umbamt.measures_stations(fetch_workers=0, **kwargs))
+                # the derivation drops the day before date_from again
+                self.assertEqual(len(resp), 48 if options.get('derive_scopes') else 96)
+                # a coalescing client shares the decoded responses, the raw ones are not requested
+                self.assertEqual(bool(decoded), not client_kwargs and not options.get('derive_scopes'))
+
+    def test_measures_throttled(self):
+        """The fetch threads share the sleeptime, the requests start at least sleeptime apart"""
+        transport = StubTransport(answer=answer_uba)
+        umbamt = UmweltbundesamtAPI(url='http://localhost/', transport=transport)
+        umbamt.measures_stations(respComponents=COMPONENTS, date_from='2023-08-05', date_to='2023-08-05',
+                                 dict_scopes={'1': '1TMW', '2': '1SMW', '3': '1SMW_MAX'}, sleeptime=0.05,
+                                 fetch_workers=4)
+        # the first request asks for the stations
+        started = sorted(transport.started[1:])
+        self.assertEqual(len(started), 6)
+        self.assertTrue(all(later - earlier >= 0.045 for earlier, later in zip(started, started[1:])))
+
+
+if __name__ == '__main__':
+    unittest.main()
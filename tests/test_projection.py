@@ -0,0 +1,37 @@
+####
+# Copyright 2023 burrizza
+######
+import unittest
+from unittest import TestCase
+
+from catalogary import NinaAPI
+
+
+class TestProjection(TestCase):
+    """
+    Tests for the selection planning and projection of generic_complete (no requests)
+    """
+
+    def test_plan_selection(self):
+        """The selection is split into the fields of the detail and the geojson, parts without fields are skipped"""
+        nina = NinaAPI(url='http://localhost/')
+        self.assertEqual(nina._plan_selection(['id', 'sender']), ({'sender'}, None))
+        self.assertEqual(nina._plan_selection(['id', 'type']), (None, {'type'}))
+        self.assertEqual(nina._plan_selection(['id']), (None, None))
+        # no request is sent for parts without selected fields
+        self.assertEqual(nina._warning_projected('dwd.1', 'geojson', None), {})
+
+    def test_projected_fields(self):
+        """Only the selected top-level fields of the decoded response are kept, other responses are returned as is"""
+        nina = NinaAPI(url='http://localhost/')
+        responses = {'dwd.1': {'sender': 'dwd', 'info': [], 'status': 'Actual'}, 'dwd.2': 'Service Unavailable',
+                     'dwd.3': None}
+        nina.get = lambda url, *args, **kwargs: responses[url.rsplit('/', 1)[1].split('.json')[0]]
+        self.assertEqual(nina._warning_projected('dwd.1', 'json', {'sender', 'status'}),
+                         {'sender': 'dwd', 'status': 'Actual'})
+        self.assertEqual(nina._warning_projected('dwd.2', 'json', {'sender'}), 'Service Unavailable')
+        self.assertEqual(nina._warning_projected('dwd.3', 'json', {'sender'}), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
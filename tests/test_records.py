@@ -0,0 +1,60 @@
+####
+# Copyright 2023 burrizza
+######
+import unittest
+from unittest import TestCase
+
+from catalogary.api import NinaWarning, StationMeasurement, WarningDetail
+from catalogary.api.records import parse_timestamp
+
+
+class TestRecords(TestCase):
+    """
+    Tests for the compact record types
+    """
+
+    def test_parse_timestamp(self):
+        """Parse the timestamps of NINA and Umweltbundesamt to unix timestamps"""
+        self.assertEqual(parse_timestamp('2023-08-01T10:00:00+02:00'), 1690876800.0)
+        self.assertEqual(parse_timestamp('2023-08-01 08:00:00'), 1690876800.0)
+        self.assertEqual(parse_timestamp('2023-07-31 24:00:00'), parse_timestamp('2023-08-01 00:00:00'))
+        self.assertIsNone(parse_timestamp(None))
+
+    def test_warning_with_detail(self):
+        """Parse a warning and its detail including the areas"""
+        detail = WarningDetail.from_dict({'identifier': 'dwd.1', 'sender': 'DWD', 'sent': '2023-08-01T10:00:00+02:00',
+                                          'status': 'Actual', 'msgType': 'Alert', 'scope': 'Public', 'code': [],
+                                          'info': [{'language': 'de', 'event': 'FROST',
+                                                    'area': [{'areaDesc': 'Kreis Passau',
+                                                              'geocode': [{'valueName': 'SHN',
+                                                                           'value': '092750000000'}]}]}]})
+        warning = NinaWarning.from_dict({'id': 'dwd.1', 'version': 2, 'startDate': '2023-08-01T10:00:00+02:00',
+                                         'severity': 'Minor', 'type': 'Alert', 'i18nTitle': {'de': 'Frost'}},
+                                        detail=detail)
+        self.assertEqual(warning.start, 1690876800.0)
+        self.assertIsNone(warning.expires)
+        self.assertEqual(warning.detail.msg_type, 'Alert')
+        self.assertEqual(warning.detail.info[0].areas[0].description, 'Kreis Passau')
+        self.assertEqual(warning.detail.geocodes, {'092750000000'})
+        self.assertFalse(hasattr(warning, '__dict__'))
+
+    def test_equality(self):
+        """Records compare by their fields and are unhashable, the builtin Warning is not shadowed"""
+        import catalogary.api
+        self.assertEqual(NinaWarning('dwd.1', version=1), NinaWarning('dwd.1', version=1))
+        self.assertNotEqual(NinaWarning('dwd.1', version=1), NinaWarning('dwd.1', version=2))
+        with self.assertRaises(TypeError):
+            hash(NinaWarning('dwd.1'))
+        self.assertNotIn('Warning', catalogary.api.__all__)
+
+    def test_station_measurement(self):
+        """Parse a measurement of a station from the meta station list"""
+        l_station = ['238', 'DEBB021', 'Name', 'City', '', '1990-01-01', None, '13.1', '52.1']
+        measurement = StationMeasurement.from_station('2023-08-01 08:00:00', '238', l_station, {'NO2': {'1SMW': 3}})
+        self.assertEqual(measurement.timestamp, 1690876800.0)
+        self.assertEqual((measurement.lat, measurement.lon), (52.1, 13.1))
+        self.assertEqual(measurement.to_dict()['measures'], {'NO2': {'1SMW': 3}})
+
+
+if __name__ == '__main__':
+    unittest.main()
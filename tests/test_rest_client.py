@@ -0,0 +1,68 @@
+####
+# Copyright 2023 burrizza
+######
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+from catalogary.api.rest_client import FedRepRestAPI
+from tests.helpers import StubTransport
+
+
+class TestCoalescing(TestCase):
+    """
+    Tests for the coalescing of identical in-flight GETs (no requests, the transport answers locally)
+    """
+
+    def run_concurrent(self, client, count=8):
+        """Start count identical GETs, release the upstream request once all are waiting and return the outcomes"""
+        results = [None] * count
+
+        def get(position):
+            try:
+                results[position] = client.get('warnings/dwd.1.json')
+            except Exception as e:
+                results[position] = e
+
+        threads = [threading.Thread(target=get, args=(position,)) for position in range(count)]
+        threads[0].start()
+        self.assertTrue(client.transport.entered.wait(5))
+        for thread in threads[1:]:
+            thread.start()
+        # the followers find the running request and wait for it
+        time.sleep(0.1)
+        client.transport.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_one_upstream_call(self):
+        """Concurrent identical GETs share one request and its result"""
+        client = FedRepRestAPI('http://localhost/', transport=StubTransport(blocking=True), coalesce=True)
+        results = self.run_concurrent(client)
+        self.assertEqual(client.transport.calls, 1)
+        self.assertEqual(results, [{'id': 'dwd.1'}] * 8)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(client._inflight, {})
+
+    def test_error_reaches_all(self):
+        """The error of the shared request is raised in every waiting caller"""
+        from requests import HTTPError
+        client = FedRepRestAPI('http://localhost/', transport=StubTransport(status=503, content=b'', blocking=True),
+                                coalesce=True)
+        results = self.run_concurrent(client)
+        self.assertEqual(client.transport.calls, 1)
+        self.assertTrue(all(isinstance(result, HTTPError) for result in results))
+
+    def test_disabled(self):
+        """Without coalescing every GET is sent"""
+        transport = StubTransport()
+        client = FedRepRestAPI('http://localhost/', transport=transport)
+        client.get('warnings/dwd.1.json')
+        client.get('warnings/dwd.1.json')
+        self.assertEqual(transport.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+####
+# Copyright 2023 burrizza
+######
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+from catalogary.api.scheduler import PriorityScheduler
+
+
+class TestPriorityScheduler(TestCase):
+    """
+    Tests for the priority request scheduler
+    """
+
+    def run_queued(self, scheduler, priorities):
+        """Queue one request per priority behind a running one and return the order they ran in"""
+        order = list()
+
+        def request(priority, name):
+            with scheduler.slot(priority):
+                order.append(name)
+
+        scheduler.acquire('interactive')
+        threads = list()
+        for i, priority in enumerate(priorities):
+            thread = threading.Thread(target=request, args=(priority, f'{priority}{i}'))
+            thread.start()
+            threads.append(thread)
+            while sum(stats['queued'] for stats in scheduler.stats().values()) <= i:
+                time.sleep(0.001)
+        scheduler.release('interactive')
+        for thread in threads:
+            thread.join()
+        return order
+
+    def test_priority_order(self):
+        """The most urgent class goes first, first come first served within a class"""
+        scheduler = PriorityScheduler(max_concurrency=1)
+        order = self.run_queued(scheduler, ['bulk', 'bulk', 'interactive', 'critical', 'interactive'])
+        self.assertEqual(order, ['critical3', 'interactive2', 'interactive4', 'bulk0', 'bulk1'])
+
+    def test_aging(self):
+        """A waiting class goes first once more urgent classes were served aging times"""
+        scheduler = PriorityScheduler(max_concurrency=1, aging=2)
+        order = self.run_queued(scheduler, ['bulk'] + ['interactive'] * 5)
+        self.assertEqual(order, ['interactive1', 'interactive2', 'bulk0', 'interactive3', 'interactive4',
+                                 'interactive5'])
+        scheduler = PriorityScheduler(max_concurrency=1, aging=None)
+        order = self.run_queued(scheduler, ['bulk'] + ['interactive'] * 5)
+        self.assertEqual(order[-1], 'bulk0')
+
+    def test_free_slots(self):
+        """Every free slot is taken by a queued request, also if several are freed at once"""
+        for _ in range(20):
+            scheduler = PriorityScheduler(max_concurrency=2)
+            scheduler.acquire('interactive')
+            scheduler.acquire('interactive')
+            acquired = list()
+            threads = [threading.Thread(target=lambda: acquired.append(scheduler.acquire('interactive', timeout=2)))
+                       for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            while scheduler.stats()['interactive']['queued'] < 2:
+                time.sleep(0.001)
+            # both slots are freed before any waiter wakes up
+            with scheduler._cond:
+                scheduler.release('interactive')
+                scheduler.release('interactive')
+            start = time.monotonic()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(acquired, [True, True])
+            # a waiter left parked on a free slot would only run after its timeout
+            self.assertLess(time.monotonic() - start, 1)
+
+    def test_class_limit(self):
+        """A class never uses more slots than its own limit"""
+        scheduler = PriorityScheduler(max_concurrency=4, limits={'bulk': 2})
+        running = list()
+        lock = threading.Lock()
+
+        def request():
+            with scheduler.slot('bulk'):
+                with lock:
+                    running.append(scheduler.stats()['bulk']['running'])
+                time.sleep(0.01)
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(max(running), 2)
+        with self.assertRaises(ValueError):
+            scheduler.acquire('urgent')
+
+
+if __name__ == '__main__':
+    unittest.main()
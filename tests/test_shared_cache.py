@@ -0,0 +1,99 @@
+####
+# Copyright 2023 burrizza
+######
+import os
+import tempfile
+import time
+import unittest
+from unittest import TestCase
+
+from catalogary.api import SharedCache
+
+
+class TestSharedCache(TestCase):
+    """
+    Tests for the response cache shared between processes
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'cache.db')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_ttl(self):
+        """Entries expire after their TTL"""
+        cache = SharedCache(self.path, ttl=60)
+        cache.set('warnings', [{'id': 'dwd.1'}])
+        cache.set('expired', {'id': 'dwd.2'}, ttl=-1)
+        self.assertEqual(SharedCache(self.path).get('warnings'), [{'id': 'dwd.1'}])
+        self.assertIsNone(cache.get('expired'))
+
+    def test_eviction(self):
+        """The least recently used entries are evicted if the size limit is exceeded"""
+        cache = SharedCache(self.path, max_bytes=150)
+        values = [os.urandom(30).hex() for _ in range(3)]  # hardly compressible, about 70 bytes each
+        for key, value in zip(['old', 'new', 'newest'], values):
+            cache.set(key, value)
+            time.sleep(0.01)
+        self.assertIsNone(cache.get('old'))
+        self.assertEqual(cache.get('newest'), values[2])
+
+    def test_touch_interval(self):
+        """A hit records its access time only if the recorded one is older than the touch interval"""
+        cache = SharedCache(self.path, touch_interval=60)
+        cache.set('warnings', [{'id': 'dwd.1'}])
+        accessed = lambda: cache._connection().execute('SELECT accessed FROM entries').fetchone()[0]
+        written = accessed()
+        cache.get('warnings')
+        self.assertEqual(accessed(), written)
+        cache.touch_interval = 0
+        time.sleep(0.01)
+        cache.get('warnings')
+        self.assertGreater(accessed(), written)
+
+    def test_lock(self):
+        """Only one client refreshes a key at a time"""
+        cache, other = SharedCache(self.path), SharedCache(self.path)
+        self.assertTrue(cache.acquire('warnings'))
+        self.assertFalse(other.acquire('warnings'))
+        cache.release('warnings')
+        self.assertTrue(other.acquire('warnings'))
+        other.release('warnings')
+        calls = list()
+        fetch = lambda: calls.append(1) or {'id': 'dwd.1'}
+        self.assertEqual(cache.get_or_fetch('detail', fetch), {'id': 'dwd.1'})
+        self.assertEqual(other.get_or_fetch('detail', fetch), {'id': 'dwd.1'})
+        self.assertEqual(len(calls), 1)
+
+    def test_size(self):
+        """The running total of the sizes follows writes, replacements, evictions and deletes"""
+        cache = SharedCache(self.path, max_bytes=150)
+        total = lambda: cache._connection().execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        for key in ['old', 'new', 'old', 'newest']:
+            cache.set(key, os.urandom(30).hex())
+            self.assertEqual(cache.size(), total())
+        self.assertLessEqual(cache.size(), 150)
+        cache.delete('newest')
+        self.assertEqual(cache.size(), total())
+        cache.clear()
+        self.assertEqual(cache.size(), 0)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires fork')
+    def test_lock_after_fork(self):
+        """A forked process does not release the lock of its parent"""
+        cache = SharedCache(self.path)
+        self.assertTrue(cache.acquire('warnings'))
+        pid = os.fork()
+        if pid == 0:
+            cache.release('warnings')
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertFalse(SharedCache(self.path).acquire('warnings'))
+        cache.release('warnings')
+        self.assertTrue(SharedCache(self.path).acquire('warnings'))
+
+
+if __name__ == '__main__':
+    unittest.main()
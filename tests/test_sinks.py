@@ -0,0 +1,52 @@
+####
+# Copyright 2023 burrizza
+######
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from catalogary.api import CsvSink, NdjsonSink, StationMeasurement
+
+
+class TestSinks(TestCase):
+    """
+    Tests for the streaming writer sinks
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.records = [{'timestamp': f'2023-08-01 {hour:02d}:00:00', 'station_id': '238',
+                         'measures': {'NO2': {'1SMW': hour}}} for hour in range(1, 25)]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_ndjson_gzip(self):
+        """Write the records in batches to a gzip compressed NDJSON file"""
+        path = os.path.join(self.tmp_dir.name, 'measures.ndjson.gz')
+        with NdjsonSink(path, batch_size=5) as sink:
+            sink.write_many(self.records)
+            sink.write(StationMeasurement(1690876800.0, '238', measures={}))
+            self.assertEqual(sink.count, 25)
+        with gzip.open(path, 'rt', encoding='utf-8') as f_ndjson:
+            lines = [json.loads(line) for line in f_ndjson]
+        self.assertEqual(lines[:24], self.records)
+        self.assertEqual(lines[24]['timestamp'], 1690876800.0)
+
+    def test_csv(self):
+        """Write the records with a fixed column layout to a CSV file"""
+        path = os.path.join(self.tmp_dir.name, 'measures.csv')
+        with CsvSink(path, columns=['station_id', 'timestamp', 'station_lat', 'measures'], batch_size=7) as sink:
+            sink.write_many(self.records)
+        with open(path, encoding='utf-8') as f_csv:
+            lines = f_csv.read().splitlines()
+        self.assertEqual(len(lines), 25)
+        self.assertEqual(lines[0], 'station_id,timestamp,station_lat,measures')
+        self.assertEqual(lines[1], '238,2023-08-01 01:00:00,,"{""NO2"": {""1SMW"": 1}}"')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+####
+# Copyright 2023 burrizza
+######
+import socket
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+import requests
+
+from catalogary.api.rest_client import FedRepRestAPI
+from catalogary.api.transport import Urllib3Response, Urllib3Transport
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Answers /data with JSON, redirects /moved to /data and /loop to itself, /slow waits before answering"""
+
+    def do_GET(self):
+        if self.path == '/moved':
+            self.send_response(302)
+            self.send_header('Location', '/data')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path == '/loop':
+            self.send_response(302)
+            self.send_header('Location', '/loop')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path == '/slow':
+            self.server.release.wait(5)
+        body = b'{"id": "dwd.1"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestUrllib3Response(TestCase):
+    """
+    Tests for the requests.Response shim of the urllib3 transport
+    """
+
+    def test_content(self):
+        """text, json() and ok are derived from the content and the status"""
+        resp = Urllib3Response(200, 'OK', {}, 'http://localhost/', '{"name": "Köln"}'.encode('utf-8'))
+        self.assertTrue(resp.ok)
+        self.assertEqual(resp.text, '{"name": "Köln"}')
+        self.assertEqual(resp.json(), {'name': 'Köln'})
+        resp.raise_for_status()
+
+    def test_raise_for_status(self):
+        """Error status codes raise the HTTPError of requests with the response attached"""
+        for status, kind in ((404, 'Client'), (503, 'Server')):
+            resp = Urllib3Response(status, 'Error', {}, 'http://localhost/x', b'')
+            self.assertFalse(resp.ok)
+            with self.assertRaises(requests.HTTPError) as context:
+                resp.raise_for_status()
+            self.assertIs(context.exception.response, resp)
+            self.assertIn(f'{status} {kind} Error', str(context.exception))
+
+
+class TestUrllib3Transport(TestCase):
+    """
+    Tests for the urllib3 transport against a local HTTP server
+    """
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.release = threading.Event()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.transport = Urllib3Transport()
+
+    def tearDown(self):
+        self.server.release.set()
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_redirect(self):
+        """Redirects are followed, the response has the url of the target"""
+        resp = self.transport.request('GET', f'{self.url}/moved', timeout=5)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {'id': 'dwd.1'})
+        self.assertTrue(resp.url.endswith('/data'))
+
+    def test_too_many_redirects(self):
+        """A redirect loop raises TooManyRedirects of requests"""
+        transport = Urllib3Transport(max_redirects=3)
+        try:
+            with self.assertRaises(requests.TooManyRedirects):
+                transport.request('GET', f'{self.url}/loop', timeout=5)
+        finally:
+            transport.close()
+
+    def test_read_timeout(self):
+        """A response exceeding the read timeout raises ReadTimeout of requests"""
+        with self.assertRaises(requests.ReadTimeout):
+            self.transport.request('GET', f'{self.url}/slow', timeout=(5, 0.2))
+
+    def test_connection_error(self):
+        """A refused connection raises ConnectionError of requests"""
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        with self.assertRaises(requests.ConnectionError):
+            self.transport.request('GET', f'http://127.0.0.1:{port}/data', timeout=5)
+
+    def test_session_options(self):
+        """Options set up on a requests session are rejected instead of being ignored"""
+        with self.assertRaises(ValueError):
+            FedRepRestAPI(self.url, transport='urllib3', cookies={'session': '1'})
+        with self.assertRaises(ValueError):
+            FedRepRestAPI(self.url, transport='urllib3', token='secret')
+        with self.assertRaises(ValueError):
+            self.transport.request('POST', f'{self.url}/data', files={'file': b'x'})
+        client = FedRepRestAPI(f'{self.url}/', transport='urllib3')
+        self.assertIsNone(client.session)
+        self.assertEqual(client.get('moved'), {'id': 'dwd.1'})
+
+
+if __name__ == '__main__':
+    unittest.main()
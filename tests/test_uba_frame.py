@@ -0,0 +1,115 @@
+####
+# Copyright 2023 burrizza
+######
+import unittest
+from unittest import TestCase
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RESP_MEASURES = {
+    'request': {},
+    'indices': {},
+    'data': {
+        '238': {'2023-08-01 00:00:00': [5, 2, 12.5, '2023-08-01 01:00:00', 0],
+                '2023-08-01 23:00:00': [5, 2, None, '2023-08-01 24:00:00', 0]},
+        '239': {'2023-08-01 00:00:00': [5, 2, 7, '2023-08-01 01:00:00', 0]},
+    },
+}
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestMeasuresFrame(TestCase):
+    """
+    Tests for the columnar, timestamp-normalized form of the Umweltbundesamt measures
+    """
+
+    def test_normalize_measures(self):
+        """Turn the timestamps of a response into UTC epoch seconds"""
+        from catalogary.api import TimestampParser, normalize_measures
+        parser = TimestampParser()
+        frame = normalize_measures(RESP_MEASURES, parser=parser)
+        self.assertEqual(frame.station.tolist(), ['238', '238', '239'])
+        self.assertEqual(frame.key_ts.tolist(), [1690848000, 1690930800, 1690848000])
+        # value timestamps are UTC+01:00, '24:00:00' is the midnight of the next day
+        self.assertEqual(frame.value_ts.tolist(), [1690848000, 1690930800, 1690848000])
+        self.assertTrue(np.isnan(frame.value[1]))
+        self.assertEqual(len(parser), 4)
+
+    def test_between(self):
+        """Filter the rows by a time range"""
+        from catalogary.api import MeasuresFrame, normalize_measures
+        frame = normalize_measures(RESP_MEASURES)
+        self.assertEqual(frame.between(1690848000, 1690848001).station.tolist(), ['238', '239'])
+        self.assertEqual(len(MeasuresFrame.concat([frame, frame]).between(ts_from=1690930800)), 2)
+
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestDeriveScopes(TestCase):
+    """
+    Tests for the local computation of the daily scopes from the hourly means
+    """
+
+    def setUp(self):
+        # two days of hourly means with the value = hour index, the last hour of the second day is missing
+        self.resp_hourly = {'data': {'238': {}}}
+        for hour in range(47):
+            key = f'2023-08-{1 + hour // 24:02d} {hour % 24:02d}:00:00'
+            self.resp_hourly['data']['238'][key] = [5, 2, float(hour), key, 0]
+
+    def test_daily_scopes(self):
+        """Compute the daily mean and the daily maximum"""
+        from catalogary.api import derive_scopes
+        resp = derive_scopes(self.resp_hourly, scopes=['1', '3'])
+        self.assertEqual(resp['1']['data']['238']['2023-08-01 00:00:00'][2], 11.5)
+        self.assertEqual(resp['1']['data']['238']['2023-08-02 00:00:00'][2], 35.0)
+        self.assertEqual(resp['3']['data']['238']['2023-08-02 00:00:00'][:3], [5, 3, 46.0])
+
+    def test_sliding_daily_mean(self):
+        """Compute the sliding daily mean only where enough hours exist"""
+        from catalogary.api import derive_scopes
+        resp = derive_scopes(self.resp_hourly, scopes=['6'], min_coverage=1)
+        self.assertNotIn('2023-08-01 22:00:00', resp['6']['data']['238'])
+        self.assertEqual(resp['6']['data']['238']['2023-08-01 23:00:00'][2], 11.5)
+        self.assertEqual(resp['6']['data']['238']['2023-08-02 05:00:00'][2], 17.5)
+        with self.assertRaises(ValueError):
+            derive_scopes(self.resp_hourly, scopes=['4'])
+
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestMeasuresCube(TestCase):
+    """
+    Tests for the dense station x time x component cube
+    """
+
+    def setUp(self):
+        from catalogary.api import MeasuresCube, normalize_measures
+        resp_no2 = RESP_MEASURES
+        resp_pm10 = {'data': {'239': {'2023-08-01 01:00:00': [1, 2, 20.0, '2023-08-01 02:00:00', 0]}}}
+        self.cube = MeasuresCube.from_frames({'NO2': normalize_measures(resp_no2),
+                                              'PM10': normalize_measures(resp_pm10)})
+
+    def test_from_frames(self):
+        """Arrange the measurements on dense axes"""
+        self.assertEqual(self.cube.shape, (2, 24, 2))
+        self.assertEqual(self.cube.stations.tolist(), ['238', '239'])
+        self.assertEqual(self.cube.timestamps[1] - self.cube.timestamps[0], 3600)
+        self.assertEqual(int(self.cube.mask.sum()), 3)
+        self.assertEqual(self.cube.values[1, 1, 1], 20.0)
+
+    def test_sel_and_aggregate(self):
+        """Slice the cube and aggregate along its axes"""
+        self.assertEqual(self.cube.aggregate('count', axis=('station', 'time')).tolist(), [2, 1])
+        self.assertEqual(self.cube.aggregate('mean', axis='time')[0].tolist()[0], 12.5)
+        self.assertTrue(np.isnan(self.cube.aggregate('max', axis='time')[0, 1]))
+        sub = self.cube.sel(stations=['239'], time_to=int(self.cube.timestamps[2]), components=['PM10'])
+        self.assertEqual(sub.shape, (1, 2, 1))
+        self.assertEqual(sub.aggregate('sum', axis=('station', 'time', 'component')), 20.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
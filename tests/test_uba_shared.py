@@ -0,0 +1,77 @@
+####
+# Copyright 2023 burrizza
+######
+import multiprocessing
+import unittest
+from unittest import TestCase
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RESP_MEASURES = {
+    'data': {
+        '238': {'2023-08-01 00:00:00': [5, 2, 12.5, '2023-08-01 01:00:00', 0],
+                '2023-08-01 01:00:00': [5, 2, 13.5, '2023-08-01 02:00:00', 0]},
+        '239': {'2023-08-01 00:00:00': [5, 2, 7, '2023-08-01 01:00:00', 0]},
+    },
+}
+
+
+def _worker_sum(descriptor):
+    from catalogary.api import SharedMeasures
+    with SharedMeasures.attach(descriptor) as cube:
+        return float(np.nansum(cube.values)), cube.values.flags.writeable
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestSharedMeasures(TestCase):
+    """
+    Tests for the publication of the Umweltbundesamt arrays to shared memory (no requests)
+    """
+
+    def setUp(self):
+        from catalogary.api import MeasuresCube, normalize_measures
+        self.frame = normalize_measures(RESP_MEASURES)
+        self.cube = MeasuresCube.from_frames({'NO2': self.frame})
+
+    def test_frame(self):
+        """An attached frame has the published columns on read-only views"""
+        from catalogary.api import SharedMeasures
+        published = SharedMeasures.publish(self.frame)
+        with SharedMeasures.attach(published.descriptor) as frame:
+            self.assertEqual(frame.station.tolist(), self.frame.station.tolist())
+            np.testing.assert_array_equal(frame.value, self.frame.value)
+            with self.assertRaises(ValueError):
+                frame.value[0] = 1.0
+            self.assertEqual(len(frame.between(ts_from=1690851600)), 1)
+            del frame
+        published.close()
+
+    def test_cube_processes(self):
+        """Workers attach to the published cube and read the arrays without copies"""
+        from catalogary.api import SharedMeasures
+        published = SharedMeasures.publish(self.cube)
+        try:
+            cube = published.data
+            self.assertEqual(cube.shape, self.cube.shape)
+            self.assertEqual(cube.components.tolist(), ['NO2'])
+            with multiprocessing.get_context('spawn').Pool(2) as pool:
+                results = pool.map(_worker_sum, [published.descriptor] * 2)
+            self.assertEqual(results, [(33.0, False)] * 2)
+            del cube
+        finally:
+            published.close()
+        with self.assertRaises(FileNotFoundError):
+            SharedMeasures.attach(published.descriptor)
+
+    def test_unsupported(self):
+        """Only MeasuresCube and MeasuresFrame can be published"""
+        from catalogary.api import SharedMeasures
+        with self.assertRaises(TypeError):
+            SharedMeasures.publish({'data': {}})
+
+
+if __name__ == '__main__':
+    unittest.main()